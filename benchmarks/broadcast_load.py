@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Load test for the WebSocket broadcast hub.
+
+Runs a hub-backed WebSocket server pinned to one core and opens many idle plus some
+active connections from separate client processes. Active clients receive a steady
+broadcast and record end-to-end latency. Prints one JSON report.
+
+Usage: python3 benchmarks/broadcast_load.py --idle 10000 --active 1000 --rate 20 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+import websockets
+
+from broadcast_hub import BroadcastHub
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def rss_bytes():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_server(port, args, ready, results):
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {0})
+    raise_fd_limit()
+
+    async def main():
+        hub = BroadcastHub(max_queue=args.max_queue)
+
+        async def handler(websocket, path=None):
+            topic = await websocket.recv()
+            hub.register(websocket, topics=(topic,))
+            try:
+                await websocket.wait_closed()
+            finally:
+                hub.unregister(websocket)
+
+        async with websockets.serve(handler, '127.0.0.1', port, backlog=4096):
+            ready.set()
+            # Wait for every client to connect before measuring
+            while len(hub.channels) < args.idle + args.active:
+                await asyncio.sleep(0.2)
+            rss_connected = rss_bytes()
+            cpu_start = time.process_time()
+            started = time.monotonic()
+            interval = 1.0 / args.rate
+            sent = 0
+            while time.monotonic() - started < args.duration:
+                hub.publish('active', {'type': 'tick', 'seq': sent, 'ts': time.time(), 'pad': 'x' * args.payload})
+                sent += 1
+                await asyncio.sleep(interval)
+            await asyncio.sleep(1)
+            elapsed = time.monotonic() - started
+            results.put({
+                'server_cpu_seconds': round(time.process_time() - cpu_start, 3),
+                'server_cpu_percent': round(100 * (time.process_time() - cpu_start) / elapsed, 1),
+                'server_rss_bytes': rss_bytes(),
+                'server_rss_per_connection': round(rss_connected / (args.idle + args.active)),
+                'broadcasts': sent,
+                'hub': hub.metrics(),
+            })
+
+    asyncio.run(main())
+
+
+def run_clients(port, idle, active, duration, results):
+    raise_fd_limit()
+
+    async def main():
+        uri = f'ws://127.0.0.1:{port}/'
+        latencies = []
+        received = 0
+
+        async def idle_client():
+            async with websockets.connect(uri, open_timeout=60) as ws:
+                await ws.send('idle')
+                await asyncio.sleep(duration + 30)
+
+        async def active_client():
+            nonlocal received
+            async with websockets.connect(uri, open_timeout=60) as ws:
+                await ws.send('active')
+                try:
+                    async for message in ws:
+                        latencies.append(time.time() - json.loads(message)['ts'])
+                        received += 1
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+
+        tasks = []
+        for i in range(idle + active):
+            tasks.append(asyncio.create_task(active_client() if i < active else idle_client()))
+            if i % 200 == 199:
+                await asyncio.sleep(0.05)
+        await asyncio.wait(tasks, timeout=duration + 20)
+        results.put({'latencies': latencies[::10], 'received': received})
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Broadcast hub load test')
+    parser.add_argument('--idle', type=int, default=10000)
+    parser.add_argument('--active', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=20, help='Broadcasts per second to active clients')
+    parser.add_argument('--payload', type=int, default=100, help='Padding bytes per message')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--client-procs', type=int, default=4)
+    parser.add_argument('--max-queue', type=int, default=64)
+    parser.add_argument('--port', type=int, default=18765)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    server_results = multiprocessing.Queue()
+    client_results = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(args.port, args, ready, server_results))
+    server.start()
+    ready.wait(30)
+
+    clients = []
+    for n in range(args.client_procs):
+        idle = args.idle // args.client_procs + (1 if n < args.idle % args.client_procs else 0)
+        active = args.active // args.client_procs + (1 if n < args.active % args.client_procs else 0)
+        proc = multiprocessing.Process(target=run_clients, args=(args.port, idle, active, args.duration, client_results))
+        proc.start()
+        clients.append(proc)
+
+    report = server_results.get()
+    latencies = []
+    received = 0
+    for _ in clients:
+        result = client_results.get()
+        latencies.extend(result['latencies'])
+        received += result['received']
+    for proc in clients + [server]:
+        proc.join(timeout=60)
+        if proc.is_alive():
+            proc.terminate()
+
+    expected = report['broadcasts'] * args.active
+    report.update({
+        'idle_connections': args.idle,
+        'active_connections': args.active,
+        'messages_expected': expected,
+        'messages_received': received,
+        'delivery_ratio': round(received / expected, 4) if expected else None,
+        'latency_ms_p50': round(1000 * percentile(latencies, 0.50), 2) if latencies else None,
+        'latency_ms_p99': round(1000 * percentile(latencies, 0.99), 2) if latencies else None,
+        'latency_ms_max': round(1000 * max(latencies), 2) if latencies else None,
+    })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Load test for crowd input aggregation (server/crowd_input.py).
+
+Drives a CrowdInput on a real event loop, with its window task running, at a target
+event rate spread over a population of clients. Events are generated in 1 ms batches
+from a pre-built random schedule, so generation cost stays out of the measurement.
+One run per (mode, client count) combination. Per-event cost should stay flat as the
+client count grows, since submit() is O(1). Prints one JSON report with:
+
+  achieved events/s, CPU microseconds per event, loop CPU utilisation,
+  window close lateness (p50/p99/max), and the admitted / rate-limited / injected counts.
+
+Usage: python3 benchmarks/crowd_load.py --rate 50000 --clients 1000 10000 100000 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from crowd_input import MODES, CrowdInput
+from session_recorder import INPUT_CODES
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(mode, clients, rate, duration, window_frames, client_rate, seed):
+    rng = random.Random(seed)
+    injected = []
+    crowd = CrowdInput(lambda key, pressed: injected.append((key, pressed)), mode=mode,
+                       window_frames=window_frames, rate=client_rate, burst=int(client_rate * 2))
+
+    lateness = []
+    close_window = crowd._close_window
+
+    def timed_close():
+        edge = crowd._epoch + (crowd.window + 1) * crowd.window_seconds
+        lateness.append(time.monotonic() - edge)
+        close_window()
+
+    crowd._close_window = timed_close
+
+    # A skewed key popularity (a few keys dominate), as in a real crowd
+    keys = INPUT_CODES[:12]
+    schedule = [(rng.randrange(clients), keys[min(len(keys) - 1, int(rng.expovariate(0.6)))])
+                for _ in range(1 << 16)]
+    mask = len(schedule) - 1
+
+    crowd.reset_clock()
+    crowd.start()
+    loop_start = time.monotonic()
+    cpu_start = time.process_time()
+    submit_cpu = 0.0
+    sent = 0
+    position = 0
+    while True:
+        now = time.monotonic()
+        elapsed = now - loop_start
+        if elapsed >= duration:
+            break
+        due = int(elapsed * rate) - sent
+        if due > 0:
+            submit = crowd.submit
+            started = time.process_time()
+            for _ in range(due):
+                client, key = schedule[position & mask]
+                submit(client, key, True, now)
+                position += 1
+            submit_cpu += time.process_time() - started
+            sent += due
+        await asyncio.sleep(0.001)
+
+    wall = time.monotonic() - loop_start
+    cpu = time.process_time() - cpu_start
+    crowd._task.cancel()
+    metrics = crowd.metrics()
+    return {
+        'mode': mode,
+        'clients': clients,
+        'target_events_per_second': rate,
+        'events_per_second': round(sent / wall, 1),
+        'submit_cpu_us_per_event': round(1e6 * submit_cpu / max(1, sent), 3),
+        'loop_cpu_utilisation': round(cpu / wall, 3),
+        'window_ms': metrics['window_ms'],
+        'windows': metrics['windows'],
+        'window_lateness_ms_p50': round(1000 * percentile(lateness, 0.5), 3),
+        'window_lateness_ms_p99': round(1000 * percentile(lateness, 0.99), 3),
+        'window_lateness_ms_max': round(1000 * max(lateness, default=0), 3),
+        'admitted': metrics['admitted'],
+        'rate_limited': metrics['rate_limited'],
+        'injections': len(injected),
+        'no_quorum': metrics['no_quorum'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crowd input aggregation load test')
+    parser.add_argument('--rate', type=int, default=50000, help='Total input events per second')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--window-frames', type=int, default=10)
+    parser.add_argument('--client-rate', type=float, default=10, help='Token bucket rate per client')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = []
+    for mode in args.modes:
+        for clients in args.clients:
+            report.append(asyncio.run(run_load(mode, clients, args.rate, args.duration,
+                                               args.window_frames, args.client_rate, args.seed)))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of handle_websocket under each event loop / JSON backend combination.
+
+Each combination runs the real SpectrumEmulator.handle_websocket in its own server
+process (EVENT_LOOP / JSON_BACKEND set in its environment, emulator not started).
+Client processes keep a fixed number of connections busy with status round trips and
+record per-message latency. Prints one JSON report.
+
+Usage: python3 benchmarks/loop_json_bench.py --connections 64 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / 'server'
+sys.path.insert(0, str(SERVER_DIR))
+
+import websockets
+
+COMBINATIONS = [
+    ('asyncio', 'json'),
+    ('asyncio', 'orjson'),
+    ('uvloop', 'json'),
+    ('uvloop', 'orjson'),
+]
+
+
+def run_server(port, event_loop, json_backend, ready, info):
+    os.environ.update({
+        'EVENT_LOOP': event_loop,
+        'JSON_BACKEND': json_backend,
+        'SESSION_RECORDING': '0',
+        'S3_LOCAL_ROOT': tempfile.mkdtemp(prefix='bench-s3-'),
+    })
+    import runtime
+    from emulator_server import SpectrumEmulator
+
+    # Per-message INFO logging would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    emulator = SpectrumEmulator()
+
+    async def main():
+        async with websockets.serve(emulator.handle_websocket, '127.0.0.1', port):
+            ready.set()
+            await asyncio.Event().wait()
+
+    # Report what was actually selected, in case a backend fell back
+    info.put(runtime.describe())
+    runtime.run(main())
+
+
+def run_clients(port, connections, duration, results):
+    async def main():
+        latencies = []
+        deadline = time.monotonic() + duration
+        request = json.dumps({'type': 'status'})
+
+        async def client():
+            async with websockets.connect(f'ws://127.0.0.1:{port}/') as ws:
+                await ws.recv()
+                while time.monotonic() < deadline:
+                    sent = time.perf_counter()
+                    await ws.send(request)
+                    await ws.recv()
+                    latencies.append(time.perf_counter() - sent)
+
+        await asyncio.gather(*(client() for _ in range(connections)))
+        results.put(latencies)
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Event loop / JSON backend benchmark for handle_websocket')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--client-procs', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=18965)
+    args = parser.parse_args()
+
+    report = []
+    for event_loop, json_backend in COMBINATIONS:
+        ready = multiprocessing.Event()
+        info = multiprocessing.Queue()
+        server = multiprocessing.Process(target=run_server, args=(args.port, event_loop, json_backend, ready, info))
+        server.start()
+        if not ready.wait(30):
+            server.terminate()
+            raise SystemExit(f'Server for {event_loop}/{json_backend} did not start')
+
+        results = multiprocessing.Queue()
+        per_proc = max(1, args.connections // args.client_procs)
+        clients = [multiprocessing.Process(target=run_clients, args=(args.port, per_proc, args.duration, results))
+                   for _ in range(args.client_procs)]
+        for proc in clients:
+            proc.start()
+        latencies = sorted(latency for _ in clients for latency in results.get())
+        for proc in clients:
+            proc.join()
+        server.terminate()
+        server.join()
+
+        selected = info.get()
+        report.append({
+            'event_loop': selected['event_loop'],
+            'json': selected['json'],
+            'messages_per_second': round(len(latencies) / args.duration, 1),
+            'latency_ms_p50': round(1000 * latencies[len(latencies) // 2], 3),
+            'latency_ms_p99': round(1000 * latencies[int(len(latencies) * 0.99)], 3),
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
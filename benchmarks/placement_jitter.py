@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Frame and audio timer jitter under encoder load, for each CPU placement preset.
+
+Stands in for the stream's processes without FUSE or X: an emulator probe that wakes
+every 20 ms (one emulated frame), an audio probe that wakes every 10 ms (a PulseAudio
+fragment) and --load encoder stand-ins. The stand-ins are libx264 encodes of a test
+pattern with --ffmpeg, else Python loops that burn CPU in 30 ms bursts with 10 ms
+gaps, like an encoder working through GOPs. Each preset of server/cpu_placement.py
+(and "none", everything at default priority on any CPU) is applied to fresh processes
+and measured for --seconds. Prints one JSON report with, per preset, the lateness
+percentiles and missed periods of both probes and the CPU time the load got.
+
+    python3 benchmarks/placement_jitter.py --seconds 30
+    python3 benchmarks/placement_jitter.py --ffmpeg --load 2
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import psutil
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from cpu_placement import PLACEMENT_PRESETS, CPUPlacement, JitterProbe, host_cpus  # noqa: E402
+
+BURST = '''
+import time
+while True:
+    end = time.monotonic() + 0.03
+    while time.monotonic() < end:
+        pass
+    time.sleep(0.01)
+'''
+
+
+def start_load(count, use_ffmpeg, nice=0):
+    if use_ffmpeg:
+        command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-re', '-f', 'lavfi',
+                   '-i', 'testsrc2=size=1280x720:rate=50', '-c:v', 'libx264', '-preset', 'veryfast',
+                   '-f', 'null', '-']
+    else:
+        command = [sys.executable, '-c', BURST]
+    if nice:
+        # As EncoderMonitor.spawn() starts the encoders; placement leaves their priority alone
+        command = ['nice', '-n', str(nice)] + command
+    return [subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL) for _ in range(count)]
+
+
+def cpu_seconds(processes):
+    total = 0.0
+    for process in processes:
+        try:
+            times = psutil.Process(process.pid).cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            pass
+    return total
+
+
+def run(preset, args):
+    emulator = JitterProbe(0.02, window=100000)
+    audio = JitterProbe(0.01, window=100000)
+    load = []
+    try:
+        emulator.start()
+        audio.start()
+        load = start_load(args.load, args.ffmpeg, nice=args.encoder_nice if preset != 'none' else 0)
+        if preset != 'none':
+            placement = CPUPlacement(preset, encoder_nice=args.encoder_nice, probe_period=None)
+            placement.place('emulator', emulator.process.pid)
+            placement.place('audio', audio.process.pid)
+            for process in load:
+                placement.place('encoder', process.pid)
+        time.sleep(args.warmup)
+        emulator.lateness.clear()
+        audio.lateness.clear()
+        missed = (emulator.stats['missed_periods'], audio.stats['missed_periods'])
+        busy = cpu_seconds(load)
+        time.sleep(args.seconds)
+        busy = cpu_seconds(load) - busy
+        return {
+            'emulator_frame_lateness': emulator.metrics()['lateness_percentiles'],
+            'emulator_missed_frames': emulator.stats['missed_periods'] - missed[0],
+            'audio_period_lateness': audio.metrics()['lateness_percentiles'],
+            'audio_missed_periods': audio.stats['missed_periods'] - missed[1],
+            'load_cpu_share': round(busy / args.seconds, 3),
+        }
+    finally:
+        emulator.stop()
+        audio.stop()
+        for process in load:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--load', type=int, default=None, help='encoder stand-ins (default: 2 per CPU)')
+    parser.add_argument('--ffmpeg', action='store_true', help='load with libx264 encodes instead of Python loops')
+    parser.add_argument('--encoder-nice', type=int, default=10)
+    parser.add_argument('--presets', nargs='+', default=['none', *PLACEMENT_PRESETS],
+                        choices=['none', *PLACEMENT_PRESETS])
+    args = parser.parse_args()
+
+    cpus = host_cpus()
+    if args.load is None:
+        args.load = 2 * len(cpus)
+    if args.ffmpeg and not shutil.which('ffmpeg'):
+        raise SystemExit('--ffmpeg needs ffmpeg on PATH')
+    report = {
+        'cpus': cpus,
+        'load': {'processes': args.load, 'kind': 'ffmpeg libx264' if args.ffmpeg else 'cpu bursts'},
+        'seconds': args.seconds,
+        'presets': {preset: run(preset, args) for preset in args.presets},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Encode/decode cost and size of the binary WebSocket protocol against JSON.
+
+The benchmark encodes and decodes representative traffic (key input, status replies,
+segment notifications) one message per frame and in batches, with both wire formats,
+and prints one JSON report. The decoder fuzz tests live in tests/test_protocol.py.
+
+Usage: python3 benchmarks/protocol_bench.py --iterations 200000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+import protocol
+import runtime
+
+TRAFFIC = {
+    'key_press': {'type': 'key_press', 'key': 'SPACE', 'pressed': True},
+    'emulator_status': {'type': 'emulator_status', 'running': True, 'message': 'Status check',
+                        'output_resolution': '1280x960'},
+    'segment': {'type': 'segment', 'sequence': 48213, 'duration': 2.0,
+                'url': 'https://stream.example.com/hls/seg/3f2a9c0e8d7b6a5f4e3d2c1b0a998877.ts'},
+    'unschematized': {'type': 'clip_ready', 'clip_id': 'a1b2c3', 'url': 'https://example.com/clips/a1b2c3.mp4'},
+}
+
+
+def timed(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_message(message, iterations, batch):
+    messages = [message] * batch
+    codec = protocol.Codec(protocol.BINARY_SUBPROTOCOL)
+    frame = codec.frame([protocol.encode_record(m) for m in messages])
+    text = runtime.dumps(messages if batch > 1 else message)
+
+    binary_encode = timed(lambda: codec.frame([protocol.encode_record(m) for m in messages]), iterations)
+    binary_decode = timed(lambda: protocol.decode_frame(frame), iterations)
+    json_encode = timed(lambda: runtime.dumps(messages if batch > 1 else message), iterations)
+    json_decode = timed(lambda: runtime.loads(text), iterations)
+    return {
+        'batch': batch,
+        'binary_bytes': len(frame),
+        'json_bytes': len(text.encode('utf-8')),
+        'binary_encode_us': round(binary_encode * 1e6, 3),
+        'binary_decode_us': round(binary_decode * 1e6, 3),
+        'json_encode_us': round(json_encode * 1e6, 3),
+        'json_decode_us': round(json_decode * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary WebSocket protocol benchmark')
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    report = {'json_backend': runtime.json_name, 'messages': {}}
+    for name, message in TRAFFIC.items():
+        report['messages'][name] = [bench_message(message, args.iterations, batch) for batch in (1, 16)]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Cold-start budget check for the server, meant to run in CI.
+
+Starts server/emulator_server.py with STARTUP_TRACE pointing at a temporary file and
+waits for the server to write its startup trace (when every required readiness event
+has happened, or after --timeout). Then the total time to ready and each phase
+duration are compared with the budgets, and one JSON report is printed. The exit
+status is 1 if a budget was exceeded or a readiness event never happened.
+
+The trace file is kept with --keep PATH, so it can be opened in chrome://tracing or
+ui.perfetto.dev.
+
+Usage: python3 benchmarks/startup_budget.py --budget total=15 --budget ws_bind=0.5 \\
+           --budget interpreter_and_imports=1.5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / 'server'
+
+
+def parse_budgets(values):
+    budgets = {}
+    for value in values:
+        name, _, seconds = value.partition('=')
+        if not seconds:
+            raise SystemExit(f'--budget expects NAME=SECONDS, got {value!r}')
+        budgets[name] = float(seconds)
+    return budgets
+
+
+def run_server(trace_path, timeout, env_overrides):
+    env = dict(os.environ, STARTUP_TRACE=trace_path, STARTUP_TRACE_TIMEOUT=str(timeout))
+    env.update(env_overrides)
+    server = subprocess.Popen([sys.executable, 'emulator_server.py'], cwd=SERVER_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+    deadline = time.monotonic() + timeout + 10
+    try:
+        while time.monotonic() < deadline:
+            if os.path.exists(trace_path) and os.path.getsize(trace_path):
+                time.sleep(0.1)  # Let the writer finish
+                with open(trace_path) as f:
+                    return json.load(f)
+            if server.poll() is not None:
+                tail = server.stderr.read().decode('utf-8', 'replace')[-2000:]
+                raise SystemExit(f'Server exited with status {server.returncode} before writing a trace:\n{tail}')
+            time.sleep(0.05)
+        raise SystemExit(f'No startup trace after {timeout + 10}s')
+    finally:
+        if server.poll() is None:
+            os.killpg(server.pid, signal.SIGTERM)
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(server.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', action='append', default=[], metavar='NAME=SECONDS',
+                        help="'total' or a phase name; repeat for several budgets")
+    parser.add_argument('--timeout', type=float, default=60, help='STARTUP_TRACE_TIMEOUT for the server')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server, e.g. S3_LOCAL_ROOT=/tmp/s3')
+    parser.add_argument('--keep', metavar='PATH', help='copy the Chrome trace here')
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    env_overrides = dict(value.partition('=')[::2] for value in args.env)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_path = os.path.join(tmp, 'startup-trace.json')
+        trace = run_server(trace_path, args.timeout, env_overrides)
+        if args.keep:
+            shutil.copyfile(trace_path, args.keep)
+
+    summary = trace['otherData']
+    # A phase that runs more than once (a restart) is budgeted on its longest run
+    phases = {}
+    for phase in summary['phases']:
+        phases[phase['name']] = max(phase['seconds'], phases.get(phase['name'], 0.0))
+    measured = dict(phases, total=summary['total_seconds'])
+
+    breaches = []
+    for name, budget in budgets.items():
+        seconds = measured.get(name)
+        if seconds is None:
+            breaches.append({'name': name, 'budget': budget, 'seconds': None, 'reason': 'phase not recorded'})
+        elif seconds > budget:
+            breaches.append({'name': name, 'budget': budget, 'seconds': seconds, 'reason': 'over budget'})
+    for name in summary['missing']:
+        breaches.append({'name': name, 'budget': None, 'seconds': None, 'reason': 'readiness never reached'})
+
+    print(json.dumps({
+        'total_seconds': summary['total_seconds'],
+        'reason': summary.get('reason'),
+        'phases': phases,
+        'ready': summary['ready'],
+        'budgets': budgets,
+        'breaches': breaches,
+        'ok': not breaches,
+    }, indent=2))
+    sys.exit(1 if breaches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""End-to-end streaming benchmark: every quality profile, entirely on this machine.
+
+For each (profile, source) pair, starts server/emulator_server.py with S3_LOCAL_ROOT
+(a directory stand-in for S3) and YOUTUBE_RTMP_URL pointing at a local RTMP sink
+(ffmpeg -listen 1). FUSE is not started; CAPTURE_SOURCE feeds the encoders from:
+
+  test_pattern  the lavfi testsrc2/sine fallback the server uses when FUSE fails
+  replay        a recording of Spectrum gameplay (--clip, see encoder_autotune.py record),
+                looped in real time through the profile's scaler
+
+After the first segment is published and a warm-up, it measures the server over
+--duration seconds and prints one JSON report:
+
+  encoders     fps (frames encoded over the window / window), speed, dropped/duplicated frames
+  processes    CPU (% of one core) and peak RSS of the server, each encoder, the relay
+               forwarder and the RTMP sink
+  segments     segments published in the window and publish latency percentiles
+               (encoder closing the segment -> playlist listing it uploaded)
+  s3_requests  S3 requests by operation during the window, and per minute
+  rtmp_sink    frames and bytes the sink received
+  ws_rtt       WebSocket status round-trip percentiles, sampled while streaming
+
+Ports 8080 and 8765 must be free. Usage:
+
+    python3 benchmarks/streaming_e2e.py --duration 60
+    python3 benchmarks/streaming_e2e.py --profiles standard hq --clip gameplay.mkv
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / 'server'
+sys.path.insert(0, str(SERVER_DIR))
+
+import psutil
+import websockets
+
+from quality_profiles import PROFILE_DIR, load_profiles
+
+HTTP = 'http://127.0.0.1:8080'
+SAMPLE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    return {str(q): round(values[min(len(values) - 1, int(len(values) * q))], 5) for q in (0.5, 0.99, 1.0)}
+
+
+def get_json(path):
+    with urllib.request.urlopen(HTTP + path, timeout=5) as response:
+        return json.load(response)
+
+
+def encoder_samples():
+    """{process: {metric: value}} from the Prometheus endpoint"""
+    with urllib.request.urlopen(HTTP + '/metrics', timeout=5) as response:
+        text = response.read().decode()
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match or not match.group(1).startswith('spectrum_encoder_'):
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        if 'process' in labels and match.group(3) != 'NaN':
+            samples.setdefault(labels['process'], {})[match.group(1)] = float(match.group(3))
+    return samples
+
+
+class RTMPSink:
+    """ffmpeg listening for one RTMP publisher, discarding the stream and counting what arrives"""
+
+    def __init__(self, port):
+        self.url = f'rtmp://127.0.0.1:{port}/live2'
+        self.progress = {}
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error', '-listen', '1', '-f', 'flv',
+             '-i', f'{self.url}/bench', '-c', 'copy', '-f', 'null', '-progress', 'pipe:1', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            key, _, value = line.strip().partition('=')
+            self.progress[key] = value
+
+    def received(self):
+        return {'frames': int(self.progress.get('frame', 0) or 0),
+                'bytes': int(self.progress.get('total_size', 0) or 0)}
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def start_server(profile, source, clip, s3_root, sink, env_overrides):
+    env = dict(os.environ,
+               QUALITY_PROFILE=profile,
+               CAPTURE_SOURCE=clip if source == 'replay' else 'test_pattern',
+               S3_LOCAL_ROOT=s3_root,
+               SESSION_RECORDING='0',
+               STARTUP_TRACE='',
+               AUTOTUNE='off',
+               # Measure the profile as configured, not whatever rung the governor settles on
+               QUALITY_GOVERNOR='0',
+               # The placement would also pin and renice this machine's own Xvfb and PulseAudio
+               CPU_PLACEMENT='off')
+    if sink:
+        env.update(YOUTUBE_STREAM_KEY='bench', YOUTUBE_RTMP_URL=sink.url)
+    else:
+        env.pop('YOUTUBE_STREAM_KEY', None)
+    env.update(env_overrides)
+    return subprocess.Popen([sys.executable, 'emulator_server.py'], cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+
+
+def stop_server(server):
+    if server.poll() is None:
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+
+
+def wait_for_segment(server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            tail = server.stderr.read().decode('utf-8', 'replace')[-2000:]
+            raise RuntimeError(f'Server exited with status {server.returncode}:\n{tail}')
+        try:
+            hls = get_json('/hls/metrics')
+            if hls.get('segment_uploads', 0) + hls.get('dedup_hits', 0):
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'No segment published within {timeout}s')
+
+
+def role(process, server_pid, sink_pid):
+    if process.pid == server_pid:
+        return 'server'
+    if process.pid == sink_pid:
+        return 'rtmp_sink'
+    try:
+        command = process.cmdline()
+    except psutil.Error:
+        return None
+    if 'pipe:0' in command:
+        return 'relay_forwarder'
+    if 'hls' in command:
+        return 'web'
+    if 'flv' in command:
+        return 'youtube'
+    return process.name()
+
+
+def sample_processes(server_pid, sink_pid, duration):
+    """CPU use and peak RSS per process role over duration, sampled every second"""
+    root = psutil.Process(server_pid)
+    sink = psutil.Process(sink_pid) if sink_pid else None
+    started, peaks, last = {}, {}, {}
+    deadline = time.monotonic() + duration
+    while True:
+        processes = [root] + root.children(recursive=True) + ([sink] if sink else [])
+        for process in processes:
+            name = role(process, server_pid, sink_pid)
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    rss = process.memory_info().rss
+            except psutil.Error:
+                continue
+            key = (name, process.pid)
+            cpu = times.user + times.system
+            started.setdefault(key, cpu)
+            last[key] = cpu
+            peaks[key] = max(peaks.get(key, 0), rss)
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+    report = {}
+    for (name, pid), cpu in last.items():
+        entry = report.setdefault(name, {'cpu_percent': 0.0, 'rss_max_bytes': 0, 'pids': []})
+        entry['cpu_percent'] = round(entry['cpu_percent'] + (cpu - started[(name, pid)]) / duration * 100, 1)
+        entry['rss_max_bytes'] = max(entry['rss_max_bytes'], peaks[(name, pid)])
+        entry['pids'].append(pid)
+    return report
+
+
+async def ws_round_trips(duration, interval):
+    rtts = []
+    deadline = time.monotonic() + duration
+    request = json.dumps({'type': 'status'})
+    async with websockets.connect('ws://127.0.0.1:8765/') as ws:
+        await ws.recv()
+        while time.monotonic() < deadline:
+            sent = time.perf_counter()
+            await ws.send(request)
+            # Broadcasts may arrive in between; the reply is the one answering the status check
+            while json.loads(await ws.recv()).get('message') != 'Status check':
+                pass
+            rtts.append(time.perf_counter() - sent)
+            await asyncio.sleep(interval)
+    return rtts
+
+
+def run_case(profile, source, args, env_overrides):
+    result = {'profile': profile, 'source': source, 'duration': args.duration}
+    s3_root = tempfile.mkdtemp(prefix='e2e-s3-')
+    sink = RTMPSink(args.rtmp_port) if args.rtmp else None
+    server = start_server(profile, source, args.clip, s3_root, sink, env_overrides)
+    try:
+        wait_for_segment(server, args.startup_timeout)
+        time.sleep(args.warmup)
+
+        hls_before, encoders_before = get_json('/hls/metrics'), encoder_samples()
+        sink_before = sink.received() if sink else None
+        started = time.monotonic()
+        processes = {}
+        sampler = threading.Thread(target=lambda: processes.update(
+            sample_processes(server.pid, sink.process.pid if sink else None, args.duration)))
+        sampler.start()
+        rtts = asyncio.run(ws_round_trips(args.duration, args.ws_interval))
+        sampler.join()
+        elapsed = time.monotonic() - started
+        hls_after, encoders_after = get_json('/hls/metrics'), encoder_samples()
+
+        result['encoders'] = {}
+        for name, after in encoders_after.items():
+            before = encoders_before.get(name, {})
+            frames = after.get('spectrum_encoder_frames_total', 0) - before.get('spectrum_encoder_frames_total', 0)
+            result['encoders'][name] = {
+                'fps': round(frames / elapsed, 2),
+                'speed': after.get('spectrum_encoder_speed'),
+                'bitrate_kbps': after.get('spectrum_encoder_bitrate_kbps'),
+                'dropped_frames': after.get('spectrum_encoder_dropped_frames_total', 0)
+                - before.get('spectrum_encoder_dropped_frames_total', 0),
+                'duplicated_frames': after.get('spectrum_encoder_duplicated_frames_total', 0)
+                - before.get('spectrum_encoder_duplicated_frames_total', 0),
+                'lag_seconds': after.get('spectrum_encoder_lag_seconds'),
+            }
+        result['processes'] = processes
+        published = sum(hls_after[key] - hls_before[key] for key in ('segment_uploads', 'dedup_hits'))
+        result['segments'] = {'published': published, 'publish_latency': hls_after.get('publish_latency', {}),
+                              'upload_errors': hls_after['upload_errors'] - hls_before['upload_errors']}
+        requests_before = hls_before.get('s3_requests') or {}
+        requests = {op: count - requests_before.get(op, 0)
+                    for op, count in (hls_after.get('s3_requests') or {}).items()}
+        result['s3_requests'] = requests
+        result['s3_requests_per_minute'] = round(sum(requests.values()) / elapsed * 60, 1)
+        if sink:
+            received = sink.received()
+            result['rtmp_sink'] = {key: received[key] - sink_before[key] for key in received}
+        result['ws_rtt'] = dict(percentiles(rtts), samples=len(rtts))
+    except (RuntimeError, OSError) as e:
+        result['error'] = str(e)
+    finally:
+        stop_server(server)
+        if sink:
+            sink.stop()
+        shutil.rmtree(s3_root, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='*', help='default: every profile in --profile-dir')
+    parser.add_argument('--profile-dir', default=os.getenv('QUALITY_PROFILE_DIR', PROFILE_DIR))
+    parser.add_argument('--clip', help='gameplay recording for the replay source')
+    parser.add_argument('--sources', nargs='*', choices=('test_pattern', 'replay'),
+                        help='default: test_pattern, plus replay when --clip is given')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per case')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds after the first segment')
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--ws-interval', type=float, default=0.1, help='seconds between WebSocket round trips')
+    parser.add_argument('--no-rtmp', dest='rtmp', action='store_false', help='web output only')
+    parser.add_argument('--rtmp-port', type=int, default=19350)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server, e.g. HLS_CONTENT_ADDRESSED=1')
+    args = parser.parse_args()
+
+    profiles = args.profiles or sorted(load_profiles(args.profile_dir))
+    sources = args.sources or (['test_pattern', 'replay'] if args.clip else ['test_pattern'])
+    if 'replay' in sources and not args.clip:
+        raise SystemExit('The replay source needs --clip')
+    if args.clip:
+        args.clip = str(Path(args.clip).resolve())
+    env_overrides = dict(value.partition('=')[::2] for value in args.env)
+    if args.profile_dir != PROFILE_DIR:
+        env_overrides.setdefault('QUALITY_PROFILE_DIR', str(Path(args.profile_dir).resolve()))
+
+    results = []
+    for profile in profiles:
+        for source in sources:
+            print(f'{profile} / {source}...', file=sys.stderr)
+            results.append(run_case(profile, source, args, env_overrides))
+
+    print(json.dumps({
+        'host': {'cpus': psutil.cpu_count(), 'platform': sys.platform},
+        'duration': args.duration,
+        'rtmp': args.rtmp,
+        'results': results,
+    }, indent=2))
+    sys.exit(1 if any('error' in result for result in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Throughput scaling of the multi-worker (SO_REUSEPORT) WebSocket front end.
+
+For each worker count, starts an owner process plus forked acceptor workers on the
+same port, then measures new connections per second and request/reply round trips
+per second from separate client processes. Messages accepted by workers travel to
+the owner over the IPC channel exactly as in production. Prints one JSON report.
+
+Usage: python3 benchmarks/worker_scaling.py --workers 1 2 4 --clients 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+import websockets
+
+from broadcast_hub import BroadcastHub
+from workers import IPCOwner, fork_workers
+
+
+async def handle_message(data, reply, client=None):
+    # Stand-in for SpectrumEmulator.handle_message: parse, answer, no emulator work
+    if data.get('type') == 'hello':
+        await reply({'type': 'connected', 'emulator_running': True})
+    elif data.get('type') == 'status':
+        await reply({'type': 'emulator_status', 'running': True, 'message': 'Status check'})
+
+
+def run_owner(port, workers, ipc_path):
+    if workers > 1:
+        fork_workers(workers - 1, ws_port=port, http_port=port + 1, ipc_path=ipc_path)
+
+    async def main():
+        hub = BroadcastHub()
+
+        async def handler(websocket, path=None):
+            hub.register(websocket, topics=('status',))
+
+            async def reply(message):
+                await websocket.send(json.dumps(message))
+
+            try:
+                await reply({'type': 'connected', 'emulator_running': True})
+                async for message in websocket:
+                    await handle_message(json.loads(message), reply)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            finally:
+                hub.unregister(websocket)
+
+        reuse_port = workers > 1
+        if reuse_port:
+            await IPCOwner(handle_message, hub, path=ipc_path).start()
+        async with websockets.serve(handler, '127.0.0.1', port, reuse_port=reuse_port, backlog=4096):
+            await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def run_client(port, duration, mode, results):
+    async def main():
+        uri = f'ws://127.0.0.1:{port}/'
+        count = 0
+        deadline = time.monotonic() + duration
+
+        async def connector():
+            nonlocal count
+            while time.monotonic() < deadline:
+                async with websockets.connect(uri) as ws:
+                    await ws.recv()
+                count += 1
+
+        async def requester():
+            nonlocal count
+            async with websockets.connect(uri) as ws:
+                await ws.recv()
+                request = json.dumps({'type': 'status'})
+                while time.monotonic() < deadline:
+                    await ws.send(request)
+                    await ws.recv()
+                    count += 1
+
+        worker = connector if mode == 'connect' else requester
+        await asyncio.gather(*(worker() for _ in range(32)))
+        results.put(count)
+
+    asyncio.run(main())
+
+
+def measure(port, workers, clients, duration, mode):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=run_client, args=(port, duration, mode, results)) for _ in range(clients)]
+    for proc in procs:
+        proc.start()
+    total = sum(results.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    return round(total / duration, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-worker WebSocket scaling benchmark')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=4, help='Client processes')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=18865)
+    args = parser.parse_args()
+
+    report = {'cpus': os.cpu_count(), 'runs': []}
+    for workers in args.workers:
+        ipc_path = f'/tmp/spectrum-bench-{os.getpid()}-{workers}.sock'
+        owner = multiprocessing.Process(target=run_owner, args=(args.port, workers, ipc_path))
+        owner.start()
+        time.sleep(1 + workers * 0.5)
+        run = {
+            'workers': workers,
+            'connections_per_second': measure(args.port, workers, args.clients, args.duration, 'connect'),
+            'round_trips_per_second': measure(args.port, workers, args.clients, args.duration, 'request'),
+        }
+        report['runs'].append(run)
+        # Acceptors exit once the owner's IPC socket closes
+        owner.terminate()
+        owner.join()
+        time.sleep(1)
+        if os.path.exists(ipc_path):
+            os.unlink(ipc_path)
+
+    baseline = report['runs'][0]
+    for run in report['runs']:
+        run['connection_speedup'] = round(run['connections_per_second'] / baseline['connections_per_second'], 2)
+        run['round_trip_speedup'] = round(run['round_trips_per_second'] / baseline['round_trips_per_second'], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,12 +19,9 @@ aws ecr create-repository --repository-name $ECR_REPOSITORY --region $AWS_REGION
 # Get ECR login token
 aws ecr get-login-password --region $AWS_REGION | docker login --username AWS --password-stdin $ACCOUNT_ID.dkr.ecr.$AWS_REGION.amazonaws.com
 
-# Copy the fixed server file
-cp server/emulator_server_fixed.py server/emulator_server.py
-
 # Build the Docker image
 echo "Building Docker image..."
-docker build -f Dockerfile.fixed -t $ECR_REPOSITORY:$IMAGE_TAG .
+docker build -f Dockerfile.fixed --build-arg QUALITY_PROFILE=low -t $ECR_REPOSITORY:$IMAGE_TAG .
 
 # Tag for ECR
 docker tag $ECR_REPOSITORY:$IMAGE_TAG $ACCOUNT_ID.dkr.ecr.$AWS_REGION.amazonaws.com/$ECR_REPOSITORY:$IMAGE_TAG
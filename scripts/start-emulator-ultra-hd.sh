@@ -10,13 +10,12 @@ export SDL_AUDIODRIVER=pulse
 
 # Get resolution from environment or use Ultra HD default
 DISPLAY_SIZE=${DISPLAY_SIZE:-"1920x1080"}
-STREAM_RESOLUTION=${STREAM_RESOLUTION:-"1920x1080"}
-STREAM_BITRATE=${STREAM_BITRATE:-"8000k"}
+export DISPLAY_SIZE
+export QUALITY_PROFILE=${QUALITY_PROFILE:-"ultra_hd"}
 
 echo "Ultra HD Configuration:"
 echo "  Display Size: $DISPLAY_SIZE"
-echo "  Stream Resolution: $STREAM_RESOLUTION"
-echo "  Stream Bitrate: $STREAM_BITRATE"
+echo "  Quality Profile: $QUALITY_PROFILE"
 
 # Create necessary directories
 mkdir -p /app/stream/hls /tmp/pulse
@@ -84,65 +83,16 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-# Start health check server
-echo "Starting health check server..."
-python3 -c "
-import http.server
-import socketserver
-import threading
-import time
-import json
-
-class HealthHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            health_data = {
-                'status': 'healthy',
-                'resolution': '$STREAM_RESOLUTION',
-                'bitrate': '$STREAM_BITRATE',
-                'timestamp': time.time()
-            }
-            self.wfile.write(json.dumps(health_data).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def log_message(self, format, *args):
-        # Suppress access logs for health checks
-        if '/health' not in format % args:
-            super().log_message(format, *args)
-
-def start_health_server():
-    try:
-        with socketserver.TCPServer(('', 8080), HealthHandler) as httpd:
-            httpd.serve_forever()
-    except Exception as e:
-        print(f'Health server error: {e}')
-
-# Start health server in background thread
-health_thread = threading.Thread(target=start_health_server, daemon=True)
-health_thread.start()
-
-print('Health check server started on port 8080')
-" &
-HEALTH_PID=$!
-
-# Wait for health server to start
-sleep 2
-
-# Start WebSocket server with Ultra HD configuration
-echo "Starting WebSocket server..."
+# Start the server (WebSocket, /health on 8080) with the Ultra HD quality profile
+echo "Starting emulator server..."
 cd /app/server
-python3 emulator_server_ultra_hd.py &
+python3 emulator_server.py &
 WEBSOCKET_PID=$!
 
 # Function to cleanup on exit
 cleanup() {
     echo "Cleaning up processes..."
-    kill $XVFB_PID $PULSE_PID $HEALTH_PID $WEBSOCKET_PID 2>/dev/null
+    kill $XVFB_PID $PULSE_PID $WEBSOCKET_PID 2>/dev/null
     # Kill any remaining FFmpeg processes
     pkill -f ffmpeg 2>/dev/null
     # Kill any remaining FUSE processes
@@ -180,7 +130,7 @@ while true; do
     if ! kill -0 $WEBSOCKET_PID 2>/dev/null; then
         echo "WebSocket server died, restarting..."
         cd /app/server
-        python3 emulator_server_ultra_hd.py &
+        python3 emulator_server.py &
         WEBSOCKET_PID=$!
     fi
     
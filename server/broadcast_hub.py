@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+
+import websockets.exceptions
+
+import protocol
+import runtime
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Outbound queue and writer task for one WebSocket connection"""
+
+    __slots__ = ('websocket', 'topics', 'codec', 'queue', 'pending', 'queued_bytes', 'behind_since',
+                 'sent', 'dropped', 'coalesced', 'wakeup', 'task', '__weakref__')
+
+    def __init__(self, websocket, topics, codec):
+        self.websocket = websocket
+        self.topics = set(topics)
+        self.codec = codec
+        self.queue = deque()
+        # coalesce key -> queued slot, so a newer message replaces an unsent one in place
+        self.pending = {}
+        self.queued_bytes = 0
+        self.behind_since = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def memory_bytes(self):
+        slots = sys.getsizeof(self.queue) + sys.getsizeof(self.pending) + len(self.queue) * 72
+        return sys.getsizeof(self) + slots + self.queued_bytes
+
+
+class BroadcastHub:
+    """Fan-out of server events to many WebSocket clients.
+
+    Each message is serialized once per wire encoding (JSON text, binary record) and
+    the same payload is queued for every subscriber of its topic. Binary clients get
+    everything queued at the time their writer runs batched into one frame. Every client has its own bounded queue drained by its own
+    writer task, so a slow client only ever delays itself.
+
+    Slow consumer policy:
+      * A message published with a coalesce_key replaces any unsent message with the
+        same key (latest status or segment wins), so state updates never pile up.
+      * When a queue is full the oldest queued message is dropped to make room.
+      * A client that has been continuously behind for max_lag seconds, or has
+        dropped max_drops messages, is closed with 1013 (try again later) so it can
+        reconnect and resynchronise. Lag is checked on every publish and by a sweep
+        task every quarter of max_lag, so a client stalled after the last broadcast
+        is closed as well.
+    """
+
+    def __init__(self, max_queue=64, max_lag=10.0, max_drops=256):
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.max_drops = max_drops
+        self.channels = {}
+        self.subscribers = {}
+        # forward(topic, payload, coalesce_key) for hubs in other worker processes
+        self.forwarders = []
+        self._sweeper = None
+        self.stats = {
+            'published': 0,
+            'delivered': 0,
+            'dropped': 0,
+            'coalesced': 0,
+            'closed_slow': 0,
+        }
+
+    def register(self, websocket, topics=(), codec=None):
+        channel = ClientChannel(websocket, topics, codec or protocol.Codec())
+        self.channels[websocket] = channel
+        for topic in channel.topics:
+            self.subscribers.setdefault(topic, set()).add(channel)
+        loop = asyncio.get_running_loop()
+        channel.task = loop.create_task(self._writer(channel))
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = loop.create_task(self._sweep())
+        return channel
+
+    def subscribe(self, websocket, topic):
+        channel = self.channels.get(websocket)
+        if channel:
+            channel.topics.add(topic)
+            self.subscribers.setdefault(topic, set()).add(channel)
+
+    def unsubscribe(self, websocket, topic):
+        channel = self.channels.get(websocket)
+        if channel:
+            channel.topics.discard(topic)
+            self.subscribers.get(topic, set()).discard(channel)
+
+    def unregister(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if not channel:
+            return
+        for topic in channel.topics:
+            self.subscribers.get(topic, set()).discard(channel)
+        if channel.task and channel.task is not asyncio.current_task():
+            channel.task.cancel()
+
+    def subscriber_count(self, topic):
+        return len(self.subscribers.get(topic, ()))
+
+    def has_audience(self, topic):
+        return bool(self.forwarders) or bool(self.subscribers.get(topic))
+
+    def publish(self, topic, message, coalesce_key=None):
+        """Queue message for every subscriber of topic; must run on the event loop"""
+        subscribers = self.subscribers.get(topic)
+        if not subscribers and not self.forwarders:
+            return 0
+        payload = message if isinstance(message, (str, bytes)) else runtime.dumps(message)
+        self.stats['published'] += 1
+        for forward in self.forwarders:
+            forward(topic, payload, coalesce_key)
+        if not subscribers:
+            return 0
+        record = None
+        now = time.monotonic()
+        for channel in list(subscribers):
+            if channel.codec.binary:
+                if record is None:
+                    # Forwarded broadcasts arrive already serialized as JSON
+                    record = protocol.encode_record(message if isinstance(message, dict) else runtime.loads(payload))
+                self._offer(channel, record, coalesce_key, now)
+            else:
+                self._offer(channel, payload, coalesce_key, now)
+        return len(subscribers)
+
+    def _offer(self, channel, payload, coalesce_key, now):
+        if coalesce_key is not None:
+            slot = channel.pending.get(coalesce_key)
+            if slot is not None:
+                channel.queued_bytes += len(payload) - len(slot[0])
+                slot[0] = payload
+                channel.coalesced += 1
+                self.stats['coalesced'] += 1
+                return
+
+        if len(channel.queue) >= self.max_queue:
+            old_payload, old_key = channel.queue.popleft()
+            if old_key is not None:
+                channel.pending.pop(old_key, None)
+            channel.queued_bytes -= len(old_payload)
+            channel.dropped += 1
+            self.stats['dropped'] += 1
+
+        slot = [payload, coalesce_key]
+        channel.queue.append(slot)
+        if coalesce_key is not None:
+            channel.pending[coalesce_key] = slot
+        channel.queued_bytes += len(payload)
+        if channel.behind_since is None:
+            channel.behind_since = now
+        channel.wakeup.set()
+
+        if channel.dropped >= self.max_drops or now - channel.behind_since > self.max_lag:
+            self._close_slow(channel)
+
+    def _close_slow(self, channel):
+        logger.warning(f'Closing slow WebSocket client: {len(channel.queue)} queued, {channel.dropped} dropped')
+        self.stats['closed_slow'] += 1
+        self.unregister(channel.websocket)
+        asyncio.get_running_loop().create_task(
+            channel.websocket.close(code=1013, reason='Too slow to keep up with broadcasts'))
+
+    async def _sweep(self):
+        """Close clients that stay behind while nothing is being published; ends with the last client"""
+        while self.channels:
+            await asyncio.sleep(self.max_lag / 4)
+            now = time.monotonic()
+            for channel in list(self.channels.values()):
+                if channel.behind_since is not None and now - channel.behind_since > self.max_lag:
+                    self._close_slow(channel)
+
+    async def _writer(self, channel):
+        try:
+            while True:
+                await channel.wakeup.wait()
+                channel.wakeup.clear()
+                while channel.queue:
+                    batch = []
+                    limit = protocol.MAX_BATCH if channel.codec.binary else 1
+                    while channel.queue and len(batch) < limit:
+                        payload, coalesce_key = channel.queue.popleft()
+                        if coalesce_key is not None:
+                            channel.pending.pop(coalesce_key, None)
+                        channel.queued_bytes -= len(payload)
+                        batch.append(payload)
+                    await channel.websocket.send(channel.codec.frame(batch))
+                    channel.sent += len(batch)
+                    self.stats['delivered'] += len(batch)
+                channel.behind_since = None
+        except websockets.exceptions.ConnectionClosed:
+            self.unregister(channel.websocket)
+        except asyncio.CancelledError:
+            pass
+
+    def metrics(self):
+        channels = list(self.channels.values())
+        memory = [channel.memory_bytes() for channel in channels]
+        return dict(
+            self.stats,
+            clients=len(channels),
+            binary_clients=sum(1 for channel in channels if channel.codec.binary),
+            topics={topic: len(subs) for topic, subs in self.subscribers.items()},
+            queued_messages=sum(len(channel.queue) for channel in channels),
+            queued_bytes=sum(channel.queued_bytes for channel in channels),
+            memory_bytes_total=sum(memory),
+            memory_bytes_per_client_avg=round(sum(memory) / len(memory)) if memory else 0,
+            memory_bytes_per_client_max=max(memory, default=0),
+        )
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'mp4': ('.mp4', ['-movflags', '+faststart'], 'video/mp4'),
+    'fmp4': ('.mp4', ['-movflags', 'frag_keyframe+empty_moov+default_base_moof'], 'video/mp4'),
+}
+
+
+class ClipExporter:
+    """Cuts clips and archives out of the DVR window without transcoding.
+
+    The covering MPEG-TS segments are concatenated straight into an ffmpeg stream-copy
+    remux, so the work is bounded by I/O and never involves the live encoder. The live
+    encoder emits a keyframe at every segment boundary (-g equals -hls_time), so the
+    clip start snaps to the nearest segment boundary.
+
+    A clip's file is deleted once it has been uploaded. Only the newest keep_clips
+    clips are tracked; older ones are forgotten and their files deleted.
+    """
+
+    def __init__(self, dvr, clip_dir, upload_engine=None, keep_clips=100):
+        self.dvr = dvr
+        self.clip_dir = Path(clip_dir)
+        self.clip_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_engine = upload_engine
+        self.keep_clips = keep_clips
+        self.clips = {}
+
+    async def export(self, start=None, end=None, fmt='mp4', archive=False):
+        """Export [start, end) of the DVR window; offsets are as for DVRStore.playlist_from"""
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown clip format: {fmt}')
+        started = time.monotonic()
+
+        if archive:
+            start = end = None
+        window_start, window_end, segments = self.dvr.clip_range(start, end)
+        if window_end <= window_start:
+            raise ValueError('Clip end must be after its start')
+        if not segments:
+            raise ValueError('No retained segments cover that range')
+        first = segments[0]
+        if len(segments) > 1 and window_start - first.start > first.duration / 2:
+            segments = segments[1:]
+        keyframe_start = segments[0].start
+        duration = min(window_end, segments[-1].start + segments[-1].duration) - keyframe_start
+
+        clip_id = uuid.uuid4().hex[:12]
+        suffix, mux_args, content_type = FORMATS[fmt]
+        out_path = self.clip_dir / f'{clip_id}{suffix}'
+
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-fflags', '+genpts',
+            '-f', 'mpegts',
+            '-i', 'pipe:0',
+            '-t', f'{duration:.3f}',
+            '-c', 'copy',
+            '-bsf:a', 'aac_adtstoasc',
+            '-avoid_negative_ts', 'make_zero',
+            *mux_args,
+            str(out_path),
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                for segment in segments:
+                    data = await loop.run_in_executor(None, self.dvr.get, segment.dvr_id)
+                    if data is None:
+                        raise ValueError(f'Segment {segment.dvr_id} was evicted during export')
+                    process.stdin.write(data)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffmpeg exited early; its stderr says why
+            finally:
+                process.stdin.close()
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f'Clip remux failed: {stderr.decode(errors="replace").strip()}')
+        except BaseException:
+            out_path.unlink(missing_ok=True)
+            raise
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+        clip = {
+            'id': clip_id,
+            'archive': archive,
+            'format': fmt,
+            'path': str(out_path),
+            'start': keyframe_start,
+            'duration': round(duration, 3),
+            'segments': len(segments),
+            'bytes': out_path.stat().st_size,
+            'local': True,
+            'export_seconds': round(time.monotonic() - started, 3),
+        }
+        self._track(clip)
+        logger.info(f'Exported {"archive" if archive else "clip"} {clip_id}: {clip["duration"]}s from '
+                    f'{len(segments)} segments in {clip["export_seconds"]}s')
+
+        if self.upload_engine:
+            key = f'{"archives" if archive else "clips"}/{out_path.name}'
+            clip['key'] = key
+            clip['upload_job'] = self.upload_engine.submit(out_path, key, content_type,
+                                                           on_done=lambda job: self._uploaded(clip, job))
+        return clip
+
+    def _track(self, clip):
+        self.clips[clip['id']] = clip
+        while len(self.clips) > self.keep_clips:
+            oldest = self.clips.pop(next(iter(self.clips)))
+            if oldest.get('upload_job') is None or self._upload_state(oldest) not in ('queued', 'uploading'):
+                self._delete(oldest)
+
+    def _upload_state(self, clip):
+        job = self.upload_engine.status(clip['upload_job']) if self.upload_engine else None
+        return job['state'] if job else None
+
+    def _uploaded(self, clip, job):
+        """Upload callback, on an upload thread: the local copy is no longer needed"""
+        if job['state'] == 'done' or clip['id'] not in self.clips:
+            self._delete(clip)
+
+    @staticmethod
+    def _delete(clip):
+        try:
+            Path(clip['path']).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f'Could not delete clip file {clip["path"]}: {e}')
+        clip['local'] = False
+
+    def status(self, clip_id):
+        clip = self.clips.get(clip_id)
+        if clip and self.upload_engine and 'upload_job' in clip:
+            return dict(clip, upload=self.upload_engine.status(clip['upload_job']))
+        return clip
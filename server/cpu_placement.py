@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""CPU affinity, nice and I/O class for every process of the stream, per role.
+
+FUSE, the ffmpeg encoders, Xvfb, PulseAudio and the server's own threads share the
+task's vCPUs. Left to the scheduler, an encoder burst delays FUSE's frame and
+PulseAudio's buffer refill, which shows up as uneven frames and audio underruns. Each
+process is given a role and each role a Placement from a preset:
+
+- latency: FUSE gets a core of its own, PulseAudio and Xvfb the next one, and the
+  encoders, server and upload threads share the rest. FUSE and PulseAudio also run at
+  nice -5 where the container allows it. With 3 CPUs the encoders also use the audio
+  core, with 2 the emulator, audio and display share the first one, and on a single
+  CPU only priorities are set.
+- density: no pinning, so the kernel can balance every CPU, and only the encoders and
+  upload threads run at a lower priority. For hosts packed with tasks, where a
+  dedicated core per emulator is not affordable.
+
+The encoders' nice value is not set here: EncoderMonitor.spawn() starts them under
+nice(1), before their threads exist and whether placement is on or not, so their
+placement only covers affinity and I/O class.
+
+Placements are applied thread by thread (/proc/<pid>/task), because nice and affinity
+are per thread on Linux and FUSE and ffmpeg create their threads after start. A sweep
+every few seconds finds new and replaced children, Xvfb and PulseAudio (started by the
+container script) by name, and the server's own threads.
+
+The result is measured by each role's run-queue delay from schedstat and, when
+probe_period is given, by a probe: a small child placed like FUSE that wakes once per
+emulated frame (20 ms) and reports how late it woke. The probe shares FUSE's core and
+runs at its priority, so it is meant for measuring rather than left on in production.
+benchmarks/placement_jitter.py runs both presets against a synthetic encoder load.
+
+    python3 cpu_placement.py plan latency      # the placement this host would get
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+import psutil
+
+from encoder_autotune import available_cpus
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+PLACEMENT_PRESETS = ('latency', 'density')
+QUANTILES = (0.5, 0.99, 0.999)
+BOOST_NICE = -5  # Needs CAP_SYS_NICE; without it the boosted roles stay at 0
+UPLOAD_THREADS = ('upload', 'hls-publisher')  # Python thread name prefixes
+EXTERNAL = {'Xvfb': 'display', 'pulseaudio': 'audio'}  # Started by the container script
+
+# cpus: the CPUs the role may run on, None for any. nice: None to leave the priority as
+# started. ionice: (psutil class, level) or None
+Placement = namedtuple('Placement', 'cpus nice ionice')
+
+
+def host_cpus():
+    """CPUs to plan with: the affinity mask, cut down to the cgroup quota if there is one"""
+    cpus = sorted(os.sched_getaffinity(0))
+    return cpus[:max(1, int(available_cpus()))]
+
+
+def placement_plan(preset, cpus, encoder_nice=10):
+    """{role: Placement} for preset on the given CPUs"""
+    if preset not in PLACEMENT_PRESETS:
+        raise ValueError(f'unknown CPU placement preset {preset!r} (expected one of {", ".join(PLACEMENT_PRESETS)})')
+    background = (psutil.IOPRIO_CLASS_BE, 7)
+    if preset == 'density':
+        return {
+            'emulator': Placement(None, 0, None),
+            'audio': Placement(None, 0, None),
+            'display': Placement(None, 0, None),
+            'encoder': Placement(None, None, None),
+            'server': Placement(None, 0, None),
+            'uploads': Placement(None, encoder_nice, background),
+        }
+    cpus = list(cpus)
+    if len(cpus) >= 4:
+        emulator, media, rest = cpus[:1], cpus[1:2], cpus[2:]
+    elif len(cpus) == 3:
+        emulator, media, rest = cpus[:1], cpus[1:2], cpus[1:]
+    elif len(cpus) == 2:
+        emulator, media, rest = cpus[:1], cpus[:1], cpus[1:]
+    else:
+        emulator = media = rest = None
+    return {
+        'emulator': Placement(emulator, BOOST_NICE, None),
+        'audio': Placement(media, BOOST_NICE, None),
+        'display': Placement(media, 0, None),
+        'encoder': Placement(rest, None, background),
+        'server': Placement(rest, 0, None),
+        'uploads': Placement(rest, encoder_nice, background),
+    }
+
+
+def _tasks(pid):
+    try:
+        return [int(task) for task in os.listdir(f'/proc/{pid}/task')]
+    except OSError:
+        return []
+
+
+def _schedstat(pid):
+    """(seconds waited on a run queue, times scheduled) summed over the threads of pid"""
+    waited = slices = 0
+    for task in _tasks(pid):
+        try:
+            with open(f'/proc/{pid}/task/{task}/schedstat') as f:
+                fields = f.read().split()
+            waited += int(fields[1])
+            slices += int(fields[2])
+        except (OSError, ValueError, IndexError):
+            continue
+    return waited / 1e9, slices
+
+
+def probe_main(period):
+    """Wake every period seconds and print how late each wakeup was, in microseconds"""
+    deadline = time.monotonic() + period
+    while True:
+        time.sleep(max(0.0, deadline - time.monotonic()))
+        late = time.monotonic() - deadline
+        # A wakeup more than a period late has missed frames, which are not made up
+        missed = int(late // period)
+        print(f'{int(late * 1e6)} {missed}', flush=True)
+        deadline += period * (missed + 1)
+
+
+class JitterProbe:
+    """A child that wakes once per emulated frame; lateness quantiles of its wakeups"""
+
+    def __init__(self, period=0.02, window=3000):
+        self.period = period
+        self.lateness = deque(maxlen=window)
+        self.stats = {'wakeups': 0, 'missed_periods': 0, 'max_lateness': 0.0}
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'probe', str(self.period)],
+                                         stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        threading.Thread(target=self._read, name='jitter-probe', daemon=True).start()
+        return self.process
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def _read(self):
+        for line in self.process.stdout:
+            late, missed = (int(field) for field in line.split())
+            late /= 1e6
+            self.lateness.append(late)
+            self.stats['wakeups'] += 1
+            self.stats['missed_periods'] += missed
+            if late > self.stats['max_lateness']:
+                self.stats['max_lateness'] = late
+
+    def percentiles(self):
+        lateness = sorted(self.lateness)
+        if not lateness:
+            return {}
+        return {q: lateness[min(len(lateness) - 1, int(len(lateness) * q))] for q in QUANTILES}
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            period=self.period,
+            max_lateness=round(self.stats['max_lateness'], 6),
+            lateness_percentiles={str(q): round(late, 6) for q, late in self.percentiles().items()},
+        )
+
+
+class CPUPlacement:
+    """Applies a preset's placements to the stream's processes and measures the result.
+
+    Children of the server are classified by executable name (fuse* is the emulator, ffmpeg an encoder), so encoders replaced
+    by a reconfiguration and the relay's forwarders are picked up by the next sweep.
+    """
+
+    def __init__(self, preset, encoder_nice=10, interval=2.0, probe_period=None, cpus=None):
+        self.preset = preset
+        self.cpus = cpus if cpus is not None else host_cpus()
+        self.plan = placement_plan(preset, self.cpus, encoder_nice)
+        self.interval = interval
+        self.probe = JitterProbe(probe_period) if probe_period else None
+        self.stats = {'sweeps': 0, 'threads_placed': 0, 'errors': 0}
+        self.run_delay = {}
+        self.wait_per_slice = {}
+        self._placed = {}  # (pid, tid) -> role
+        self._denied = set()
+        self._last = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread:
+            return
+        logger.info(f'CPU placement "{self.preset}" on CPUs {self.cpus}: ' + ', '.join(
+            f'{role} cpus={"any" if p.cpus is None else ",".join(map(str, p.cpus))} '
+            f'nice={"as started" if p.nice is None else p.nice}'
+            for role, p in self.plan.items()))
+        if self.probe:
+            self.probe.start()
+        self._thread = threading.Thread(target=self._run, name='cpu-placement', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.probe:
+            self.probe.stop()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f'CPU placement sweep failed: {e}')
+            if self._stop.wait(self.interval):
+                return
+
+    def _apply(self, role, pid, tid):
+        placement = self.plan[role]
+        if self._placed.get((pid, tid)) == role:
+            return
+        try:
+            if placement.cpus is not None:
+                os.sched_setaffinity(tid, placement.cpus)
+            try:
+                if placement.nice is not None:
+                    os.setpriority(os.PRIO_PROCESS, tid, placement.nice)
+            except PermissionError:
+                if placement.nice >= 0:
+                    raise
+                if role not in self._denied:
+                    self._denied.add(role)
+                    logger.warning(f'CPU placement: not allowed to raise {role} priority to nice '
+                                   f'{placement.nice} (needs CAP_SYS_NICE), leaving it at 0')
+                os.setpriority(os.PRIO_PROCESS, tid, 0)
+            if placement.ionice:
+                psutil.Process(tid).ionice(*placement.ionice)
+        except (OSError, psutil.Error) as e:
+            if isinstance(e, (ProcessLookupError, psutil.NoSuchProcess)):
+                return  # Thread exited since it was listed
+            self.stats['errors'] += 1
+            logger.warning(f'CPU placement: could not place {role} thread {tid} of {pid}: {e}')
+            return
+        self._placed[(pid, tid)] = role
+        self.stats['threads_placed'] += 1
+
+    def place(self, role, pid):
+        """Place every current thread of pid in role"""
+        for tid in _tasks(pid):
+            self._apply(role, pid, tid)
+
+    def roles(self):
+        """{pid: role} of every process placed, except the server itself"""
+        roles = {}
+        if self.probe and self.probe.process and self.probe.process.poll() is None:
+            roles[self.probe.process.pid] = 'emulator'
+        for child in psutil.Process().children(recursive=True):
+            try:
+                name = child.name()
+            except psutil.Error:
+                continue
+            if name.startswith('fuse'):
+                roles[child.pid] = 'emulator'
+            elif name.startswith('ffmpeg'):
+                roles[child.pid] = 'encoder'
+        for process in psutil.process_iter(['name']):
+            role = EXTERNAL.get(process.info['name'])
+            if role:
+                roles[process.pid] = role
+        return roles
+
+    def sweep(self):
+        roles = self.roles()
+        for pid, role in roles.items():
+            self.place(role, pid)
+        own = os.getpid()
+        uploads = {thread.native_id for thread in threading.enumerate() if thread.name.startswith(UPLOAD_THREADS)}
+        for tid in _tasks(own):
+            self._apply('uploads' if tid in uploads else 'server', own, tid)
+        roles[own] = 'server'
+        alive = set(roles)
+        self._placed = {key: role for key, role in self._placed.items() if key[0] in alive}
+        self._measure(roles)
+        self.stats['sweeps'] += 1
+
+    def _measure(self, roles):
+        """Run-queue share and mean wait per scheduling of each role since the last sweep"""
+        now = time.monotonic()
+        totals = {}
+        for pid, role in roles.items():
+            waited, slices = _schedstat(pid)
+            previous = self._last.get(pid)
+            self._last[pid] = (waited, slices, now)
+            if previous and now > previous[2]:
+                total = totals.setdefault(role, [0.0, 0, 0.0])
+                total[0] += waited - previous[0]
+                total[1] += slices - previous[1]
+                total[2] = now - previous[2]
+        self._last = {pid: value for pid, value in self._last.items() if pid in roles}
+        self.run_delay = {role: round(waited / elapsed, 4) for role, (waited, _, elapsed) in totals.items()}
+        self.wait_per_slice = {role: round(waited / slices, 6) for role, (waited, slices, _) in totals.items()
+                               if slices > 0}
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            preset=self.preset,
+            cpus=self.cpus,
+            plan={role: placement._asdict() for role, placement in self.plan.items()},
+            run_delay=self.run_delay,
+            wait_per_slice=self.wait_per_slice,
+            frame_clock=self.probe.metrics() if self.probe else None,
+        )
+
+    def families(self):
+        delay = gauge('spectrum_placement_run_delay_ratio', 'Share of time a role waited for a CPU')
+        for role, value in self.run_delay.items():
+            delay.add(value, role=role)
+        wait = gauge('spectrum_placement_wait_per_slice_seconds', 'Mean run-queue wait each time a role was scheduled')
+        for role, value in self.wait_per_slice.items():
+            wait.add(value, role=role)
+        families = [delay, wait]
+        if self.probe:
+            jitter = gauge('spectrum_frame_clock_jitter_seconds',
+                           f'Lateness of a {self.probe.period * 1000:.0f} ms timer placed like the emulator, '
+                           f'over the last {self.probe.lateness.maxlen} wakeups')
+            for q, value in self.probe.percentiles().items():
+                jitter.add(round(value, 6), quantile=str(q))
+            families += [jitter, counter('spectrum_frame_clock_missed_total',
+                                         'Emulated frame periods the probe overslept entirely',
+                                         self.probe.stats['missed_periods'])]
+        return families
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='CPU placement of the stream processes')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan = commands.add_parser('plan', help='print the placement this host would get')
+    plan.add_argument('preset', choices=PLACEMENT_PRESETS)
+    plan.add_argument('--encoder-nice', type=int, default=int(os.getenv('ENCODER_NICE', '10')))
+    probe = commands.add_parser('probe', help='print the lateness of periodic wakeups (used by JitterProbe)')
+    probe.add_argument('period', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'probe':
+        try:
+            probe_main(args.period)
+        except (BrokenPipeError, KeyboardInterrupt):
+            pass
+        return
+    cpus = host_cpus()
+    print(json.dumps({'cpus': cpus, 'plan': {role: placement._asdict() for role, placement
+                                              in placement_plan(args.preset, cpus, args.encoder_nice).items()}},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import time
+
+from session_recorder import INPUT_CODE_BY_NAME, SPECTRUM_FRAME_RATE
+
+logger = logging.getLogger(__name__)
+
+MODES = ('anarchy', 'vote', 'democracy')
+
+
+class CrowdInput:
+    """Arbitrates key input from many viewers into one input stream for the emulator.
+
+    Time is cut into windows of window_frames emulated frames, counted from
+    reset_clock() (called when the emulator starts, so window edges fall on the
+    emulator's frame grid). Clients submit key presses during a window; when it
+    closes, the aggregated result is pressed for the whole of the next window and
+    released at its end. Nothing a client sends is injected directly.
+
+      anarchy    every distinct key pressed in the window is injected (deduplicated)
+      vote       one vote per client per window (latest wins); the plurality key wins
+      democracy  like vote, but the winner needs more than quorum of the votes cast,
+                 otherwise nothing is pressed
+
+    Each client has a token bucket (rate per second, burst), refilled lazily on
+    submit. submit() does a constant amount of work: a bucket update, a dict lookup
+    for the client's previous vote and a counter change. Tallies are bounded by the
+    number of key codes, so closing a window is constant work too, plus clearing the
+    per-window vote map.
+    """
+
+    def __init__(self, inject, mode='vote', window_frames=10, rate=10.0, burst=20, quorum=0.5):
+        if mode not in MODES:
+            raise ValueError(f'Unknown crowd mode {mode!r}, expected one of {MODES}')
+        self.inject = inject
+        self.mode = mode
+        self.window_frames = window_frames
+        self.rate = rate
+        self.burst = burst
+        self.quorum = quorum
+        self.window_seconds = window_frames / SPECTRUM_FRAME_RATE
+        self._epoch = time.monotonic()
+        self.window = 0
+        # client -> [tokens, last refill time]
+        self._buckets = {}
+        # client -> key voted this window (vote/democracy)
+        self._votes = {}
+        # key -> votes this window (anarchy: key -> presses)
+        self._tally = {}
+        self._held = ()
+        self._task = None
+        self._last_prune = self._epoch
+        self.stats = {
+            'submitted': 0,
+            'admitted': 0,
+            'rate_limited': 0,
+            'ignored': 0,
+            'windows': 0,
+            'injected': 0,
+            'no_quorum': 0,
+        }
+
+    def reset_clock(self):
+        self._epoch = time.monotonic()
+        self.window = 0
+        self._votes.clear()
+        self._tally.clear()
+
+    def current_frame(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return int((now - self._epoch) * SPECTRUM_FRAME_RATE)
+
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f'Unknown crowd mode {mode!r}, expected one of {MODES}')
+        if mode != self.mode:
+            logger.info(f'Crowd input mode: {self.mode} -> {mode}')
+            self.mode = mode
+            self._votes.clear()
+            self._tally.clear()
+
+    def submit(self, client, key, pressed=True, now=None):
+        """Offer one key event from client; returns False if it was not admitted"""
+        self.stats['submitted'] += 1
+        if not pressed:
+            # Releases are generated by the aggregator, not taken from clients
+            return True
+        key = str(key).upper()
+        if key not in INPUT_CODE_BY_NAME:
+            self.stats['ignored'] += 1
+            return False
+
+        if now is None:
+            now = time.monotonic()
+        self._advance(now)
+
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.stats['rate_limited'] += 1
+            return False
+        bucket[0] -= 1
+        self.stats['admitted'] += 1
+
+        tally = self._tally
+        if self.mode == 'anarchy':
+            tally[key] = tally.get(key, 0) + 1
+            return True
+        previous = self._votes.get(client)
+        if previous == key:
+            return True
+        if previous is not None:
+            tally[previous] -= 1
+        self._votes[client] = key
+        tally[key] = tally.get(key, 0) + 1
+        return True
+
+    def forget(self, client):
+        """Drop a disconnected client's bucket (its vote in the open window still counts)"""
+        self._buckets.pop(client, None)
+
+    def _advance(self, now):
+        window = int((now - self._epoch) / self.window_seconds)
+        while self.window < window:
+            self._close_window()
+            self.window += 1
+            if self.window < window and not self._held:
+                # Idle gap (or a stalled loop): the stale window's keys are released and nothing
+                # was collected since, so skip straight to the current window
+                self.window = window
+
+    def _close_window(self):
+        self.stats['windows'] += 1
+        tally = self._tally
+        if self.mode == 'anarchy':
+            winners = tuple(tally)
+        else:
+            winners = ()
+            if tally:
+                key, votes = max(tally.items(), key=lambda item: item[1])
+                if votes > 0:
+                    if self.mode == 'democracy' and votes <= self.quorum * len(self._votes):
+                        self.stats['no_quorum'] += 1
+                    else:
+                        winners = (key,)
+        self._tally = {}
+        self._votes.clear()
+
+        for key in self._held:
+            if key not in winners:
+                self.inject(key, False)
+        for key in winners:
+            if key not in self._held:
+                self.inject(key, True)
+                self.stats['injected'] += 1
+        self._held = winners
+
+    async def run(self):
+        """Close windows on time even when nobody is sending input"""
+        while True:
+            next_edge = self._epoch + (self.window + 1) * self.window_seconds
+            await asyncio.sleep(max(0, next_edge - time.monotonic()) + 0.0005)
+            now = time.monotonic()
+            self._advance(now)
+            if now - self._last_prune > 60:
+                self._prune(now)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+            logger.info(f'Crowd input: {self.mode} mode, {self.window_frames}-frame windows '
+                        f'({self.window_seconds * 1000:.0f} ms), {self.rate}/s per client (burst {self.burst})')
+
+    def _prune(self, now):
+        # Clients that connect through acceptor workers never call forget(); a bucket that
+        # has been full for a while is indistinguishable from a new one, so drop it
+        self._last_prune = now
+        idle = [client for client, (_, last) in self._buckets.items() if now - last > 60]
+        for client in idle:
+            del self._buckets[client]
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            mode=self.mode,
+            window_frames=self.window_frames,
+            window_ms=round(self.window_seconds * 1000, 1),
+            clients=len(self._buckets),
+            voters=len(self._votes),
+            held=list(self._held),
+        )
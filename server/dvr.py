@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from hls_playlist import render_playlist
+
+logger = logging.getLogger(__name__)
+
+
+class DVRSegment:
+    """A retained segment; dvr_id is a stable id that survives encoder restarts
+
+    discontinuity_sequence counts the discontinuities added before this segment, which is
+    the EXT-X-DISCONTINUITY-SEQUENCE of a playlist starting with it.
+    """
+
+    __slots__ = ('dvr_id', 'start', 'duration', 'size', 'discontinuity', 'discontinuity_sequence', 'sequence', 'uri')
+
+    def __init__(self, dvr_id, start, duration, size, discontinuity, discontinuity_sequence=0):
+        self.dvr_id = dvr_id
+        self.start = start
+        self.duration = duration
+        self.size = size
+        self.discontinuity = discontinuity
+        self.discontinuity_sequence = discontinuity_sequence
+        # Shape expected by render_playlist
+        self.sequence = dvr_id
+        self.uri = f'segments/{dvr_id}.ts'
+
+
+class SegmentIndex:
+    """Time-ordered index of retained segments.
+
+    Segments are appended at the live edge and evicted from the front. Start times are
+    kept in a parallel sorted list so a playback offset resolves with one bisect; the
+    evicted prefix is skipped with a head pointer and compacted occasionally.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._segments = []
+        self._head = 0
+        self.end = 0.0
+
+    def __len__(self):
+        return len(self._segments) - self._head
+
+    def append(self, segment):
+        self._starts.append(segment.start)
+        self._segments.append(segment)
+        self.end = segment.start + segment.duration
+
+    def first(self):
+        return self._segments[self._head] if len(self) else None
+
+    def pop_first(self):
+        segment = self._segments[self._head]
+        self._segments[self._head] = None
+        self._head += 1
+        if self._head > 1024 and self._head * 2 > len(self._segments):
+            del self._starts[:self._head]
+            del self._segments[:self._head]
+            self._head = 0
+        return segment
+
+    def find(self, timestamp):
+        """Position of the segment covering timestamp (clamped to the window)"""
+        pos = bisect.bisect_right(self._starts, timestamp, lo=self._head) - 1
+        return max(pos, self._head)
+
+    def stop(self):
+        """Position one past the live edge"""
+        return len(self._segments)
+
+    def at(self, position):
+        return self._segments[position]
+
+    def slice_from(self, position):
+        return self._segments[position:]
+
+    def duration(self):
+        first = self.first()
+        return self.end - first.start if first else 0.0
+
+
+class DVRStore:
+    """Rolling time-shift window with a RAM tier for recent segments and a disk tier behind it.
+
+    New segments land in RAM; once the RAM budget is exceeded the oldest are spilled to
+    disk. Anything older than the window, or beyond the disk budget, is evicted.
+    """
+
+    def __init__(self, disk_dir, window_seconds=7200, memory_budget=64 * 1024 * 1024,
+                 disk_budget=2 * 1024 * 1024 * 1024):
+        self.disk_dir = Path(disk_dir)
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.disk_dir.glob('*.ts'):
+            stale.unlink()
+        self.window_seconds = window_seconds
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+
+        self.index = SegmentIndex()
+        self.by_id = {}
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.target_duration = 2
+        self.evicted = 0
+        self.spilled = 0
+        self._next_id = 0
+        self._discontinuities = 0
+        self._lock = threading.Lock()
+
+    def on_segment(self, segment):
+        """PlaylistWatcher listener: copy a completed live segment into the window"""
+        try:
+            data = segment.path.read_bytes()
+        except FileNotFoundError:
+            logger.warning(f'DVR missed segment {segment.uri}, already deleted')
+            return
+        self.add(data, segment.duration, segment.discontinuity)
+
+    def add(self, data, duration, discontinuity=False):
+        with self._lock:
+            dvr_segment = DVRSegment(self._next_id, self.index.end, duration, len(data), discontinuity,
+                                     self._discontinuities)
+            self._next_id += 1
+            self._discontinuities += bool(discontinuity)
+            self.index.append(dvr_segment)
+            self.by_id[dvr_segment.dvr_id] = dvr_segment
+            self.memory[dvr_segment.dvr_id] = data
+            self.memory_bytes += len(data)
+            self.target_duration = max(self.target_duration, int(duration + 0.999))
+            self._enforce_budgets()
+            return dvr_segment
+
+    def _enforce_budgets(self):
+        while len(self.index) > 1 and (
+                self.index.duration() > self.window_seconds or self.disk_bytes > self.disk_budget):
+            self._evict(self.index.pop_first())
+
+        while self.memory_bytes > self.memory_budget and len(self.memory) > 1:
+            dvr_id, data = self.memory.popitem(last=False)
+            self.memory_bytes -= len(data)
+            (self.disk_dir / f'{dvr_id}.ts').write_bytes(data)
+            self.disk_bytes += len(data)
+            self.spilled += 1
+
+        while len(self.index) > 1 and self.disk_bytes > self.disk_budget:
+            self._evict(self.index.pop_first())
+
+    def _evict(self, segment):
+        del self.by_id[segment.dvr_id]
+        data = self.memory.pop(segment.dvr_id, None)
+        if data is not None:
+            self.memory_bytes -= len(data)
+        else:
+            (self.disk_dir / f'{segment.dvr_id}.ts').unlink(missing_ok=True)
+            self.disk_bytes -= segment.size
+        self.evicted += 1
+
+    def get(self, dvr_id):
+        with self._lock:
+            if dvr_id not in self.by_id:
+                return None
+            data = self.memory.get(dvr_id)
+            if data is not None:
+                return data
+            path = self.disk_dir / f'{dvr_id}.ts'
+        return path.read_bytes() if path.exists() else None
+
+    def window_playlist(self):
+        """Live playlist covering the whole retained window"""
+        return self.playlist_from(None)
+
+    def playlist_from(self, offset):
+        """Live playlist starting at offset seconds into the window, or behind live if negative
+
+        Eviction removes segments from the head, which an EVENT playlist may not do, so no
+        playlist type is given: the media sequence (the DVR id) advances as the window slides,
+        and the discontinuity sequence with every discontinuity that slides out.
+        """
+        with self._lock:
+            first = self.index.first()
+            if first is None:
+                return render_playlist([], self.target_duration, 0)
+            position = self.index.find(self._resolve(offset))
+            segments = self.index.slice_from(position)
+            target_duration = self.target_duration
+        return render_playlist(segments, target_duration,
+                               discontinuity_sequence=segments[0].discontinuity_sequence)
+
+    def _resolve(self, offset):
+        """Window timestamp for an offset: from the window start, or behind live if negative"""
+        first = self.index.first()
+        if offset is None or first is None:
+            return first.start if first else 0.0
+        return self.index.end + offset if offset < 0 else first.start + offset
+
+    def _covering(self, start, end):
+        if not len(self.index):
+            return []
+        position = self.index.find(start)
+        segments = []
+        while position < self.index.stop():
+            segment = self.index.at(position)
+            if segment.start >= end:
+                break
+            segments.append(segment)
+            position += 1
+        return segments
+
+    def covering(self, start, end):
+        """Retained segments overlapping [start, end) in window time"""
+        with self._lock:
+            return self._covering(start, end)
+
+    def clip_range(self, start, end):
+        """(window start, window end, covering segments) for offsets as in playlist_from
+
+        end None is the live edge. All three come from one view of the window, so a segment
+        added or evicted meanwhile cannot leave the range and its segments out of step.
+        """
+        with self._lock:
+            window_start = self._resolve(start)
+            window_end = self._resolve(end) if end is not None else self.index.end
+            return window_start, window_end, self._covering(window_start, window_end)
+
+    def segment_at(self, timestamp):
+        """Retained segment covering a window timestamp, for clip lookups"""
+        with self._lock:
+            if not len(self.index):
+                return None
+            return self.index.at(self.index.find(timestamp))
+
+    def metrics(self):
+        with self._lock:
+            first = self.index.first()
+            return {
+                'segments': len(self.index),
+                'window_seconds': self.window_seconds,
+                'retained_seconds': round(self.index.duration(), 3),
+                'window_start': first.start if first else None,
+                'window_end': self.index.end,
+                'memory_bytes': self.memory_bytes,
+                'memory_budget_bytes': self.memory_budget,
+                'memory_segments': len(self.memory),
+                'disk_bytes': self.disk_bytes,
+                'disk_budget_bytes': self.disk_budget,
+                'disk_segments': len(self.index) - len(self.memory),
+                'spilled_total': self.spilled,
+                'evicted_total': self.evicted,
+            }
@@ -1,18 +1,43 @@
 #!/usr/bin/env python3
 
 import asyncio
+import hmac
+import itertools
 import websockets
-import json
 import logging
 import subprocess
 import threading
 import time
 import os
 import signal
-import boto3
 from aiohttp import web
 from pathlib import Path
 from aiohttp.web import FileResponse
+import metrics
+import protocol
+import runtime
+from session_recorder import SessionRecorder
+from hls_playlist import PlaylistWatcher
+from dvr import DVRStore
+from upload_engine import UploadEngine
+from clip_export import ClipExporter
+from hls_publisher import HLSPublisher
+from local_s3 import LazyS3Client, LocalS3Client
+from broadcast_hub import BroadcastHub
+from cpu_placement import CPUPlacement
+from crowd_input import CrowdInput
+from encoder_monitor import EncoderMonitor
+from loop_monitor import LoopMonitor
+from encoder_autotune import EncoderAutotuner
+from fallback_slate import SlateCache
+import frame_capture
+from profiler import Profiler, ProfilerBusy
+from quality_governor import QualityGovernor
+from quality_profiles import (PROFILE_DIR, ProfileError, estimate, frame_socket, hls_command, load_profiles,
+                              rtmp_command, slate_hls_command, slate_rtmp_command)
+from rtmp_relay import RTMPRelay, load_destinations
+from startup_trace import trace as startup_trace
+from workers import IPCOwner, OWNER_HTTP_PORT, fork_workers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,33 +46,234 @@ logger = logging.getLogger(__name__)
 class SpectrumEmulator:
     def __init__(self):
         self.connected_clients = set()
+        self.hub = BroadcastHub(
+            max_queue=int(os.getenv('WS_MAX_QUEUE', '64')),
+            max_lag=float(os.getenv('WS_MAX_LAG', '10'))
+        )
+        self.loop = None
+        # Event loop lag sampling and blocked-callback stack capture (LOOP_MONITOR=0 disables)
+        self.loop_monitor = None
+        if os.getenv('LOOP_MONITOR', '1') == '1':
+            self.loop_monitor = LoopMonitor(
+                interval=float(os.getenv('LOOP_LAG_INTERVAL', '0.05')),
+                threshold=float(os.getenv('LOOP_STALL_THRESHOLD', '0.1'))
+            )
         self.emulator_process = None
         self.web_stream_process = None
         self.youtube_stream_process = None
         self.s3_upload_process = None
+        # Held while the emulator and its encoders are started or stopped (in executor threads)
+        self._process_lock = threading.RLock()
+        # /debug/profile is only served when DEBUG_TOKEN is set, and then only to requests carrying it
+        self.debug_token = os.getenv('DEBUG_TOKEN', '')
+        self.profiler = Profiler(hz=int(os.getenv('PROFILE_HZ', '100')))
+        # ffmpeg children report progress here; CPU/RSS of every child for /metrics
+        self.encoders = EncoderMonitor(
+            on_first_progress=lambda name: startup_trace.ready(f'{name}_encoder_progress'))
         self.stream_dir = Path('/tmp/stream')
         self.stream_dir.mkdir(exist_ok=True)
+        # Each web encoder writes its own playlist (live<generation>.m3u8), so a replacement
+        # can run alongside it; input timestamps count from here, so they join up
+        self._web_generation = 0
+        self.timeline_start = time.monotonic()
         
-        # Get configuration from environment
-        self.capture_size = os.getenv('CAPTURE_SIZE', '256x192')
-        self.capture_offset = os.getenv('CAPTURE_OFFSET', '0,0')
+        # Get configuration from environment (DISPLAY_SIZE is the Xvfb screen)
         self.display_size = os.getenv('DISPLAY_SIZE', '512x384')
         self.stream_bucket = os.getenv('STREAM_BUCKET', 'spectrum-emulator-stream-dev-043309319786')
         self.youtube_key = os.getenv('YOUTUBE_STREAM_KEY', '')
+        self.youtube_url = os.getenv('YOUTUBE_RTMP_URL', 'rtmp://a.rtmp.youtube.com/live2').rstrip('/')
+        # The RTMP encoder feeds a relay that forwards to YouTube and any RELAY_CONFIG destinations
+        self.relay_config = os.getenv('RELAY_CONFIG', '')
+        self.relay = None
+        self.stream_base_url = os.getenv(
+            'STREAM_BASE_URL', f'https://{self.stream_bucket}.s3.us-east-1.amazonaws.com/').rstrip('/') + '/'
+        self.start_snapshot = os.getenv('START_SNAPSHOT', '')
+        # CAPTURE_SOURCE=test_pattern or a recording of the display encodes that instead of
+        # starting FUSE (benchmarks, development without X)
+        self.capture_source = os.getenv('CAPTURE_SOURCE', 'emulator')
+        # While FUSE is down the outputs loop a pre-encoded slate (copy only) and FUSE is
+        # retried with backoff; FALLBACK_SLATE=0 live-encodes the test pattern instead
+        self.slates = None
+        if os.getenv('FALLBACK_SLATE', '1') == '1':
+            self.slates = SlateCache(os.getenv('SLATE_DIR', '/tmp/slates'))
+        self.fuse_retry = float(os.getenv('FUSE_RETRY_INTERVAL', '30'))
+        self.fuse_retry_max = float(os.getenv('FUSE_RETRY_MAX', '300'))
+        self.fallback_active = False
+        self._retry_delay = self.fuse_retry
+        self._retry_timer = None
         
-        # Enhanced streaming configuration
-        self.output_resolution = '1280x720'  # HD output for better quality
+        # Session recording (input log, optionally FUSE RZX for offline re-render)
+        self.session_recorder = None
+        if os.getenv('SESSION_RECORDING', '0') == '1':
+            self.session_recorder = SessionRecorder(
+                os.getenv('SESSION_DIR', '/tmp/sessions'),
+                rzx=os.getenv('SESSION_RZX', '1') == '1',
+                keep=int(os.getenv('SESSION_KEEP', '20'))
+            )
+        
+        # Crowd input for "viewers play" sessions (CROWD_MODE=anarchy|vote|democracy, off by default):
+        # key presses from all clients are aggregated per window and only the result is injected
+        self.crowd_input = None
+        crowd_mode = os.getenv('CROWD_MODE', 'off')
+        if crowd_mode != 'off':
+            self.crowd_input = CrowdInput(
+                self.inject_key,
+                mode=crowd_mode,
+                window_frames=int(os.getenv('CROWD_WINDOW_FRAMES', '10')),
+                rate=float(os.getenv('CROWD_RATE', '10')),
+                burst=int(os.getenv('CROWD_BURST', '20')),
+                quorum=float(os.getenv('CROWD_QUORUM', '0.5'))
+            )
+        self._client_ids = itertools.count(1)
+        
+        # Completed-segment notifications from the live playlist
+        self.playlist_watcher = PlaylistWatcher(self.stream_dir / 'live0.m3u8')
+        self.playlist_watcher.add_listener(lambda segment: startup_trace.ready('first_segment'))
+        
+        # DVR time-shift window (DVR_WINDOW seconds, 0 disables)
+        self.dvr = None
+        dvr_window = int(os.getenv('DVR_WINDOW', '0'))
+        if dvr_window > 0:
+            self.dvr = DVRStore(
+                os.getenv('DVR_DIR', '/tmp/dvr'),
+                window_seconds=dvr_window,
+                memory_budget=int(os.getenv('DVR_MEMORY_MB', '64')) * 1024 * 1024,
+                disk_budget=int(os.getenv('DVR_DISK_MB', '2048')) * 1024 * 1024
+            )
+            self.playlist_watcher.add_listener(self.dvr.on_segment)
+            logger.info(f'DVR enabled with a {dvr_window}s window')
+        
+        # Capture and encode settings come from a quality profile (quality_profiles/),
+        # switchable at runtime with POST /profile and adjustable with POST /encoder
+        self.profiles = load_profiles(os.getenv('QUALITY_PROFILE_DIR', PROFILE_DIR))
+        profile_name = os.getenv('QUALITY_PROFILE', 'standard')
+        if profile_name not in self.profiles:
+            raise ProfileError(f'Unknown QUALITY_PROFILE {profile_name!r} '
+                               f'(available: {", ".join(sorted(self.profiles))})')
+        self.profile = self.profiles[profile_name]
+        try:
+            self.profile.check_display(self.display_size)
+        except ProfileError as e:
+            logger.warning(f'{e}; capture will fail until DISPLAY_SIZE or the profile is fixed')
+        try:
+            self.check_capture(self.profile)
+        except ProfileError as e:
+            logger.warning(f'{e}; capturing on the timer clock instead')
+            self.profile = self.profile.with_overrides({'capture': {'clock': 'timer'}})
+        # Frame clock captures (capture.clock frame) by socket path, shared by both encoders
+        self.frame_captures = {}
+        # AUTOTUNE=cached applies x264 settings benchmarked earlier on this host type,
+        # run also benchmarks on a cache miss before the first start, off disables both
+        self.autotune = os.getenv('AUTOTUNE', 'cached')
+        self.autotuner = None
+        if self.autotune != 'off':
+            self.autotuner = EncoderAutotuner(
+                os.getenv('AUTOTUNE_CACHE', '/tmp/spectrum-autotune.json'),
+                clip=os.getenv('AUTOTUNE_CLIP') or None,
+                seconds=float(os.getenv('AUTOTUNE_SECONDS', '8')),
+                headroom=float(os.getenv('AUTOTUNE_HEADROOM', '0.3'))
+            )
+        # Encoders run below the emulator's priority; under sustained CPU pressure the governor
+        # steps them down a ladder of cheaper settings (QUALITY_GOVERNOR=0 disables it)
+        self.encoder_nice = int(os.getenv('ENCODER_NICE', '10'))
+        self.governor = None
+        if os.getenv('QUALITY_GOVERNOR', '1') == '1':
+            self.governor = QualityGovernor(
+                self.reconfigure, self.encoders, lambda: self.emulator_process,
+                interval=float(os.getenv('GOVERNOR_INTERVAL', '5'))
+            )
+        # CPU affinity, nice and I/O class per process role: CPU_PLACEMENT=latency isolates
+        # the emulator and audio on their own cores, density only deprioritises the encoders
+        self.placement = None
+        if os.getenv('CPU_PLACEMENT', 'latency') != 'off':
+            self.placement = CPUPlacement(
+                os.getenv('CPU_PLACEMENT', 'latency'), encoder_nice=self.encoder_nice,
+                interval=float(os.getenv('PLACEMENT_INTERVAL', '2')),
+                probe_period=0.02 if os.getenv('CPU_PLACEMENT_PROBE', '0') == '1' else None
+            )
         self.emulator_native_size = '256x192'  # ZX Spectrum native resolution
         
-        # Initialize S3 client
+        # Initialize S3 client (S3_LOCAL_ROOT selects a local directory stand-in,
+        # S3_ENDPOINT_URL an S3-compatible endpoint such as MinIO). boto3 is only imported
+        # and the client built on the first upload, off the start-up path.
         try:
-            self.s3_client = boto3.client('s3')
+            if os.getenv('S3_LOCAL_ROOT'):
+                self.s3_client = LocalS3Client(os.getenv('S3_LOCAL_ROOT'))
+            else:
+                self.s3_client = LazyS3Client(endpoint_url=os.getenv('S3_ENDPOINT_URL') or None)
             logger.info(f'S3 client initialized for bucket: {self.stream_bucket}')
         except Exception as e:
             logger.error(f'Failed to initialize S3 client: {e}')
             self.s3_client = None
         
-        logger.info(f'Emulator config: display={self.display_size}, output={self.output_resolution}')
+        self.hls_publisher = None
+        
+        # Background uploads for clips and archives
+        self.upload_engine = UploadEngine(self.s3_client, self.stream_bucket) if self.s3_client else None
+        self.clip_exporter = None
+        if self.dvr:
+            self.clip_exporter = ClipExporter(self.dvr, os.getenv('CLIP_DIR', '/tmp/clips'), self.upload_engine)
+        
+        logger.info(f'Emulator config: display={self.display_size}, profile={self.profile.name}, '
+                    f'output={self.output_resolution}@{self.profile.fps}')
+
+    def tuned(self, profile, benchmark=False):
+        """profile with this host's autotuned encoder settings, benchmarking on a miss if asked"""
+        if not self.autotuner:
+            return profile
+        outputs = ['web', 'youtube'] if self.youtube_key or self.relay_config else ['web']
+        if self.autotuner.cached(profile, outputs) or not benchmark:
+            return self.autotuner.apply(profile, outputs)
+        try:
+            tuned, _ = self.autotuner.tune(profile, outputs, self.display_size)
+            return tuned
+        except (OSError, RuntimeError) as e:
+            logger.warning(f'Autotune failed, keeping the {profile.name} profile settings: {e}')
+            return profile
+
+    def _source(self, test_pattern):
+        if self.capture_source == 'test_pattern':
+            return 'test_pattern'
+        if self.capture_source != 'emulator':
+            return 'replay'
+        if not test_pattern:
+            return 'x11'
+        return 'slate' if self.slates else 'test_pattern'
+
+    def _slate(self, output):
+        """Cached slate for output, or None to live-encode the test pattern instead"""
+        try:
+            return self.slates.get(self.profile, output, self.display_size)
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            logger.error(f'No {output} fallback slate, encoding the test pattern live: {e}')
+            return None
+
+    def check_capture(self, profile):
+        """Raise ProfileError if profile captures on the frame clock and python-xlib is missing"""
+        if profile.config['capture']['clock'] == 'frame' and not frame_capture.available():
+            raise ProfileError(f'{profile.name}: capture.clock "frame" needs python-xlib')
+
+    def _start_frame_capture(self):
+        """Start the frame clock capture the current profile's encoders read, if it uses one"""
+        if self.profile.config['capture']['clock'] != 'frame':
+            return
+        path = frame_socket(self.profile, self.display_size)
+        capture = self.frame_captures.get(path)
+        if capture and capture.running:
+            return
+        capture = frame_capture.FrameCapture(path, self.profile.capture_size(self.display_size),
+                                             self.profile.config['capture']['offset'],
+                                             divisor=self.profile.frame_divisor)
+        capture.start()
+        self.frame_captures[path] = capture
+
+    def _stop_frame_captures(self, keep=None):
+        for path in [path for path in self.frame_captures if path != keep]:
+            self.frame_captures.pop(path).stop()
+
+    @property
+    def output_resolution(self):
+        return self.profile.output_resolution(self.display_size)
 
     def test_sdl_environment(self):
         """Test if SDL2 environment is properly configured"""
@@ -85,18 +311,22 @@ class SpectrumEmulator:
             return False
 
     def start_emulator(self):
+        """Start FUSE and the outputs; this blocks for several seconds, so run it off the loop"""
+        with self._process_lock:
+            return self._start_emulator()
+
+    def _start_emulator(self):
         try:
             if self.emulator_process:
                 logger.info('Emulator already running')
                 return True
 
             # Test SDL environment first
-            if not self.test_sdl_environment():
+            with startup_trace.span('sdl_environment_check'):
+                sdl_ok = self.test_sdl_environment()
+            if not sdl_ok:
                 logger.error('SDL environment test failed, cannot start emulator')
-                # Start streaming anyway with test pattern
-                self.start_web_stream_with_test_pattern()
-                self.start_youtube_stream()
-                self.start_s3_upload()
+                self._fallback()
                 return False
 
             logger.info('Starting FUSE ZX Spectrum emulator with improved SDL configuration')
@@ -110,18 +340,27 @@ class SpectrumEmulator:
                 'XAUTHORITY': '/tmp/.Xauth'
             })
             
+            fuse_args = []
+            if self.session_recorder:
+                fuse_args = self.session_recorder.start(self.start_snapshot or None)
+            elif self.start_snapshot:
+                fuse_args = ['--snapshot', self.start_snapshot]
+            
             # Start FUSE with better error handling and proper window size
-            self.emulator_process = subprocess.Popen([
-                'fuse-sdl', 
-                '--machine', '48', 
-                '--graphics-filter', 'none', 
-                '--sound', 
-                '--no-confirm-actions',
-                '--full-screen'  # This should make it use the full display
-            ], env=fuse_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with startup_trace.span('fuse_spawn'):
+                self.emulator_process = subprocess.Popen([
+                    'fuse-sdl', 
+                    '--machine', '48', 
+                    '--graphics-filter', 'none', 
+                    '--sound', 
+                    '--no-confirm-actions',
+                    '--full-screen'  # This should make it use the full display
+                ] + fuse_args, env=fuse_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.encoders.watch('emulator', self.emulator_process)
             
             # Wait a bit and check if FUSE started successfully
-            time.sleep(5)  # Give FUSE more time to initialize
+            with startup_trace.span('fuse_init_wait'):
+                time.sleep(5)  # Give FUSE more time to initialize
             
             if self.emulator_process.poll() is not None:
                 # Process has already terminated
@@ -130,173 +369,235 @@ class SpectrumEmulator:
                 logger.error(f'STDOUT: {stdout.decode()}')
                 logger.error(f'STDERR: {stderr.decode()}')
                 self.emulator_process = None
+                if self.session_recorder:
+                    self.session_recorder.stop()
                 
-                # Start streaming with test pattern instead
-                logger.info('Starting streaming with test pattern due to FUSE failure')
-                self.start_web_stream_with_test_pattern()
-                self.start_youtube_stream()
-                self.start_s3_upload()
+                self._fallback()
                 return False
             else:
                 logger.info('FUSE emulator started successfully')
-                time.sleep(3)  # Give it more time to initialize display
+                startup_trace.ready('emulator_running')
+                if self.session_recorder:
+                    self.session_recorder.mark_running()
+                if self.crowd_input:
+                    # Crowd windows count emulated frames from here
+                    self.crowd_input.reset_clock()
+                with startup_trace.span('display_settle_wait'):
+                    time.sleep(3)  # Give it more time to initialize display
                 
-                # Start streaming with proper scaling
-                self.start_web_stream_scaled()
-                self.start_youtube_stream()
-                self.start_s3_upload()
+                # Start streaming with proper scaling (replacing the slate after a retry)
+                recovered = self.fallback_active
+                self.fallback_active = False
+                self._retry_delay = self.fuse_retry
+                self.start_outputs(test_pattern=False)
                 logger.info('ZX Spectrum emulator started successfully with scaled streaming outputs')
+                if recovered and self.loop:
+                    self.loop.call_soon_threadsafe(self.broadcast_status, {
+                        'running': True,
+                        'message': 'Emulator recovered',
+                        'output_resolution': self.output_resolution
+                    })
                 return True
             
         except Exception as e:
             logger.error(f'Failed to start emulator: {e}')
             self.stop_emulator()
-            # Fallback to test pattern streaming
-            self.start_web_stream_with_test_pattern()
+            self._fallback()
+            return False
+
+    def _fallback(self):
+        """Stream the slate (or test pattern) and schedule another FUSE attempt"""
+        if self.fallback_active:
+            self._retry_delay = min(self._retry_delay * 2, self.fuse_retry_max)
+        else:
+            logger.info('Streaming the fallback slate until FUSE starts')
+            self.start_outputs(test_pattern=True)
+            self.fallback_active = True
+        if self.fuse_retry > 0:
+            logger.info(f'Retrying FUSE in {self._retry_delay:.0f}s')
+            self._retry_timer = threading.Timer(self._retry_delay, self._retry_emulator)
+            self._retry_timer.daemon = True
+            self._retry_timer.start()
+
+    def _retry_emulator(self):
+        with self._process_lock:
+            if self.emulator_process or not self.fallback_active:
+                return
+            logger.info('Retrying FUSE start')
+            self._start_emulator()
+
+    def start_outputs(self, test_pattern=False):
+        """Start the web HLS encoder, the YouTube encoder and the S3 publisher"""
+        with startup_trace.span('web_encoder_spawn', test_pattern=test_pattern):
+            self.start_web_stream(test_pattern)
+        with startup_trace.span('youtube_encoder_spawn'):
             self.start_youtube_stream()
+        with startup_trace.span('s3_publisher_start'):
             self.start_s3_upload()
-            return False
 
-    def start_web_stream_scaled(self):
-        """Start streaming with proper scaling from full display"""
-        try:
-            logger.info(f'Starting scaled web HLS stream: {self.display_size} -> {self.output_resolution}')
-            stream_file = self.stream_dir / 'stream.m3u8'
-            
-            # Capture the full virtual display and scale it up with proper filtering
-            self.web_stream_process = subprocess.Popen([
-                'ffmpeg', '-y',
-                '-f', 'x11grab',
-                '-video_size', self.display_size,  # Capture full display (512x384)
-                '-framerate', '25',
-                '-i', ':99.0+0,0',  # Capture from top-left of full display
-                '-f', 'pulse',
-                '-i', 'default',
-                # Video processing with scaling
-                '-vf', f'scale={self.output_resolution}:flags=neighbor',  # Pixel-perfect scaling for retro look
-                '-c:v', 'libx264',
-                '-preset', 'fast',  # Better quality than ultrafast
-                '-tune', 'zerolatency',
-                '-g', '50',
-                '-keyint_min', '25',
-                '-sc_threshold', '0',
-                '-b:v', '2000k',  # Higher bitrate for better quality
-                '-maxrate', '2500k',
-                '-bufsize', '5000k',
-                '-pix_fmt', 'yuv420p',  # Ensure compatibility
-                # Audio
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-                # HLS output
-                '-f', 'hls',
-                '-hls_time', '2',
-                '-hls_list_size', '5',
-                '-hls_flags', 'delete_segments',
-                str(stream_file)
-            ])
-            logger.info(f'Scaled web HLS streaming started: {self.display_size} -> {self.output_resolution}')
-            
-        except Exception as e:
-            logger.error(f'Failed to start scaled web stream: {e}')
+    def _signature(self, source):
+        """What the web player's decoder sees. x264 writes the reference frame and B-frame
+        settings (preset, tune) into the SPS, so only bitrate, CRF and threading changes
+        keep it; segments from two encoders join without a discontinuity only if it is equal."""
+        web = self.profile.config['web']
+        return (source, self.output_resolution, self.profile.frame_rate, web['preset'], web['tune'], web['profile'],
+                web['level'], tuple(sorted((self.profile.config['audio'] or {}).items())))
 
-    def start_web_stream_with_test_pattern(self):
-        """Start streaming with a test pattern instead of emulator capture"""
+    def _replace(self, name, process, previous, switched, timeout):
+        """Stop previous once switched is set; returns False, stopping process instead, if it fails first"""
+        deadline = time.monotonic() + timeout
+        while not switched.wait(0.25):
+            if process.poll() is not None or time.monotonic() > deadline:
+                logger.error(f'Replacement {name} encoder did not take over '
+                             f'({"exited" if process.poll() is not None else "timed out"}), keeping the running one')
+                self._terminate(name, process)
+                return False
+        self._terminate(name, previous)
+        return True
+
+    def start_web_stream(self, test_pattern=False):
+        """Start the HLS encoder for the current quality profile, from the display or a test pattern.
+
+        A running encoder is replaced make-before-break: the new one writes its own
+        playlist alongside it, and the old one is stopped once the playlist watcher has
+        cut over at a segment boundary. Returns False if the replacement failed and the
+        old encoder is still running.
+        """
         try:
-            logger.info(f'Starting web HLS stream with scaled test pattern: {self.output_resolution}')
-            stream_file = self.stream_dir / 'stream.m3u8'
-            
-            # Create test pattern with ZX Spectrum aspect ratio, scaled to HD
-            self.web_stream_process = subprocess.Popen([
-                'ffmpeg', '-y',
-                '-f', 'lavfi',
-                '-i', f'testsrc2=size={self.output_resolution}:rate=25:duration=0',
-                '-f', 'lavfi', 
-                '-i', 'sine=frequency=1000:duration=0',
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-tune', 'zerolatency',
-                '-g', '50',
-                '-keyint_min', '25',
-                '-sc_threshold', '0',
-                '-b:v', '2000k',
-                '-maxrate', '2500k',
-                '-bufsize', '5000k',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-                '-f', 'hls',
-                '-hls_time', '2',
-                '-hls_list_size', '5',
-                '-hls_flags', 'delete_segments',
-                str(stream_file)
-            ])
-            logger.info(f'Scaled test pattern streaming started at {self.output_resolution}')
+            previous = self.web_stream_process
+            if previous and previous.poll() is not None:
+                previous = None
+            previous_child = self.encoders.child('web')
+            self._web_generation += 1
+            playlist = self.stream_dir / f'live{self._web_generation}.m3u8'
+            playlist.unlink(missing_ok=True)
+            source = self._source(test_pattern)
+            slate = self._slate('web') if source == 'slate' else None
+            offset = time.monotonic() - self.timeline_start
+            logger.info(f'Starting web HLS stream ({self.profile.name}, {source}): '
+                        f'{self.profile.capture_size(self.display_size)} -> {self.output_resolution}'
+                        f'{", alongside the running encoder" if previous else ""}')
+            if slate:
+                command = slate_hls_command(self.profile, slate, playlist, offset=offset)
+            else:
+                source = 'test_pattern' if source == 'slate' else source
+                if source == 'x11':
+                    self._start_frame_capture()
+                command = hls_command(self.profile, source, playlist, self.display_size, clip=self.capture_source,
+                                      offset=offset)
+            if previous:
+                switched = self.playlist_watcher.cut_over(playlist, self._signature(source))
+            else:
+                self.playlist_watcher.switch(playlist, self._signature(source))
+            process = self.encoders.spawn('web', command, expected_fps=self.profile.fps, nice=self.encoder_nice)
+            if previous:
+                timeout = self.profile.config['hls']['segment_seconds'] * 3 + 15
+                if not self._replace('web_stream', process, previous, switched, timeout):
+                    self.playlist_watcher.cancel_cut_over()
+                    self.encoders.reinstate(previous_child)
+                    return False
+            self.web_stream_process = process
+            # The generation before the previous one is no longer read by anyone
+            for stale in self.stream_dir.glob(f'live{self._web_generation - 2}[._]*'):
+                stale.unlink(missing_ok=True)
+            logger.info(f'Web HLS streaming started at {self.output_resolution}@{self.profile.fps}')
+            return True
             
         except Exception as e:
-            logger.error(f'Failed to start web stream with test pattern: {e}')
+            logger.error(f'Failed to start web stream: {e}')
+            return False
 
     def start_youtube_stream(self):
-        if not self.youtube_key:
-            logger.info('No YouTube stream key provided, skipping YouTube streaming')
-            return
+        """Start the RTMP encoder into the relay; a running one is replaced once the relay has
+        switched to the new encoder's stream, so the destinations keep their connections"""
+        if not self.youtube_key and not self.relay_config:
+            logger.info('No YouTube stream key or RELAY_CONFIG provided, skipping RTMP streaming')
+            return True
             
         try:
             logger.info(f'Starting YouTube RTMP stream at {self.output_resolution}')
+            if self.relay is None:
+                self.relay = RTMPRelay(load_destinations(
+                    self.relay_config or None,
+                    youtube_url=f'{self.youtube_url}/{self.youtube_key}' if self.youtube_key else None,
+                    max_backlog_seconds=float(os.getenv('RELAY_BACKLOG_SECONDS', '10')),
+                    max_backlog_bytes=int(os.getenv('RELAY_BACKLOG_MB', '16')) * 1024 * 1024
+                ))
+                self.relay.start()
             
             # Use test pattern if emulator failed, otherwise use X11 capture
-            if self.emulator_process is None:
-                # Test pattern for YouTube
-                input_args = [
-                    '-f', 'lavfi',
-                    '-i', f'testsrc2=size={self.output_resolution}:rate=25:duration=0',
-                    '-f', 'lavfi', 
-                    '-i', 'sine=frequency=1000:duration=0'
-                ]
+            previous = self.youtube_stream_process
+            if previous and previous.poll() is not None:
+                previous = None
+            previous_child = self.encoders.child('youtube')
+            source = self._source(test_pattern=self.emulator_process is None)
+            url = self.relay.url
+            slate = self._slate('youtube') if source == 'slate' else None
+            if slate:
+                command = slate_rtmp_command(self.profile, slate, url)
             else:
-                # Scaled X11 capture for YouTube
-                input_args = [
-                    '-f', 'x11grab',
-                    '-video_size', self.display_size,
-                    '-framerate', '25',
-                    '-i', ':99.0+0,0',
-                    '-f', 'pulse',
-                    '-i', 'default'
-                ]
-            
-            # Build FFmpeg command with scaling
-            ffmpeg_cmd = ['ffmpeg', '-y'] + input_args
-            
-            # Add scaling if capturing from X11
-            if self.emulator_process is not None:
-                ffmpeg_cmd.extend([
-                    '-vf', f'scale={self.output_resolution}:flags=neighbor'
-                ])
-            
-            # Add encoding settings
-            ffmpeg_cmd.extend([
-                '-c:v', 'libx264',
-                '-preset', 'veryfast',
-                '-tune', 'zerolatency',
-                '-g', '50',
-                '-keyint_min', '25',
-                '-sc_threshold', '0',
-                '-b:v', '2500k',  # Higher bitrate for YouTube
-                '-maxrate', '3000k',
-                '-bufsize', '6000k',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-                '-f', 'flv',
-                f'rtmp://a.rtmp.youtube.com/live2/{self.youtube_key}'
-            ])
-            
-            self.youtube_stream_process = subprocess.Popen(ffmpeg_cmd)
+                source = 'test_pattern' if source == 'slate' else source
+                if source == 'x11':
+                    self._start_frame_capture()
+                command = rtmp_command(self.profile, source, url, self.display_size, clip=self.capture_source)
+            switched = self.relay.expect_switch() if previous else None
+            process = self.encoders.spawn('youtube', command, expected_fps=self.profile.fps,
+                                          nice=self.encoder_nice)
+            if previous and not self._replace('youtube_stream', process, previous, switched, 15):
+                self.encoders.reinstate(previous_child)
+                return False
+            self.youtube_stream_process = process
             logger.info(f'YouTube RTMP streaming started at {self.output_resolution}')
+            return True
             
         except Exception as e:
             logger.error(f'Failed to start YouTube stream: {e}')
+            return False
+
+    def reconfigure(self, profile):
+        """Move the running encoders to profile while the game keeps running.
+
+        Each encoder is replaced make-before-break (see start_web_stream). Raises
+        RuntimeError if the web encoder could not be replaced, with the previous
+        profile still in effect.
+        """
+        with self._process_lock:
+            previous, self.profile = self.profile, profile
+            logger.info(f'Reconfiguring encoders: {previous.name} -> {profile.name}')
+            if self.web_stream_process and not self.start_web_stream(test_pattern=self.emulator_process is None):
+                self.profile = previous
+                raise RuntimeError('The new web encoder failed to start, the previous settings are still live')
+            if self.youtube_stream_process and not self.start_youtube_stream():
+                raise RuntimeError('The new RTMP encoder failed to start, it keeps the previous settings')
+            # The replaced encoders may have read another capture area or rate
+            self._stop_frame_captures(keep=frame_socket(profile, self.display_size))
+        return profile
+
+    def set_profile(self, name):
+        """Switch quality profile; the running encoders are replaced live, FUSE keeps running.
+
+        Raises ProfileError for an unknown profile or one whose capture area does not fit
+        the X display, RuntimeError if the encoders could not be replaced.
+        """
+        profile = self.profiles.get(name)
+        if profile is None:
+            raise ProfileError(f'Unknown quality profile {name!r} (available: {", ".join(sorted(self.profiles))})')
+        profile.check_display(self.display_size)
+        self.check_capture(profile)
+        return self.choose_profile(self.tuned(profile))
+
+    def base_profile(self):
+        """The operator's profile: the governor's top rung rather than the rung it is running"""
+        if self.governor and self.governor.ladder:
+            return self.governor.ladder[0][1]
+        return self.profile
+
+    def choose_profile(self, profile):
+        """Operator's choice of profile: applied live, and the governor's new top rung"""
+        if self.governor:
+            self.governor.rebase(profile)
+            return profile
+        return self.reconfigure(profile)
 
     def start_s3_upload(self):
         if not self.s3_client:
@@ -304,49 +605,61 @@ class SpectrumEmulator:
             return
             
         try:
-            logger.info('Starting S3 upload process for HLS segments')
-            
-            def upload_worker():
-                while True:
-                    try:
-                        # Upload HLS playlist
-                        playlist_file = self.stream_dir / 'stream.m3u8'
-                        if playlist_file.exists():
-                            self.s3_client.upload_file(
-                                str(playlist_file),
-                                self.stream_bucket,
-                                'hls/stream.m3u8',
-                                ExtraArgs={'ContentType': 'application/vnd.apple.mpegurl', 'CacheControl': 'no-cache'}
-                            )
-                        
-                        # Upload segment files
-                        for segment_file in self.stream_dir.glob('*.ts'):
-                            try:
-                                self.s3_client.upload_file(
-                                    str(segment_file),
-                                    self.stream_bucket,
-                                    f'hls/{segment_file.name}',
-                                    ExtraArgs={'ContentType': 'video/mp2t', 'CacheControl': 'max-age=10'}
-                                )
-                            except Exception as e:
-                                # Ignore individual segment upload errors
-                                pass
-                        
-                        time.sleep(1)
-                        
-                    except Exception as e:
-                        logger.error(f'S3 upload error: {e}')
-                        time.sleep(5)
-            
-            upload_thread = threading.Thread(target=upload_worker, daemon=True)
-            upload_thread.start()
-            logger.info('S3 upload worker started')
+            if self.hls_publisher is None:
+                logger.info('Starting S3 publisher for HLS segments')
+                self.hls_publisher = HLSPublisher(
+                    self.s3_client,
+                    self.stream_bucket,
+                    'stream.m3u8',
+                    window_size=self.profile.config['hls']['list_size'],
+                    delete_grace=float(os.getenv('HLS_DELETE_GRACE', '30')),
+                    delete_interval=float(os.getenv('HLS_DELETE_INTERVAL', '1')),
+                    content_addressed=os.getenv('HLS_CONTENT_ADDRESSED', '0') == '1'
+                )
+                self.playlist_watcher.add_listener(self.hls_publisher.on_segment)
+                self.hls_publisher.add_listener(self.notify_segment)
+            self.hls_publisher.start()
             
         except Exception as e:
             logger.error(f'Failed to start S3 upload: {e}')
 
+    def notify_segment(self, segment, key):
+        """Publisher listener: tell subscribed players a new segment is live"""
+        if not self.loop or not self.hub.has_audience('segments'):
+            return
+        # Players only need the newest segment, so an unsent notification is replaced
+        self.loop.call_soon_threadsafe(self.hub.publish, 'segments', {
+            'type': 'segment',
+            'sequence': segment.sequence,
+            'url': self.stream_base_url + key,
+            'duration': segment.duration
+        }, 'segment')
+
+    def broadcast_status(self, message):
+        """Tell every connected client about an emulator state change"""
+        self.hub.publish('status', dict(message, type='emulator_status'), 'emulator_status')
+
     def stop_emulator(self):
+        with self._process_lock:
+            self._stop_emulator()
+
+    def _terminate(self, name, process):
         try:
+            process.terminate()
+            process.wait(timeout=5)
+            logger.info(f'{name} process stopped')
+        except subprocess.TimeoutExpired:
+            process.kill()
+            logger.info(f'{name} process killed')
+        except Exception as e:
+            logger.error(f'Error stopping {name}: {e}')
+
+    def _stop_emulator(self):
+        try:
+            if self._retry_timer:
+                self._retry_timer.cancel()
+            self.fallback_active = False
+            self._retry_delay = self.fuse_retry
             processes = [
                 ('emulator', self.emulator_process),
                 ('web_stream', self.web_stream_process),
@@ -356,124 +669,495 @@ class SpectrumEmulator:
             
             for name, process in processes:
                 if process:
-                    try:
-                        process.terminate()
-                        process.wait(timeout=5)
-                        logger.info(f'{name} process stopped')
-                    except subprocess.TimeoutExpired:
-                        process.kill()
-                        logger.info(f'{name} process killed')
-                    except Exception as e:
-                        logger.error(f'Error stopping {name}: {e}')
+                    self._terminate(name, process)
             
             self.emulator_process = None
             self.web_stream_process = None
             self.youtube_stream_process = None
             self.s3_upload_process = None
+            self._stop_frame_captures()
+            
+            if self.session_recorder:
+                self.session_recorder.stop()
             
         except Exception as e:
             logger.error(f'Error stopping emulator: {e}')
 
-    async def handle_websocket(self, websocket, path):
+    async def handle_websocket(self, websocket, path=None):
         self.connected_clients.add(websocket)
-        logger.info('New WebSocket client connected')
+        client = next(self._client_ids)
+        # Binary or JSON frames, as negotiated in the handshake (see protocol.py)
+        codec = protocol.Codec(websocket.subprotocol)
+        self.hub.register(websocket, topics=('status',), codec=codec)
+        logger.info(f'New WebSocket client connected ({codec.name} protocol)')
+        
+        async def reply(message):
+            await websocket.send(codec.encode(message))
         
         try:
             # Send initial status
-            await websocket.send(json.dumps({
-                'type': 'connected',
-                'emulator_running': self.emulator_process is not None,
-                'output_resolution': self.output_resolution
-            }))
+            await reply(self.connected_message())
             
             async for message in websocket:
                 try:
-                    data = json.loads(message)
-                    logger.info(f'Received message: {data}')
-                    
-                    if data.get('type') == 'start_emulator':
-                        success = self.start_emulator()
-                        await websocket.send(json.dumps({
-                            'type': 'emulator_status',
-                            'running': success,
-                            'message': 'Emulator started successfully' if success else 'Emulator failed to start, using test pattern',
-                            'output_resolution': self.output_resolution
-                        }))
-                    
-                    elif data.get('type') == 'stop_emulator':
-                        self.stop_emulator()
-                        await websocket.send(json.dumps({
-                            'type': 'emulator_status',
-                            'running': False,
-                            'message': 'Emulator stopped'
-                        }))
-                    
-                    elif data.get('type') == 'status':
-                        await websocket.send(json.dumps({
-                            'type': 'emulator_status',
-                            'running': self.emulator_process is not None,
-                            'message': 'Status check',
-                            'output_resolution': self.output_resolution
-                        }))
-                    
-                    elif data.get('type') == 'key_press':
-                        # Handle key press (to be implemented)
-                        key = data.get('key')
-                        logger.info(f'Key press: {key}')
+                    batch = codec.decode(message)
+                except protocol.ProtocolError as e:
+                    logger.warning(f'Invalid frame received: {e}')
+                    continue
+                
+                for data in batch:
+                    try:
+                        logger.debug(f'Received message: {data}')
+                        
+                        if data.get('type') == 'subscribe_segments':
+                            self.hub.subscribe(websocket, 'segments')
+                            await reply(self.segment_subscription_message())
+                        
+                        elif data.get('type') == 'unsubscribe_segments':
+                            self.hub.unsubscribe(websocket, 'segments')
                         
-                except json.JSONDecodeError:
-                    logger.error(f'Invalid JSON received: {message}')
-                except Exception as e:
-                    logger.error(f'Error handling message: {e}')
+                        else:
+                            await self.handle_message(data, reply, client=client)
+                    
+                    except websockets.exceptions.ConnectionClosed:
+                        raise
+                    except Exception as e:
+                        logger.error(f'Error handling message: {e}')
                     
         except websockets.exceptions.ConnectionClosed:
             logger.info('WebSocket client disconnected')
         finally:
             self.connected_clients.discard(websocket)
+            self.hub.unregister(websocket)
+            if self.crowd_input:
+                self.crowd_input.forget(client)
+
+    def connected_message(self):
+        return {
+            'type': 'connected',
+            'emulator_running': self.emulator_process is not None,
+            'output_resolution': self.output_resolution
+        }
+
+    def segment_subscription_message(self):
+        return {
+            'type': 'segment_subscription',
+            'subscribed': True,
+            'publishing': self.hls_publisher is not None
+        }
+
+    async def handle_message(self, data, reply, client=None):
+        """Handle a control or input message; reply sends a response to its sender only.
+
+        Messages arrive here from local connections and, in multi-worker mode, forwarded
+        from acceptor processes, so nothing here may depend on the connection itself;
+        client is an opaque id for the sender, used only for per-client input limits.
+        """
+        # State changes go to every client (including the sender) through the hub
+        if data.get('type') == 'start_emulator':
+            success = await asyncio.get_running_loop().run_in_executor(None, self.start_emulator)
+            self.broadcast_status({
+                'running': success,
+                'message': 'Emulator started successfully' if success else 'Emulator failed to start, using test pattern',
+                'output_resolution': self.output_resolution
+            })
+        
+        elif data.get('type') == 'stop_emulator':
+            await asyncio.get_running_loop().run_in_executor(None, self.stop_emulator)
+            self.broadcast_status({
+                'running': False,
+                'message': 'Emulator stopped'
+            })
+        
+        elif data.get('type') == 'hello':
+            # Greeting for connections accepted by another worker process
+            await reply(self.connected_message())
+        
+        elif data.get('type') == 'status':
+            await reply({
+                'type': 'emulator_status',
+                'running': self.emulator_process is not None,
+                'message': 'Status check',
+                'output_resolution': self.output_resolution
+            })
+        
+        elif data.get('type') in ('key_press', 'joystick'):
+            if data.get('type') == 'key_press':
+                key = str(data.get('key'))
+            else:
+                key = f"JOY_{str(data.get('direction')).upper()}"
+            if self.crowd_input:
+                self.crowd_input.submit(client, key, data.get('pressed', True))
+            else:
+                self.inject_key(key, data.get('pressed', True))
+
+    def inject_key(self, key, pressed=True):
+        """The single path by which input reaches the emulator session"""
+        # Handle key press (to be implemented)
+        logger.debug(f'Key {"press" if pressed else "release"}: {key}')
+        if self.session_recorder:
+            self.session_recorder.record_key(key, pressed)
 
     async def health_check(self, request):
         return web.Response(text=f'OK - Emulator server running at {self.output_resolution}', status=200)
 
     async def start_streaming(self, request):
-        success = self.start_emulator()
+        success = await asyncio.get_running_loop().run_in_executor(None, self.start_emulator)
         return web.json_response({
             'success': success,
             'message': 'Streaming started' if success else 'Streaming started with test pattern',
             'output_resolution': self.output_resolution
         })
 
-    def run(self):
-        # Auto-start emulator
+    async def dvr_playlist(self, request):
+        if not self.dvr:
+            return web.Response(text='DVR disabled', status=404)
+        offset = request.query.get('offset')
+        try:
+            playlist = self.dvr.playlist_from(float(offset) if offset is not None else None)
+        except ValueError:
+            return web.Response(text=f'Invalid offset: {offset}', status=400)
+        return web.Response(text=playlist, content_type='application/vnd.apple.mpegurl',
+                            headers={'Cache-Control': 'no-cache'})
+
+    async def dvr_segment(self, request):
+        if not self.dvr:
+            return web.Response(text='DVR disabled', status=404)
+        data = await asyncio.get_running_loop().run_in_executor(None, self.dvr.get,
+                                                                int(request.match_info['dvr_id']))
+        if data is None:
+            return web.Response(text='Segment no longer in DVR window', status=404)
+        return web.Response(body=data, content_type='video/mp2t',
+                            headers={'Cache-Control': 'max-age=31536000, immutable'})
+
+    async def dvr_metrics(self, request):
+        if not self.dvr:
+            return web.json_response({'enabled': False})
+        return web.json_response(dict(self.dvr.metrics(), enabled=True))
+
+    async def hls_metrics(self, request):
+        if not self.hls_publisher:
+            return web.json_response({'enabled': False})
+        return web.json_response(dict(
+            self.hls_publisher.metrics(),
+            enabled=True,
+            s3_requests=getattr(self.s3_client, 'request_counts', None),
+            segment_subscribers=self.hub.subscriber_count('segments')
+        ))
+
+    async def relay_metrics(self, request):
+        if not self.relay:
+            return web.json_response({'enabled': False})
+        return web.json_response(dict(self.relay.metrics(), enabled=True))
+
+    async def ws_metrics(self, request):
+        return web.json_response(dict(self.hub.metrics(), protocol=protocol.stats))
+
+    async def prometheus_metrics(self, request):
+        """Prometheus text exposition: encoders, child processes and the publishing pipeline"""
+        families = self.encoders.families()
+        if self.loop_monitor:
+            families += self.loop_monitor.families()
+        hub = self.hub.metrics()
+        families += [
+            metrics.gauge('spectrum_ws_clients', 'Connected WebSocket clients', hub['clients']),
+            metrics.counter('spectrum_ws_messages_delivered_total', 'Broadcast messages delivered', hub['delivered']),
+            metrics.counter('spectrum_ws_messages_dropped_total', 'Broadcast messages dropped for slow clients',
+                            hub['dropped']),
+            metrics.gauge('spectrum_ws_queued_messages', 'Broadcast messages waiting in client queues',
+                          hub['queued_messages']),
+            metrics.gauge('spectrum_fallback_active', 'Whether the outputs show the fallback instead of FUSE',
+                          int(self.fallback_active)),
+        ]
+        if self.hls_publisher:
+            hls = self.hls_publisher.metrics()
+            families += [
+                metrics.gauge('spectrum_hls_publish_queue_depth', 'Completed segments waiting to be published',
+                              hls['queue_depth']),
+                metrics.counter('spectrum_hls_segment_uploads_total', 'Segments uploaded', hls['segment_uploads']),
+                metrics.counter('spectrum_hls_upload_errors_total', 'Failed segment or playlist uploads',
+                                hls['upload_errors']),
+            ]
+        if self.relay:
+            families += self.relay.families()
+        if self.governor:
+            families += self.governor.families()
+        if self.placement:
+            families += self.placement.families()
+        for capture in list(self.frame_captures.values()):
+            families += capture.families()
+        if self.upload_engine:
+            families.append(metrics.gauge('spectrum_upload_queue_depth', 'Clip and archive uploads in flight',
+                                          self.upload_engine.queue_depth()))
+        return web.Response(body=metrics.render(families).encode('utf-8'),
+                            headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    async def loop_metrics(self, request):
+        if not self.loop_monitor:
+            return web.json_response({'error': 'Loop monitor is off (LOOP_MONITOR=0)'}, status=404)
+        return web.json_response(self.loop_monitor.metrics())
+
+    async def debug_profile(self, request):
+        """GET /debug/profile?seconds=N[&mode=memory][&threads=a,b] - collapsed stacks or a tracemalloc diff"""
+        if not self.debug_token:
+            return web.Response(text='Profiling disabled (set DEBUG_TOKEN)', status=404)
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ') or request.query.get('token', '')
+        if not hmac.compare_digest(supplied.encode(), self.debug_token.encode()):
+            return web.Response(text='Forbidden', status=403)
+        try:
+            seconds = float(request.query.get('seconds', '10'))
+            limit = int(request.query.get('limit', '50'))
+        except ValueError:
+            return web.Response(text='seconds and limit must be numbers', status=400)
+        mode = request.query.get('mode', 'cpu')
+        loop = asyncio.get_running_loop()
+        try:
+            if mode == 'memory':
+                group_by = request.query.get('group', 'lineno')
+                if group_by not in ('lineno', 'filename', 'traceback'):
+                    return web.Response(text='group must be lineno, filename or traceback', status=400)
+                body = await loop.run_in_executor(None, self.profiler.memory, seconds, limit, group_by)
+                filename = 'memory-diff.txt'
+            elif mode == 'cpu':
+                threads = set(request.query['threads'].split(',')) if request.query.get('threads') else None
+                body = await loop.run_in_executor(None, self.profiler.cpu, seconds, threads)
+                filename = 'profile.folded'
+            else:
+                return web.Response(text='mode must be cpu or memory', status=400)
+        except ProfilerBusy as e:
+            return web.Response(text=str(e), status=409)
+        return web.Response(text=body, content_type='text/plain',
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    async def crowd_status(self, request):
+        if not self.crowd_input:
+            return web.json_response({'error': 'Crowd input is off (set CROWD_MODE)'}, status=404)
+        return web.json_response(self.crowd_input.metrics())
+
+    async def crowd_set_mode(self, request):
+        if not self.crowd_input:
+            return web.json_response({'error': 'Crowd input is off (set CROWD_MODE)'}, status=404)
+        try:
+            body = await request.json()
+            self.crowd_input.set_mode(body.get('mode'))
+        except (ValueError, AttributeError) as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response(self.crowd_input.metrics())
+
+    async def profile_status(self, request):
+        return web.json_response({
+            'current': self.profile.name,
+            'display': self.display_size,
+            'encoders': {output: {key: self.profile.config[output][key]
+                                  for key in ('preset', 'tune', 'threads', 'slices')}
+                         for output in ('web', 'youtube')},
+            'profiles': {
+                name: dict(profile.describe(self.display_size), estimate=estimate(profile, self.display_size))
+                for name, profile in sorted(self.profiles.items())
+            },
+        })
+
+    async def profile_switch(self, request):
+        try:
+            name = (await request.json()).get('name')
+        except (ValueError, AttributeError):
+            return web.json_response({'error': 'Expected {"name": "<profile>"}'}, status=400)
+        if name not in self.profiles:
+            return web.json_response({'error': f'Unknown quality profile {name!r}',
+                                      'available': sorted(self.profiles)}, status=404)
+        try:
+            profile = await asyncio.get_running_loop().run_in_executor(None, self.set_profile, name)
+        except ProfileError as e:
+            return web.json_response({'error': str(e)}, status=409)
+        except RuntimeError as e:
+            return web.json_response({'error': str(e)}, status=500)
+        self.broadcast_status({
+            'running': self.emulator_process is not None,
+            'message': f'Quality profile switched to {profile.name}',
+            'output_resolution': self.output_resolution
+        })
+        return web.json_response(profile.describe(self.display_size))
+
+    async def encoder_status(self, request):
+        return web.json_response({
+            'profile': self.profile.name,
+            'settings': {section: self.profile.config[section]
+                         for section in ('capture', 'scale', 'audio', 'hls', 'web', 'youtube')},
+            'cutover': self.playlist_watcher.stats,
+            'relay_switches': self.relay.stats['input_switches'] if self.relay else None,
+            'frame_capture': {path: capture.metrics() for path, capture in self.frame_captures.items()},
+        })
+
+    async def governor_status(self, request):
+        if not self.governor:
+            return web.json_response({'enabled': False})
+        return web.json_response(dict(self.governor.metrics(), enabled=True))
+
+    async def placement_status(self, request):
+        if not self.placement:
+            return web.json_response({'enabled': False})
+        return web.json_response(dict(self.placement.metrics(), enabled=True))
+
+    async def encoder_reconfigure(self, request):
+        """POST /encoder {"profile": <name>, "web": {"bitrate": "1500k"}, ...}
+
+        Settings on top of a profile (default: the current one, before any quality governor
+        step-down), applied to the running encoders without stopping the game; see reconfigure().
+        """
+        try:
+            body = await request.json()
+            overrides = dict(body)
+        except (ValueError, TypeError):
+            return web.json_response({'error': 'Expected {"profile": "<name>", "<section>": {...}}'}, status=400)
+        name = overrides.pop('profile', None)
+        base = self.profiles.get(name) if name else self.base_profile()
+        if base is None:
+            return web.json_response({'error': f'Unknown quality profile {name!r}',
+                                      'available': sorted(self.profiles)}, status=404)
+        try:
+            profile = base.with_overrides(overrides)
+            profile.check_display(self.display_size)
+            self.check_capture(profile)
+        except ProfileError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.choose_profile, profile)
+        except RuntimeError as e:
+            return web.json_response({'error': str(e)}, status=500)
+        self.broadcast_status({
+            'running': self.emulator_process is not None,
+            'message': f'Encoders reconfigured ({profile.name})',
+            'output_resolution': self.output_resolution
+        })
+        return await self.encoder_status(request)
+
+    async def create_clip(self, request):
+        if not self.clip_exporter:
+            return web.json_response({'error': 'Clips need the DVR window (set DVR_WINDOW)'}, status=409)
+        try:
+            body = await request.json() if request.can_read_body else {}
+            start = body.get('start')
+            end = body.get('end')
+            if body.get('last') is not None:
+                start, end = -float(body['last']), None
+            clip = await self.clip_exporter.export(
+                start=float(start) if start is not None else None,
+                end=float(end) if end is not None else None,
+                fmt=body.get('format', 'mp4'),
+                archive=bool(body.get('archive', False))
+            )
+        except (ValueError, TypeError) as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f'Clip export failed: {e}')
+            return web.json_response({'error': str(e)}, status=500)
+        return web.json_response(clip)
+
+    async def clip_status(self, request):
+        clip = self.clip_exporter.status(request.match_info['clip_id']) if self.clip_exporter else None
+        if not clip:
+            return web.json_response({'error': 'Unknown clip'}, status=404)
+        return web.json_response(clip)
+
+    def auto_start(self):
         logger.info('Auto-starting emulator with scaling...')
-        success = self.start_emulator()
+        # Before anything is encoding, so a benchmark has the CPUs to itself
+        with startup_trace.span('encoder_autotune'):
+            self.profile = self.tuned(self.profile, benchmark=self.autotune == 'run')
+        if self.governor:
+            self.governor.rebase(self.profile)
+            self.governor.start()
+        if self.capture_source != 'emulator':
+            logger.info(f'CAPTURE_SOURCE={self.capture_source}, encoding it instead of starting FUSE')
+            self.start_outputs(test_pattern=self.capture_source == 'test_pattern')
+            return
+        with startup_trace.span('start_emulator'):
+            success = self.start_emulator()
         if success:
             logger.info(f'Emulator auto-started successfully at {self.output_resolution}')
         else:
             logger.info(f'Emulator auto-start failed, using test pattern at {self.output_resolution}')
-        
+
+    def run(self, workers=1):
         # Start HTTP server for health checks
         app = web.Application()
         app.router.add_get('/health', self.health_check)
+        app.router.add_get('/metrics', self.prometheus_metrics)
         app.router.add_post('/start_streaming', self.start_streaming)
+        app.router.add_get('/dvr/playlist.m3u8', self.dvr_playlist)
+        app.router.add_get(r'/dvr/segments/{dvr_id:\d+}.ts', self.dvr_segment)
+        app.router.add_get('/dvr/metrics', self.dvr_metrics)
+        app.router.add_get('/hls/metrics', self.hls_metrics)
+        app.router.add_get('/ws/metrics', self.ws_metrics)
+        app.router.add_get('/relay/metrics', self.relay_metrics)
+        app.router.add_get('/loop/metrics', self.loop_metrics)
+        app.router.add_get('/debug/profile', self.debug_profile)
+        app.router.add_get('/crowd', self.crowd_status)
+        app.router.add_post('/crowd', self.crowd_set_mode)
+        app.router.add_get('/profile', self.profile_status)
+        app.router.add_post('/profile', self.profile_switch)
+        app.router.add_get('/encoder', self.encoder_status)
+        app.router.add_post('/encoder', self.encoder_reconfigure)
+        app.router.add_get('/governor', self.governor_status)
+        app.router.add_get('/placement', self.placement_status)
+        app.router.add_post('/clips', self.create_clip)
+        app.router.add_get('/clips/{clip_id}', self.clip_status)
+        self.playlist_watcher.start()
+        
+        # With several workers every process binds the public ports with SO_REUSEPORT and
+        # the kernel spreads connections across them; this process owns the session
+        reuse_port = workers > 1
         
         async def init_app():
             runner = web.AppRunner(app)
             await runner.setup()
-            site = web.TCPSite(runner, '0.0.0.0', 8080)
+            site = web.TCPSite(runner, '0.0.0.0', 8080, reuse_port=reuse_port)
             await site.start()
+            if reuse_port:
+                # Acceptor workers proxy session HTTP requests here
+                await web.TCPSite(runner, '127.0.0.1', OWNER_HTTP_PORT).start()
             logger.info('HTTP server started on port 8080')
         
         # Start WebSocket server
         async def start_servers():
-            await init_app()
-            await websockets.serve(self.handle_websocket, '0.0.0.0', 8765)
+            self.loop = asyncio.get_running_loop()
+            if self.loop_monitor:
+                self.loop_monitor.start()
+            if self.placement:
+                self.placement.start()
+            with startup_trace.span('http_bind'):
+                await init_app()
+            startup_trace.ready('http_listening')
+            if reuse_port:
+                await IPCOwner(self.handle_message, self.hub,
+                               subscription_message=self.segment_subscription_message).start()
+            if self.crowd_input:
+                self.crowd_input.start()
+            with startup_trace.span('ws_bind'):
+                await websockets.serve(self.handle_websocket, '0.0.0.0', 8765, reuse_port=reuse_port,
+                                       **protocol.serve_options())
+            startup_trace.ready('ws_listening')
+            # The emulator and encoders come up after the ports are bound, so /health and
+            # WebSocket clients are answered while FUSE is still initialising
+            self.loop.run_in_executor(None, self.auto_start)
             logger.info(f'WebSocket server started on port 8765 - ZX Spectrum Emulator ready with {self.output_resolution} scaling!')
         
-        # Run the event loop
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(start_servers())
-        loop.run_forever()
+        async def serve_forever():
+            await start_servers()
+            await asyncio.Event().wait()
+        
+        # Run the event loop (uvloop and orjson when available, see runtime.py)
+        logger.info(f'Runtime: {runtime.describe()}')
+        runtime.run(serve_forever())
 
 if __name__ == '__main__':
-    emulator = SpectrumEmulator()
-    emulator.run()
+    workers = int(os.getenv('WORKERS', '1'))
+    if workers > 1:
+        # Fork acceptors before any threads or event loop exist in this process
+        fork_workers(workers - 1)
+    startup_trace.start()
+    startup_trace.since_process_start('interpreter_and_imports')
+    with startup_trace.span('server_init'):
+        emulator = SpectrumEmulator()
+    emulator.run(workers=workers)
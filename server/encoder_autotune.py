@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Picks x264 preset, tune and thread/slice settings that this host can sustain in real time.
+
+For each encoder output of a quality profile, the tuner encodes a recorded Spectrum
+clip with candidate settings (same scaler, bitrate and GOP as production, output
+discarded) as fast as the host allows. It measures the encode speed and x264's own
+SSIM. The slowest preset where some candidate still reaches the required speed is
+found by binary search over the presets, on the assumption that x264 gets slower
+preset by preset. Among that preset's passing candidates the one with the best SSIM wins.
+
+The required speed is (1 + headroom) times the number of encoders that will run at
+once, because the encoders share the host's CPUs. Results are cached per host (CPU
+model and the CPUs this container may use, including a cgroup quota) and per
+profile, so the benchmark runs once per task size.
+
+    python3 encoder_autotune.py record clip.mkv --seconds 20   # capture the live display
+    python3 encoder_autotune.py tune --profile hq --clip clip.mkv
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import re
+import resource
+import subprocess
+import time
+from pathlib import Path
+
+from quality_profiles import OUTPUTS, PRESETS, X_DISPLAY, QualityProfile, encode_args
+
+logger = logging.getLogger(__name__)
+
+SSIM_PATTERN = re.compile(r'SSIM Mean Y:\s*([0-9.]+)')
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def available_cpus():
+    """CPUs this process may use: the cgroup quota if there is one, else the affinity mask"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    try:
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if quota != 'max':
+            cpus = min(cpus, int(quota) / int(period))
+    except (OSError, ValueError):
+        try:
+            quota = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').read_text())
+            period = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us').read_text())
+            if quota > 0:
+                cpus = min(cpus, quota / period)
+        except (OSError, ValueError):
+            pass
+    return round(cpus, 2)
+
+
+def host_key():
+    return f'{cpu_model()} | {available_cpus():g} cpus'
+
+
+class EncoderAutotuner:
+    """Benchmarks encoder settings on this host and remembers the winners.
+
+    clip: a recording of the emulator display at the profile's capture size (see
+    record()); without one a lavfi test pattern is used, which compresses very
+    differently and only gives a rough answer.
+    """
+
+    def __init__(self, cache_path, clip=None, seconds=8.0, headroom=0.3, max_preset='slow'):
+        self.cache_path = Path(cache_path)
+        self.clip = clip
+        self.seconds = seconds
+        self.headroom = headroom
+        self.presets = PRESETS[:PRESETS.index(max_preset) + 1]
+
+    def _profile_key(self, profile, outputs):
+        digest = hashlib.sha1(json.dumps(profile.config, sort_keys=True).encode()).hexdigest()[:12]
+        return f'{profile.name}:{digest}:{"+".join(outputs)}'
+
+    def _load_cache(self):
+        try:
+            return json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, key, entry):
+        cache = self._load_cache()
+        cache.setdefault(host_key(), {})[key] = entry
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(cache, indent=2))
+        os.replace(tmp, self.cache_path)
+
+    def cached(self, profile, outputs):
+        return self._load_cache().get(host_key(), {}).get(self._profile_key(profile, outputs))
+
+    def apply(self, profile, outputs):
+        """profile with this host's cached settings for outputs, or profile itself if untuned"""
+        entry = self.cached(profile, outputs)
+        if not entry:
+            return profile
+        return profile.with_overrides(entry['settings'])
+
+    def _input_args(self, profile, display_size):
+        if self.clip and Path(self.clip).exists():
+            return ['-stream_loop', '-1', '-i', str(self.clip)]
+        size = profile.capture_size(display_size)
+        return ['-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={profile.fps}']
+
+    def _candidates(self, profile, output, preset):
+        base_tune = profile.config[output]['tune']
+        tunes = [base_tune, f'{base_tune},animation' if base_tune else 'animation']
+        cpus = max(1, math.ceil(available_cpus()))
+        threads = [{'threads': None, 'slices': None}]
+        if cpus > 1:
+            threads.append({'threads': cpus, 'slices': None})
+            if base_tune and 'zerolatency' in base_tune:
+                # zerolatency uses sliced threads; one slice per CPU keeps them all busy
+                threads.append({'threads': cpus, 'slices': cpus})
+        else:
+            threads = [{'threads': 1, 'slices': None}]
+        return [dict(preset=preset, tune=tune, **thread) for tune in tunes for thread in threads]
+
+    def benchmark(self, profile, output, settings, display_size):
+        """Encode self.seconds of the clip with settings; returns speed, CPU seconds and SSIM"""
+        candidate = profile.with_overrides({output: settings})
+        # The clip is video only, and audio costs the same whatever the x264 settings
+        silent = QualityProfile(profile.name, dict(candidate.config, audio=None))
+        command = (['ffmpeg', '-hide_banner', '-nostdin'] + self._input_args(profile, display_size)
+                   + ['-t', str(self.seconds)] + encode_args(silent, output, 'x11')
+                   + ['-ssim', '1', '-f', 'null', '-'])
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        started = time.monotonic()
+        result = subprocess.run(command, capture_output=True, text=True, timeout=self.seconds * 20 + 30)
+        elapsed = time.monotonic() - started
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if result.returncode != 0:
+            raise RuntimeError(f'ffmpeg exited with {result.returncode}: {result.stderr.strip()[-500:]}')
+        match = SSIM_PATTERN.search(result.stderr)
+        return dict(
+            settings,
+            speed=round(self.seconds / elapsed, 3),
+            cpu_seconds=round((after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime), 3),
+            ssim=float(match.group(1)) if match else None,
+        )
+
+    def tune_output(self, profile, output, required_speed, display_size):
+        trials = []
+
+        def passing(preset):
+            results = []
+            for settings in self._candidates(profile, output, preset):
+                try:
+                    trial = self.benchmark(profile, output, settings, display_size)
+                except (RuntimeError, subprocess.TimeoutExpired) as e:
+                    logger.warning(f'Autotune {output} {settings}: {e}')
+                    continue
+                logger.info(f'Autotune {output}: {settings} -> {trial["speed"]}x, SSIM {trial["ssim"]}')
+                trials.append(trial)
+                results.append(trial)
+            return [trial for trial in results if trial['speed'] >= required_speed]
+
+        # Binary search for the slowest preset with a passing candidate
+        low, high = 0, len(self.presets) - 1
+        best = []
+        while low <= high:
+            middle = (low + high) // 2
+            found = passing(self.presets[middle])
+            if found:
+                best = found
+                low = middle + 1
+            else:
+                high = middle - 1
+
+        if best:
+            choice = max(best, key=lambda trial: (trial['ssim'] or 0, trial['speed']))
+        elif trials:
+            choice = max(trials, key=lambda trial: trial['speed'])
+            logger.warning(f'Autotune {output}: nothing reaches {required_speed}x on this host, '
+                           f'using the fastest candidate ({choice["speed"]}x)')
+        else:
+            raise RuntimeError(f'Autotune {output}: every benchmark failed')
+        settings = {key: choice[key] for key in ('preset', 'tune', 'threads', 'slices')}
+        return settings, choice, trials
+
+    def tune(self, profile, outputs, display_size):
+        """Benchmark outputs of profile, cache the winners and return the tuned profile"""
+        required_speed = round((1 + self.headroom) * len(outputs), 3)
+        logger.info(f'Autotuning {profile.name} ({", ".join(outputs)}) on {host_key()}: '
+                    f'need {required_speed}x real time per encoder')
+        started = time.monotonic()
+        entry = {'settings': {}, 'measured': {}, 'required_speed': required_speed,
+                 'clip': str(self.clip) if self.clip else None, 'at': time.time()}
+        for output in outputs:
+            settings, choice, trials = self.tune_output(profile, output, required_speed, display_size)
+            entry['settings'][output] = settings
+            entry['measured'][output] = {'choice': choice, 'trials': trials}
+        entry['seconds'] = round(time.monotonic() - started, 1)
+        self._store(self._profile_key(profile, outputs), entry)
+        logger.info(f'Autotune {profile.name} done in {entry["seconds"]}s: {entry["settings"]}')
+        return profile.with_overrides(entry['settings']), entry
+
+
+def record(path, seconds, display_size, fps=25):
+    """Capture the emulator display losslessly, as the clip for later tuning runs"""
+    subprocess.run(['ffmpeg', '-y', '-hide_banner', '-f', 'x11grab', '-video_size', display_size,
+                    '-framerate', str(fps), '-i', f'{X_DISPLAY}.0', '-t', str(seconds),
+                    '-c:v', 'ffv1', str(path)], check=True)
+
+
+def main():
+    import argparse
+    from quality_profiles import PROFILE_DIR, load_profiles
+
+    parser = argparse.ArgumentParser(description='x264 settings this host can sustain in real time')
+    parser.add_argument('--display', default=os.getenv('DISPLAY_SIZE', '512x384'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    rec = commands.add_parser('record', help='record a clip of the live display')
+    rec.add_argument('path')
+    rec.add_argument('--seconds', type=float, default=20)
+    tune = commands.add_parser('tune', help='benchmark and cache settings for a profile')
+    tune.add_argument('--profile', default=os.getenv('QUALITY_PROFILE', 'standard'))
+    tune.add_argument('--profile-dir', default=os.getenv('QUALITY_PROFILE_DIR', PROFILE_DIR))
+    tune.add_argument('--outputs', default='web,youtube', help='encoders that run at once')
+    tune.add_argument('--clip', default=os.getenv('AUTOTUNE_CLIP'))
+    tune.add_argument('--cache', default=os.getenv('AUTOTUNE_CACHE', '/tmp/spectrum-autotune.json'))
+    tune.add_argument('--seconds', type=float, default=float(os.getenv('AUTOTUNE_SECONDS', '8')))
+    tune.add_argument('--headroom', type=float, default=float(os.getenv('AUTOTUNE_HEADROOM', '0.3')))
+    tune.add_argument('--max-preset', default='slow', choices=PRESETS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'record':
+        record(args.path, args.seconds, args.display)
+        return
+    outputs = [output for output in args.outputs.split(',') if output in OUTPUTS]
+    profile = load_profiles(args.profile_dir)[args.profile]
+    tuner = EncoderAutotuner(args.cache, clip=args.clip, seconds=args.seconds, headroom=args.headroom,
+                             max_preset=args.max_preset)
+    _, entry = tuner.tune(profile, outputs, args.display)
+    print(json.dumps({'host': host_key(), 'profile': profile.name, **entry}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
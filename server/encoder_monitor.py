@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+import psutil
+
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+STDERR_TAIL_LINES = 20
+
+
+def _number(value, suffix=''):
+    """ffmpeg progress values look like '25.03', '1.01x', '1999.6kbits/s' or 'N/A'"""
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _count(value):
+    number = _number(value)
+    return None if number is None else int(number)
+
+
+class ChildProcess:
+    """A supervised child: its psutil handle and, for encoders, the latest progress block"""
+
+    def __init__(self, name, process, expected_fps=None):
+        self.name = name
+        self.process = process
+        self.expected_fps = expected_fps
+        self.started = time.monotonic()
+        self.progress = {}
+        self.progress_at = None
+        self.first_progress = None
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        try:
+            self.ps = psutil.Process(process.pid)
+            self.ps.cpu_percent(None)
+        except psutil.Error:
+            self.ps = None
+
+    @property
+    def running(self):
+        return self.process.poll() is None
+
+    def update(self, block):
+        now = time.monotonic()
+        out_time = _number(block.get('out_time_us'))
+        progress = {
+            'frame': _count(block.get('frame')),
+            'fps': _number(block.get('fps')),
+            'speed': _number(block.get('speed'), 'x'),
+            'bitrate_kbps': _number(block.get('bitrate'), 'kbits/s'),
+            'total_size': _count(block.get('total_size')),
+            'out_time': out_time / 1e6 if out_time is not None else None,
+            'dup_frames': _count(block.get('dup_frames')),
+            'drop_frames': _count(block.get('drop_frames')),
+        }
+        if self.first_progress is None and progress['out_time'] is not None:
+            self.first_progress = (now, progress['out_time'])
+        self.progress = progress
+        self.progress_at = now
+
+    def lag(self):
+        """Seconds the encoder has fallen behind the wall clock since its first progress block"""
+        if not self.first_progress or self.progress.get('out_time') is None:
+            return None
+        first_at, first_out = self.first_progress
+        return max(0.0, (self.progress_at - first_at) - (self.progress['out_time'] - first_out))
+
+    def resources(self):
+        if not self.ps or not self.running:
+            return None
+        try:
+            with self.ps.oneshot():
+                times = self.ps.cpu_times()
+                return {
+                    'cpu_percent': self.ps.cpu_percent(None),
+                    'cpu_seconds': times.user + times.system,
+                    'rss_bytes': self.ps.memory_info().rss,
+                }
+        except psutil.Error:
+            return None
+
+
+class EncoderMonitor:
+    """Starts ffmpeg children with a machine-readable progress channel and keeps their state.
+
+    spawn() adds '-progress pipe:1 -nostats' to the command. Each child gets a reader
+    thread that parses the key=value progress blocks from stdout as they arrive, and one
+    that drains stderr into a short tail, logged at error level if the child exits
+    abnormally. Other children (the emulator) can be registered with watch() for
+    CPU/RSS only. families() renders everything for the /metrics endpoint.
+    on_first_progress(name) is called from the reader thread when a child reports its
+    first progress block, i.e. once it is actually encoding.
+    """
+
+    def __init__(self, on_first_progress=None):
+        self.children = {}
+        self.on_first_progress = on_first_progress
+        self._lock = threading.Lock()
+
+    def spawn(self, name, command, expected_fps=None, nice=0, **popen_kwargs):
+        command = [command[0], '-progress', 'pipe:1', '-nostats'] + list(command[1:])
+        if nice:
+            # Below the emulator's priority, so it gets its CPU share before the encoders. nice(1)
+            # sets it before exec, so every encoder thread inherits it; setpriority() on the pid
+            # afterwards would only reach the main thread on Linux, and a preexec_fn is not safe
+            # in a server with threads.
+            command = ['nice', '-n', str(nice)] + command
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   stdin=subprocess.DEVNULL, **popen_kwargs)
+        child = ChildProcess(name, process, expected_fps)
+        with self._lock:
+            self.children[name] = child
+        threading.Thread(target=self._read_progress, args=(child,), name=f'progress-{name}', daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(child,), name=f'stderr-{name}', daemon=True).start()
+        return process
+
+    def watch(self, name, process):
+        with self._lock:
+            self.children[name] = ChildProcess(name, process)
+
+    def processes(self):
+        with self._lock:
+            return list(self.children.values())
+
+    def child(self, name):
+        with self._lock:
+            return self.children.get(name)
+
+    def reinstate(self, child):
+        """Report child under its name again after spawn() replaced it, e.g. when the successor failed"""
+        with self._lock:
+            self.children[child.name] = child
+
+    def _read_progress(self, child):
+        block = {}
+        for raw in child.process.stdout:
+            key, _, value = raw.decode('utf-8', 'replace').strip().partition('=')
+            if key == 'progress':
+                first = child.progress_at is None
+                child.update(block)
+                block = {}
+                if first and self.on_first_progress:
+                    self.on_first_progress(child.name)
+                if value == 'end':
+                    break
+            elif key:
+                block[key] = value
+        returncode = child.process.wait()
+        if returncode not in (0, -15, 255):
+            # 255 is ffmpeg's exit status after SIGTERM/SIGINT
+            tail = '\n'.join(child.stderr_tail)
+            logger.error(f'{child.name} encoder exited with status {returncode}:\n{tail}')
+        else:
+            logger.info(f'{child.name} encoder exited with status {returncode}')
+
+    def _read_stderr(self, child):
+        for raw in child.process.stderr:
+            line = raw.decode('utf-8', 'replace').rstrip()
+            if line:
+                child.stderr_tail.append(line)
+                logger.debug(f'[{child.name}] {line}')
+
+    def snapshot(self):
+        with self._lock:
+            children = list(self.children.values())
+        return {
+            child.name: dict(child.progress, running=child.running, lag_seconds=child.lag(),
+                             resources=child.resources())
+            for child in children
+        }
+
+    def families(self):
+        """Prometheus metric families for every child plus this server process"""
+        with self._lock:
+            children = list(self.children.values())
+        now = time.monotonic()
+
+        up = gauge('spectrum_child_up', 'Whether the child process is running')
+        fps = gauge('spectrum_encoder_fps', 'Encoder output frames per second, as reported by ffmpeg')
+        speed = gauge('spectrum_encoder_speed', 'Encode speed relative to real time (below 1 falls behind)')
+        frames = counter('spectrum_encoder_frames_total', 'Frames encoded')
+        dropped = counter('spectrum_encoder_dropped_frames_total', 'Frames dropped by the encoder')
+        duplicated = counter('spectrum_encoder_duplicated_frames_total', 'Frames duplicated by the encoder')
+        bitrate = gauge('spectrum_encoder_bitrate_kbps', 'Average output bitrate in kbit/s')
+        output = counter('spectrum_encoder_output_bytes_total', 'Bytes written by the encoder')
+        lag = gauge('spectrum_encoder_lag_seconds', 'Seconds the encoder has fallen behind real time')
+        backlog = gauge('spectrum_encoder_queue_depth_frames',
+                        'Frames of input waiting behind the encoder (lag times nominal frame rate)')
+        age = gauge('spectrum_encoder_progress_age_seconds', 'Seconds since the last progress report')
+        cpu = gauge('spectrum_child_cpu_percent', 'CPU use since the previous scrape (100 = one core)')
+        cpu_seconds = counter('spectrum_child_cpu_seconds_total', 'User plus system CPU seconds')
+        rss = gauge('spectrum_child_rss_bytes', 'Resident set size')
+
+        for child in children:
+            labels = {'process': child.name}
+            up.add(child.running, **labels)
+            if child.progress_at is not None:
+                progress = child.progress
+                fps.add(progress['fps'], **labels)
+                speed.add(progress['speed'], **labels)
+                frames.add(progress['frame'], **labels)
+                dropped.add(progress['drop_frames'], **labels)
+                duplicated.add(progress['dup_frames'], **labels)
+                bitrate.add(progress['bitrate_kbps'], **labels)
+                output.add(progress['total_size'], **labels)
+                age.add(round(now - child.progress_at, 3), **labels)
+                seconds = child.lag()
+                lag.add(None if seconds is None else round(seconds, 3), **labels)
+                if seconds is not None and child.expected_fps:
+                    backlog.add(int(seconds * child.expected_fps), **labels)
+            resources = child.resources()
+            if resources:
+                cpu.add(resources['cpu_percent'], **labels)
+                cpu_seconds.add(round(resources['cpu_seconds'], 3), **labels)
+                rss.add(resources['rss_bytes'], **labels)
+
+        server = _server_process()
+        with server.oneshot():
+            times = server.cpu_times()
+            cpu.add(server.cpu_percent(None), process='server')
+            cpu_seconds.add(round(times.user + times.system, 3), process='server')
+            rss.add(server.memory_info().rss, process='server')
+
+        return [up, fps, speed, frames, dropped, duplicated, bitrate, output, lag, backlog, age,
+                cpu, cpu_seconds, rss]
+
+
+_server = None
+
+
+def _server_process():
+    global _server
+    if _server is None or _server.pid != os.getpid():
+        _server = psutil.Process()
+        _server.cpu_percent(None)
+    return _server
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Pre-encoded fallback slates, so a task whose emulator failed does not live-encode a test pattern.
+
+A slate is a few seconds of bars and a 1 kHz tone, encoded once with an output's
+quality profile settings (resolution, bitrate, GOP) and cached as MPEG-TS. While
+FUSE is down, the outputs loop it with -c copy, which costs a few percent of a core
+instead of a full libx264 encode. The slate covers whole HLS segments and GOPs, so
+the loop point always falls on a keyframe.
+
+Slates are generated on first use, or ahead of time (e.g. in the image build):
+
+    python3 fallback_slate.py --dir /app/slates            # every profile and output
+    python3 fallback_slate.py --dir /app/slates hq
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+from quality_profiles import OUTPUTS, slate_command
+
+logger = logging.getLogger(__name__)
+
+SLATE_SECONDS = 6  # Rounded up to whole HLS segments (web) or GOPs (youtube)
+SLATE_VERSION = 1  # Bump when the slate content changes
+
+
+def slate_seconds(profile, output):
+    unit = profile.config['hls']['segment_seconds'] if output == 'web' else profile.config[output]['gop_seconds']
+    return unit * math.ceil(SLATE_SECONDS / unit)
+
+
+class SlateCache:
+    """Slate files per (profile settings, output, resolution), generated at most once each"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def _command(self, profile, output, path, display_size):
+        return slate_command(profile, output, path, display_size, slate_seconds(profile, output))
+
+    def path_for(self, profile, output, display_size):
+        # Keyed on the encode command itself, so editing a profile produces a new slate
+        command = self._command(profile, output, 'slate.ts', display_size)
+        digest = hashlib.sha1(json.dumps([SLATE_VERSION, command]).encode()).hexdigest()[:12]
+        return self.directory / f'{profile.name}-{output}-{digest}.ts'
+
+    def get(self, profile, output, display_size):
+        """Path of the slate for output, encoding it first if it is not cached yet"""
+        path = self.path_for(profile, output, display_size)
+        with self._lock:
+            if path.exists():
+                return path
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            logger.info(f'Encoding {output} fallback slate for {profile.name}: {path}')
+            result = subprocess.run(self._command(profile, output, tmp, display_size),
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, timeout=300)
+            if result.returncode != 0:
+                tmp.unlink(missing_ok=True)
+                raise RuntimeError(f'slate encode exited with {result.returncode}: '
+                                   f'{result.stderr.decode("utf-8", "replace").strip()[-500:]}')
+            os.replace(tmp, path)
+            return path
+
+
+def main():
+    import argparse
+    from quality_profiles import PROFILE_DIR, load_profiles
+
+    parser = argparse.ArgumentParser(description='Pre-encode fallback slates')
+    parser.add_argument('profiles', nargs='*', help='default: every profile')
+    parser.add_argument('--dir', default=os.getenv('SLATE_DIR', '/tmp/slates'))
+    parser.add_argument('--profile-dir', default=os.getenv('QUALITY_PROFILE_DIR', PROFILE_DIR))
+    parser.add_argument('--display', default=os.getenv('DISPLAY_SIZE', '512x384'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profiles = load_profiles(args.profile_dir)
+    cache = SlateCache(args.dir)
+    for name in args.profiles or sorted(profiles):
+        for output in OUTPUTS:
+            print(cache.get(profiles[name], output, args.display))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Display capture locked to the emulator's frame clock instead of a timer.
+
+x11grab samples the display every 1/fps seconds of wall clock. The Spectrum draws a
+frame every 69888 T-states, 50.08 times a second, so a 25 or 60 fps timer keeps
+falling between frames: some are captured twice, some never, and scrolling judders.
+FrameCapture waits for X DAMAGE events instead. FUSE finishing a frame damages the
+display, and the capture area is read once the frame has been drawn. Emulated frame
+n is sent as raw video whose timestamps are exactly n / 50.08 s (ffmpeg -f rawvideo
+-framerate 15625/312 -i unix:<socket>); with divisor 2 only every second emulated
+frame is sent, for exactly 25.04 fps.
+
+Raw video has no timestamps of its own: ffmpeg stamps frame n at n / -framerate, so
+the video's timing comes from the frame count alone, never from when a frame was read.
+The repeats and drops below keep that count in step with the wall clock, within about
+a frame (clock_offset in metrics()).
+
+SDL draws a frame as a burst of rectangles, so a frame is read once damage has been
+quiet for QUIET of a period after the first event, and at the latest half a period
+after it. If FUSE's drawing pauses for longer than that mid-frame, or never pauses, a
+torn frame is still possible; frames read at the deadline are counted as unsettled.
+
+FUSE only redraws what changed, so a still picture produces no events. When no frame
+has arrived by half a period after its slot, the last frame is sent again. A frame
+arriving more than a frame ahead of the wall clock (FUSE catching up after a stall)
+is dropped, so the video stays in step with PulseAudio's wall-clock audio.
+
+Every connection receives the frames from the next one on, through its own queue. A
+consumer more than two seconds behind is disconnected. Needs python-xlib.
+"""
+
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+from metrics import counter, gauge
+from quality_profiles import SPECTRUM_FRAME_RATE, X_DISPLAY
+
+try:
+    from Xlib import X, display as xdisplay
+    from Xlib.ext import damage
+except ImportError:
+    xdisplay = None
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.99)
+QUIET = 0.15  # Of a frame period without damage before the area is read
+
+
+def available():
+    return xdisplay is not None
+
+
+class FrameCapture:
+    """Serves the frames of one capture area at the emulator's rate (or half) on a Unix socket"""
+
+    def __init__(self, path, size, offset, divisor=1, display=X_DISPLAY, max_backlog_seconds=2.0):
+        if not available():
+            raise RuntimeError('frame clock capture needs python-xlib')
+        self.path = path
+        self.width, self.height = (int(value) for value in size.split('x'))
+        self.x, self.y = (int(value) for value in offset.split(','))
+        self.divisor = divisor
+        self.display_name = display
+        self.period = 1 / float(SPECTRUM_FRAME_RATE)
+        self.max_backlog = int(max_backlog_seconds / (self.period * divisor))
+        self.intervals = deque(maxlen=500)
+        self.stats = {'frames': 0, 'repeated': 0, 'dropped': 0, 'unsettled': 0, 'sent': 0, 'connections': 0,
+                      'disconnected_slow': 0}
+        self.clock_offset = 0.0
+        self._subscribers = {}  # queue -> connection
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._display = None
+        self._server = None
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+    def start(self):
+        """Connect to the display and listen; raises if either fails, so no encoder is started"""
+        self._display = xdisplay.Display(self.display_name)
+        if not self._display.has_extension('DAMAGE'):
+            self._display.close()
+            raise RuntimeError(f'X display {self.display_name} has no DAMAGE extension')
+        self._display.damage_query_version()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        threading.Thread(target=self._accept, name='frame-capture-accept', daemon=True).start()
+        threading.Thread(target=self._run, name='frame-capture', daemon=True).start()
+        logger.info(f'Frame clock capture of {self.width}x{self.height}+{self.x},{self.y} at '
+                    f'{float(SPECTRUM_FRAME_RATE) / self.divisor:.3f} fps on {self.path}')
+
+    def stop(self):
+        self._stop.set()
+        if self._server:
+            self._server.close()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, {}
+        for connection in subscribers.values():
+            self._disconnect(connection)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            frames = queue.Queue(self.max_backlog)
+            with self._lock:
+                self._subscribers[frames] = connection
+            self.stats['connections'] += 1
+            threading.Thread(target=self._send, args=(connection, frames), name='frame-capture-send',
+                             daemon=True).start()
+
+    def _send(self, connection, frames):
+        try:
+            while True:
+                connection.sendall(frames.get())
+        except OSError:
+            pass  # The encoder exited, or was disconnected
+        finally:
+            with self._lock:
+                self._subscribers.pop(frames, None)
+            connection.close()
+
+    @staticmethod
+    def _disconnect(connection):
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _publish(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for frames, connection in subscribers:
+            try:
+                frames.put_nowait(frame)
+            except queue.Full:
+                with self._lock:
+                    self._subscribers.pop(frames, None)
+                self.stats['disconnected_slow'] += 1
+                logger.error(f'Frame capture consumer over {self.max_backlog} frames behind, disconnecting it')
+                self._disconnect(connection)
+        self.stats['sent'] += 1
+
+    def _wait_for_damage(self, event_base, timeout):
+        """True once the display has been damaged, False after timeout seconds without"""
+        deadline = time.monotonic() + timeout
+        while True:
+            while self._display.pending_events():
+                event = self._display.next_event()
+                if event.type == event_base + damage.DamageNotifyCode:
+                    return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                return False
+            select.select([self._display.fileno()], [], [], remaining)
+
+    def _wait_for_quiet(self, event_base, region):
+        """True once damage has stopped for QUIET of a period, False at half a period from now"""
+        deadline = time.monotonic() + self.period / 2
+        while True:
+            # With DamageReportNonEmpty only the first damage after a subtract raises an event
+            self._display.damage_subtract(region)
+            self._display.flush()
+            timeout = min(self.period * QUIET, deadline - time.monotonic())
+            if timeout <= 0:
+                return False
+            if not self._wait_for_damage(event_base, timeout):
+                return time.monotonic() < deadline
+
+    def _run(self):
+        try:
+            self._capture()
+        except Exception as e:
+            logger.error(f'Frame clock capture failed: {e}')
+        finally:
+            self.stop()
+            self._display.close()
+
+    def _capture(self):
+        display = self._display
+        root = display.screen().root
+        event_base = display.query_extension('DAMAGE').first_event
+        region = root.damage_create(damage.DamageReportNonEmpty)
+        display.flush()
+        last = None
+        last_event = None
+        index = 0
+        start = time.monotonic()
+        while not self._stop.is_set():
+            # Wall-clock time of the next frame's slot; waiting half a period past it
+            slot = start + index * self.period
+            damaged = self._wait_for_damage(event_base, slot + self.period / 2 - time.monotonic())
+            now = time.monotonic()
+            if damaged:
+                if not self._wait_for_quiet(event_base, region):
+                    self.stats['unsettled'] += 1
+                image = root.get_image(self.x, self.y, self.width, self.height, X.ZPixmap, 0xffffffff)
+                if last_event is not None:
+                    self.intervals.append(now - last_event)
+                last_event = now
+                self.stats['frames'] += 1
+                last = image.data
+                if index > (now - start) / self.period + 1:
+                    self.stats['dropped'] += 1
+                    continue
+            elif last is None:
+                # Nothing drawn yet; start the timeline at the first frame
+                start = time.monotonic()
+                continue
+            else:
+                self.stats['repeated'] += 1
+            if index % self.divisor == 0:
+                self._publish(last)
+            index += 1
+            self.clock_offset = index - (time.monotonic() - start) / self.period
+
+    def percentiles(self):
+        intervals = sorted(self.intervals)
+        if not intervals:
+            return {}
+        return {q: intervals[min(len(intervals) - 1, int(len(intervals) * q))] for q in QUANTILES}
+
+    def metrics(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return dict(
+            self.stats,
+            socket=self.path,
+            fps=round(float(SPECTRUM_FRAME_RATE) / self.divisor, 3),
+            subscribers=subscribers,
+            clock_offset_frames=round(self.clock_offset, 2),
+            frame_interval_percentiles={str(q): round(value, 5) for q, value in self.percentiles().items()},
+        )
+
+    def families(self):
+        frames = counter('spectrum_capture_frames_total', 'Frame clock capture: emulated frames and fill-ins')
+        frames.add(self.stats['frames'], kind='emulated')
+        frames.add(self.stats['repeated'], kind='repeated')
+        frames.add(self.stats['dropped'], kind='dropped')
+        interval = gauge('spectrum_capture_frame_interval_seconds',
+                         f'Time between frames completed by the emulator, over the last {self.intervals.maxlen}')
+        for q, value in self.percentiles().items():
+            interval.add(round(value, 6), quantile=str(q))
+        return [
+            frames,
+            interval,
+            gauge('spectrum_capture_clock_offset_frames', 'Frames sent ahead (+) or behind (-) the wall clock',
+                  round(self.clock_offset, 2)),
+            counter('spectrum_capture_unsettled_frames_total', 'Frames read while damage was still arriving',
+                    self.stats['unsettled']),
+            counter('spectrum_capture_slow_consumers_total', 'Encoders disconnected for falling behind',
+                    self.stats['disconnected_slow']),
+        ]
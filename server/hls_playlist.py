@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# One media segment as listed in a playlist. sequence is ffmpeg's media sequence number,
+# discontinuity is set on the first segment after an encoder restart or a cut-over that does not join up.
+Segment = namedtuple('Segment', 'sequence uri duration discontinuity path')
+
+
+def parse_playlist(text, base_dir=None):
+    """Parse a media playlist into (target_duration, media_sequence, segments)"""
+    target_duration = 0
+    media_sequence = 0
+    segments = []
+    duration = None
+    discontinuity = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = int(float(line.split(':', 1)[1]))
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            media_sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0])
+        elif line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif not line.startswith('#'):
+            sequence = media_sequence + len(segments)
+            path = Path(base_dir) / line if base_dir else None
+            segments.append(Segment(sequence, line, duration or 0.0, discontinuity, path))
+            duration = None
+            discontinuity = False
+
+    return target_duration, media_sequence, segments
+
+
+def render_playlist(segments, target_duration=None, media_sequence=None, playlist_type=None,
+                    endlist=False, uri=None, discontinuity_sequence=None):
+    """Render segments back into a media playlist; uri maps a segment to its listed URI"""
+    if target_duration is None:
+        target_duration = max((int(s.duration + 0.999) for s in segments), default=2)
+    if media_sequence is None:
+        media_sequence = segments[0].sequence if segments else 0
+
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        f'#EXT-X-MEDIA-SEQUENCE:{media_sequence}',
+    ]
+    if discontinuity_sequence:
+        lines.append(f'#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuity_sequence}')
+    if playlist_type:
+        lines.append(f'#EXT-X-PLAYLIST-TYPE:{playlist_type}')
+    for segment in segments:
+        if segment.discontinuity:
+            lines.append('#EXT-X-DISCONTINUITY')
+        lines.append(f'#EXTINF:{segment.duration:.6f},')
+        lines.append(uri(segment) if uri else segment.uri)
+    if endlist:
+        lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+def first_pts(path, limit=64 * 1024):
+    """Presentation time in seconds of the first video frame in an MPEG-TS segment, or None"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(limit)
+    except OSError:
+        return None
+    for offset in range(0, len(data) - 187, 188):
+        packet = data[offset:offset + 188]
+        # Sync byte and payload_unit_start_indicator: a PES packet may start here
+        if packet[0] != 0x47 or not packet[1] & 0x40:
+            continue
+        adaptation = packet[3] >> 4 & 0x3
+        if adaptation == 2:
+            continue
+        pes = packet[5 + packet[4]:] if adaptation == 3 else packet[4:]
+        if len(pes) < 14 or pes[:3] != b'\x00\x00\x01' or not 0xE0 <= pes[3] <= 0xEF or not pes[7] & 0x80:
+            continue
+        pts = ((pes[9] >> 1 & 0x07) << 30 | pes[10] << 22 | (pes[11] >> 1) << 15
+               | pes[12] << 7 | pes[13] >> 1)
+        return pts / 90000
+    return None
+
+
+def _read_if_changed(playlist_path, last_mtime):
+    """(mtime, segments) of a playlist, segments being None if it is missing or unchanged"""
+    try:
+        mtime = playlist_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return last_mtime, None
+    if mtime == last_mtime:
+        return mtime, None
+    return mtime, parse_playlist(playlist_path.read_text(), playlist_path.parent)[2]
+
+
+class _CutOver:
+    """A second encoder's playlist, collected until the watcher moves over to it"""
+
+    def __init__(self, playlist_path, signature):
+        self.playlist_path = playlist_path
+        self.signature = signature
+        self.done = threading.Event()
+        self.segments = []
+        self.last_sequence = -1
+        self.last_mtime = None
+        # Stream time from which the new encoder takes over: the end of its first segment,
+        # which starts wherever the encoder happened to start
+        self.boundary = None
+        self.found_at = None
+        # The old encoder has produced a segment past the boundary
+        self.passed = False
+
+
+class PlaylistWatcher:
+    """Polls ffmpeg's live playlist and reports each segment once it is complete.
+
+    ffmpeg only lists a segment after closing it, so a newly listed segment is safe
+    to read. Listeners are called from the watcher thread with a Segment.
+
+    cut_over() hands the stream to a second encoder running alongside the first and
+    writing its own playlist. The watcher keeps reporting the old encoder's segments
+    up to a segment boundary the new encoder covers, then continues with the new
+    encoder's segments from that boundary. The first of those is marked as a
+    discontinuity only if the two do not join up: a different encoding signature,
+    or timestamps more than tolerance seconds apart.
+    """
+
+    def __init__(self, playlist_path, interval=0.25, tolerance=0.06, cut_timeout=20.0):
+        self.playlist_path = Path(playlist_path)
+        self.interval = interval
+        self.tolerance = tolerance
+        self.cut_timeout = cut_timeout
+        self.listeners = []
+        self.signature = None
+        self.stats = {'cutovers': 0, 'discontinuities': 0}
+        self._lock = threading.Lock()
+        self._last_sequence = -1
+        self._last_mtime = None
+        self._last_end = None
+        self._emitted = False
+        self._pending_discontinuity = False
+        self._next = None
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='playlist-watcher', daemon=True)
+        self._thread.start()
+        logger.info(f'Watching {self.playlist_path} for completed segments')
+
+    def switch(self, playlist_path, signature=None):
+        """Follow playlist_path from its first segment, e.g. for an encoder started from scratch"""
+        with self._lock:
+            self._next = None
+            self.playlist_path = Path(playlist_path)
+            self.signature = signature
+            self._last_sequence = -1
+            self._last_mtime = None
+            self._pending_discontinuity = self._emitted
+
+    def cut_over(self, playlist_path, signature=None):
+        """Move to playlist_path, written by an encoder running alongside the current one.
+
+        Returns an Event that is set once the watcher follows the new playlist; until
+        then the old encoder must keep running.
+        """
+        with self._lock:
+            self._next = _CutOver(Path(playlist_path), signature)
+            return self._next.done
+
+    def cancel_cut_over(self):
+        with self._lock:
+            self._next = None
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f'Playlist watcher error: {e}')
+            time.sleep(self.interval)
+
+    def poll(self):
+        with self._lock:
+            cut = self._next
+            if cut:
+                self._collect(cut)
+            self._poll_current(cut)
+            if cut and self._ready(cut):
+                self._finish(cut)
+
+    def _poll_current(self, cut):
+        self._last_mtime, segments = _read_if_changed(self.playlist_path, self._last_mtime)
+        if not segments:
+            return
+        if segments[-1].sequence < self._last_sequence:
+            # Encoder restarted and is numbering from zero again
+            logger.info('Live playlist restarted, marking discontinuity')
+            self._last_sequence = segments[0].sequence - 1
+            self._pending_discontinuity = True
+
+        for segment in segments:
+            if segment.sequence <= self._last_sequence:
+                continue
+            self._last_sequence = segment.sequence
+            start = first_pts(segment.path)
+            if cut and cut.found_at is not None and (
+                    cut.boundary is None or start is None or start >= cut.boundary - self.tolerance):
+                # The new encoder covers this stretch
+                cut.passed = True
+                continue
+            self._emit(segment, start)
+
+    def _collect(self, cut):
+        cut.last_mtime, segments = _read_if_changed(cut.playlist_path, cut.last_mtime)
+        for segment in segments or []:
+            if segment.sequence <= cut.last_sequence:
+                continue
+            cut.last_sequence = segment.sequence
+            start = first_pts(segment.path)
+            if cut.found_at is None:
+                cut.found_at = time.monotonic()
+                if start is not None:
+                    cut.boundary = start + segment.duration
+                if self._emitted:
+                    # Partial segment from before the boundary, the old encoder covers it
+                    continue
+            cut.segments.append((segment, start))
+
+    def _ready(self, cut):
+        if cut.found_at is None:
+            return False
+        if not self._emitted or cut.passed:
+            return True
+        if cut.boundary is not None and self._last_end is not None and self._last_end >= cut.boundary - self.tolerance:
+            return True
+        # The old encoder stalled or died before reaching the boundary
+        return time.monotonic() - cut.found_at > self.cut_timeout
+
+    def _finish(self, cut):
+        joined = (cut.signature == self.signature and cut.boundary is not None and self._last_end is not None
+                  and abs(cut.boundary - self._last_end) <= self.tolerance)
+        logger.info(f'Cutting over to {cut.playlist_path.name}'
+                    f'{"" if joined or not self._emitted else " with a discontinuity"}')
+        self._pending_discontinuity = self._emitted and not joined
+        self.playlist_path = cut.playlist_path
+        self.signature = cut.signature
+        self._last_mtime = cut.last_mtime
+        self._last_sequence = cut.last_sequence
+        self._next = None
+        self.stats['cutovers'] += 1
+        for segment, start in cut.segments:
+            self._emit(segment, start)
+        cut.done.set()
+
+    def _emit(self, segment, start):
+        if self._pending_discontinuity:
+            segment = segment._replace(discontinuity=True)
+            self._pending_discontinuity = False
+            self.stats['discontinuities'] += 1
+        self._emitted = True
+        self._last_end = start + segment.duration if start is not None else None
+        for listener in self.listeners:
+            try:
+                listener(segment)
+            except Exception as e:
+                logger.error(f'Segment listener failed for {segment.uri}: {e}')
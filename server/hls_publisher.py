@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from hls_playlist import render_playlist
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_LIMIT = 1000  # S3 DeleteObjects maximum
+
+
+class HLSPublisher:
+    """Publishes the live HLS stream to S3 and garbage-collects it.
+
+    Each completed segment is uploaded exactly once, followed by the playlist snapshot
+    that lists it. The remote playlist is a sliding window of the last window_size
+    published segments with its own media and discontinuity sequence numbers, so it
+    carries on unchanged when the encoder behind it is replaced.
+
+    Segments that drop out of the window are retired and, after a
+    grace period long enough for CDN and player caches to move on, removed in batched,
+    rate-limited DeleteObjects calls. On startup the remote prefix is listed so segments
+    orphaned by a crash or restart are collected as well.
+
+    With content_addressed set, segments are stored as seg/<hash>.ts with immutable cache
+    headers and the playlist is rewritten to those names, so the playlist is the only
+    mutable object. The hash covers the raw TS, so only byte-identical files share a key,
+    such as a segment published again after a restart; live segments never do, even of a
+    static screen, because their PTS, PCR and continuity counters differ. A segment whose
+    key is already stored is not uploaded again; the PUTs and bytes saved are counted in
+    metrics().
+    """
+
+    def __init__(self, s3_client, bucket, playlist_name='stream.m3u8', prefix='hls/', window_size=5,
+                 delete_grace=30.0, delete_interval=1.0, batch_size=DELETE_BATCH_LIMIT, content_addressed=False):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.playlist_name = playlist_name
+        self.prefix = prefix
+        self.window_size = window_size
+        self.delete_grace = delete_grace
+        self.delete_interval = delete_interval
+        self.batch_size = min(batch_size, DELETE_BATCH_LIMIT)
+        self.content_addressed = content_addressed
+
+        self.published = set()
+        # (segment, key) pairs listed in the remote playlist, oldest first
+        self.window = deque()
+        self.media_sequence = 0
+        self.discontinuity_sequence = 0
+        self.target_duration = 0
+        self.listeners = []
+        self.retired = OrderedDict()
+        self.stats = {
+            'segment_uploads': 0,
+            'playlist_uploads': 0,
+            'upload_errors': 0,
+            'delete_requests': 0,
+            'deleted': 0,
+            'delete_errors': 0,
+            'recovered': 0,
+            'bytes_uploaded': 0,
+            'dedup_hits': 0,
+            'puts_saved': 0,
+            'bytes_saved': 0,
+        }
+        # Seconds from the encoder closing a segment to the remote playlist listing it
+        self.publish_latencies = deque(maxlen=512)
+        self._queue = queue.Queue()
+        self._last_delete = 0.0
+        self._thread = None
+
+    def add_listener(self, listener):
+        """Call listener(segment, key) once a segment is listed in the remote playlist"""
+        self.listeners.append(listener)
+
+    def on_segment(self, segment):
+        """PlaylistWatcher listener; uploads happen on the publisher thread"""
+        self._queue.put(segment)
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='hls-publisher', daemon=True)
+        self._thread.start()
+        logger.info(f'HLS publisher started for s3://{self.bucket}/{self.prefix}')
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception as e:
+            logger.error(f'Failed to list s3://{self.bucket}/{self.prefix} for recovery: {e}')
+
+        while True:
+            try:
+                segment = self._queue.get(timeout=self.delete_interval)
+            except queue.Empty:
+                segment = None
+            try:
+                if segment:
+                    self.publish(segment)
+                self.collect_garbage()
+            except Exception as e:
+                logger.error(f'HLS publisher error: {e}')
+
+    def recover(self):
+        """Retire every remote segment left by a previous run"""
+        token = None
+        while True:
+            kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+            if token:
+                kwargs['ContinuationToken'] = token
+            response = self.s3_client.list_objects_v2(**kwargs)
+            for obj in response.get('Contents', []):
+                key = obj['Key']
+                if key.endswith('.ts') and key not in self.published and key not in self.retired:
+                    # The previous run's playlist may still reference it, so keep the grace period
+                    self.retired[key] = time.monotonic()
+                    self.stats['recovered'] += 1
+            if not response.get('IsTruncated'):
+                break
+            token = response['NextContinuationToken']
+
+        if self.stats['recovered']:
+            logger.info(f'Recovered {self.stats["recovered"]} orphaned remote segments for deletion')
+
+    def publish(self, segment):
+        try:
+            data = segment.path.read_bytes()
+            closed_at = segment.path.stat().st_mtime
+        except FileNotFoundError:
+            self.stats['upload_errors'] += 1
+            logger.warning(f'Segment {segment.uri} was deleted before it could be published')
+            return
+
+        if self.content_addressed:
+            key = f'{self.prefix}seg/{hashlib.sha256(data).hexdigest()[:32]}.ts'
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            key = self.prefix + segment.uri
+            cache_control = 'max-age=10'
+
+        if self.content_addressed and (key in self.published or key in self.retired):
+            # Same bytes are already stored remotely, e.g. a segment re-published after a restart
+            self.stats['dedup_hits'] += 1
+            self.stats['puts_saved'] += 1
+            self.stats['bytes_saved'] += len(data)
+        else:
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=data,
+                    ContentType='video/mp2t',
+                    CacheControl=cache_control
+                )
+            except Exception as e:
+                self.stats['upload_errors'] += 1
+                logger.warning(f'Failed to upload segment {segment.uri}: {e}')
+                return
+            self.stats['segment_uploads'] += 1
+            self.stats['bytes_uploaded'] += len(data)
+
+        self.window.append((segment, key))
+        while len(self.window) > self.window_size:
+            dropped, _ = self.window.popleft()
+            self.media_sequence += 1
+            if dropped.discontinuity:
+                self.discontinuity_sequence += 1
+        self.published.add(key)
+        # A restarted server reuses names (and static screens reuse content),
+        # so a re-published key must not be deleted
+        self.retired.pop(key, None)
+        self.publish_playlist()
+        self.publish_latencies.append(time.time() - closed_at)
+        self.retire_outside({listed_key for _, listed_key in self.window})
+
+        # Listeners see the segment's position in the remote playlist
+        segment = segment._replace(sequence=self.media_sequence + len(self.window) - 1)
+        for listener in self.listeners:
+            try:
+                listener(segment, key)
+            except Exception as e:
+                logger.error(f'Publish listener failed for {segment.uri}: {e}')
+
+    def publish_playlist(self):
+        segments = [segment for segment, _ in self.window]
+        keys = {segment.uri: key for segment, key in self.window}
+        # EXT-X-TARGETDURATION must not change during the stream, so it only ever grows
+        self.target_duration = max([self.target_duration] + [int(s.duration + 0.999) for s in segments])
+        relative = len(self.prefix)
+        text = render_playlist(segments, self.target_duration, self.media_sequence,
+                               discontinuity_sequence=self.discontinuity_sequence,
+                               uri=lambda s: keys[s.uri][relative:])
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + self.playlist_name,
+            Body=text.encode('utf-8'),
+            ContentType='application/vnd.apple.mpegurl',
+            CacheControl='no-cache'
+        )
+        self.stats['playlist_uploads'] += 1
+
+    def retire_outside(self, live):
+        now = time.monotonic()
+        for key in self.published - live:
+            self.published.discard(key)
+            self.retired[key] = now
+
+    def collect_garbage(self):
+        now = time.monotonic()
+        if now - self._last_delete < self.delete_interval:
+            return
+
+        due = []
+        for key, retired_at in self.retired.items():
+            if now - retired_at < self.delete_grace or len(due) >= self.batch_size:
+                break
+            due.append(key)
+        if not due:
+            return
+
+        self._last_delete = now
+        self.stats['delete_requests'] += 1
+        try:
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in due], 'Quiet': True}
+            )
+        except Exception as e:
+            self.stats['delete_errors'] += 1
+            logger.warning(f'DeleteObjects for {len(due)} segments failed, will retry: {e}')
+            return
+
+        failed = {error['Key'] for error in response.get('Errors', [])}
+        for key in due:
+            if key not in failed:
+                del self.retired[key]
+        self.stats['deleted'] += len(due) - len(failed)
+        self.stats['delete_errors'] += len(failed)
+        logger.debug(f'Deleted {len(due) - len(failed)} expired segments from s3://{self.bucket}/{self.prefix}')
+
+    def metrics(self):
+        stored = self.stats['segment_uploads'] + self.stats['dedup_hits']
+        latencies = sorted(self.publish_latencies)
+        return dict(
+            self.stats,
+            content_addressed=self.content_addressed,
+            live_segments=len(self.published),
+            media_sequence=self.media_sequence,
+            discontinuity_sequence=self.discontinuity_sequence,
+            pending_deletes=len(self.retired),
+            queue_depth=self._queue.qsize(),
+            dedup_ratio=round(self.stats['dedup_hits'] / stored, 4) if stored else 0.0,
+            publish_latency={str(q): round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 4)
+                             for q in (0.5, 0.99, 1.0)} if latencies else {}
+        )
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import logging
+import shutil
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class LocalS3Client:
+    """Directory-backed stand-in for the subset of the boto3 S3 client the server uses.
+
+    Objects live at root/bucket/key, with their ExtraArgs kept in memory. Every call is
+    counted in request_counts so publishers can be checked for request volume locally.
+    Select it with S3_LOCAL_ROOT instead of pointing at a real bucket.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.metadata = {}
+        self.request_counts = {}
+        self._lock = threading.Lock()
+
+    def _count(self, operation):
+        with self._lock:
+            self.request_counts[operation] = self.request_counts.get(operation, 0) + 1
+
+    def _path(self, bucket, key):
+        return self.root / bucket / key
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None):
+        self._count('PutObject')
+        path = self._path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, path)
+        self.metadata[(bucket, key)] = dict(ExtraArgs or {})
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._count('PutObject')
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(Body if isinstance(Body, bytes) else Body.read())
+        self.metadata[(Bucket, Key)] = kwargs
+        return {}
+
+    def head_object(self, Bucket, Key):
+        self._count('HeadObject')
+        path = self._path(Bucket, Key)
+        if not path.exists():
+            raise FileNotFoundError(f'{Bucket}/{Key}')
+        return dict(self.metadata.get((Bucket, Key), {}), ContentLength=path.stat().st_size)
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000):
+        self._count('ListObjectsV2')
+        bucket_dir = self.root / Bucket
+        keys = sorted(
+            str(path.relative_to(bucket_dir))
+            for path in bucket_dir.rglob('*') if path.is_file()
+        ) if bucket_dir.exists() else []
+        keys = [key for key in keys if key.startswith(Prefix)]
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {
+            'KeyCount': len(page),
+            'Contents': [{'Key': key, 'Size': (bucket_dir / key).stat().st_size} for key in page],
+            'IsTruncated': start + MaxKeys < len(keys),
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        self._count('DeleteObjects')
+        objects = Delete['Objects']
+        if len(objects) > 1000:
+            raise ValueError('DeleteObjects accepts at most 1000 keys')
+        deleted = []
+        for obj in objects:
+            self._path(Bucket, obj['Key']).unlink(missing_ok=True)
+            self.metadata.pop((Bucket, obj['Key']), None)
+            deleted.append({'Key': obj['Key']})
+        return {'Deleted': deleted}
+
+
+class LazyS3Client:
+    """A boto3 S3 client that is only created when it is first used.
+
+    Importing boto3 and loading the S3 service model takes a few hundred milliseconds,
+    and none of it is needed to bind the ports. The first attribute access (normally an
+    upload on a publisher thread) imports boto3 and builds the client with the given
+    keyword arguments; later calls go straight to it.
+    """
+
+    def __init__(self, **client_kwargs):
+        self._client_kwargs = client_kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client('s3', **self._client_kwargs)
+                    logger.info('S3 client created')
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
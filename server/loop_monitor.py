@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LoopMonitor:
+    """Measures event loop scheduling delay and catches callbacks that block it.
+
+    A task on the loop sleeps for interval and records how late it woke up. That is
+    the lag every other callback saw at the same moment. A watchdog thread checks
+    whether the next tick is overdue by more than threshold. If it is, some callback is
+    blocking the loop right now, and the watchdog grabs the loop thread's current stack
+    (the blocking frame and its callers) via sys._current_frames(). One stack is logged
+    per stall, and the stall's full duration is filled in once the loop is back.
+
+    Cost: one timer wakeup per interval on the loop and one sleep/compare per
+    threshold/2 in the watchdog, so it is meant to stay on in production.
+    """
+
+    def __init__(self, interval=0.05, threshold=0.1, window=1200, keep_stalls=20):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=window)
+        self.stalls = deque(maxlen=keep_stalls)
+        self.stats = {'ticks': 0, 'stalls': 0, 'max_lag': 0.0}
+        self._beat = None
+        self._loop_thread = None
+        self._captured = None
+        self._task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start sampling; must be called on the loop to be monitored"""
+        if self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watchdog, name='loop-watchdog', daemon=True).start()
+        logger.info(f'Event loop monitor: {self.interval * 1000:.0f} ms ticks, '
+                    f'stalls over {self.threshold * 1000:.0f} ms are traced')
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+            self.stats['ticks'] += 1
+            if lag > self.stats['max_lag']:
+                self.stats['max_lag'] = lag
+            stall = self._captured
+            if stall is not None:
+                stall['duration'] = round(lag, 4)
+                logger.warning(f'Event loop blocked for {lag * 1000:.0f} ms')
+                self._captured = None
+            self._beat = now
+
+    def _watchdog(self):
+        poll = self.threshold / 2
+        while not self._stop.wait(poll):
+            beat = self._beat
+            overdue = time.monotonic() - (beat + self.interval)
+            if overdue <= self.threshold or self._captured is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            # The loop may have moved on while the stack was captured
+            if beat != self._beat:
+                continue
+            stall = {'at': time.time(), 'duration': None, 'stack': stack}
+            self.stats['stalls'] += 1
+            self.stalls.append(stall)
+            self._captured = stall
+            logger.warning(f'Event loop blocked for over {overdue * 1000:.0f} ms, loop thread stack:\n{stack}')
+
+    def percentiles(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        return {q: lags[min(len(lags) - 1, int(len(lags) * q))] for q in QUANTILES}
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            interval=self.interval,
+            threshold=self.threshold,
+            lag_percentiles={str(q): round(lag, 5) for q, lag in self.percentiles().items()},
+            recent_stalls=list(self.stalls),
+        )
+
+    def families(self):
+        lag = gauge('spectrum_event_loop_lag_seconds',
+                    f'Event loop scheduling delay over the last {self.lags.maxlen} samples')
+        for q, value in self.percentiles().items():
+            lag.add(round(value, 6), quantile=str(q))
+        return [
+            lag,
+            gauge('spectrum_event_loop_lag_max_seconds', 'Largest scheduling delay since start',
+                  round(self.stats['max_lag'], 6)),
+            counter('spectrum_event_loop_stalls_total', f'Callbacks that blocked the loop for over '
+                    f'{self.threshold * 1000:.0f} ms', self.stats['stalls']),
+        ]
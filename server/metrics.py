@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import math
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricFamily:
+    """One metric name in the Prometheus text exposition format"""
+
+    __slots__ = ('name', 'kind', 'help', 'samples')
+
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples = []
+
+    def add(self, value, **labels):
+        if value is not None:
+            self.samples.append((labels, value))
+        return self
+
+
+def gauge(name, help_text, value=None, **labels):
+    return MetricFamily(name, 'gauge', help_text).add(value, **labels)
+
+
+def counter(name, help_text, value=None, **labels):
+    return MetricFamily(name, 'counter', help_text).add(value, **labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def render(families):
+    """Text exposition of families; families with no samples are left out"""
+    lines = []
+    for family in families:
+        if not family.samples:
+            continue
+        lines.append(f'# HELP {family.name} {family.help}')
+        lines.append(f'# TYPE {family.name} {family.kind}')
+        for labels, value in family.samples:
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f'{family.name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{family.name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = 120
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is already running"""
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class Profiler:
+    """On-demand profiling of the running server; costs nothing until a profile is requested.
+
+    cpu(): samples the stack of every Python thread (the event loop thread, the HLS
+    publisher's upload thread, upload engine workers, reader threads) at hz via
+    sys._current_frames() from a dedicated thread, and returns collapsed stacks:
+    one "thread;outer;...;inner count" line per distinct stack, which flamegraph.pl,
+    speedscope and inferno read directly.
+
+    memory(): takes a tracemalloc snapshot, waits, takes another and returns the
+    allocation sites that grew the most. Tracing is only on for the duration of the
+    request unless it was already enabled.
+
+    Both block for the requested duration, so call them from an executor thread. Only
+    one profile runs at a time; a second request raises ProfilerBusy.
+    """
+
+    def __init__(self, hz=100):
+        self.hz = hz
+        self._lock = threading.Lock()
+
+    def _acquire(self, seconds):
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy('A profile is already running')
+        return min(max(seconds, 0.1), MAX_SECONDS)
+
+    def cpu(self, seconds, threads=None):
+        seconds = self._acquire(seconds)
+        try:
+            me = threading.get_ident()
+            interval = 1.0 / self.hz
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            logger.info(f'CPU profile: sampling all threads at {self.hz} Hz for {seconds}s')
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    name = names.get(ident, f'thread-{ident}')
+                    if threads and name not in threads:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(name)
+                    stacks[';'.join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+            logger.info(f'CPU profile done: {samples} samples, {len(stacks)} distinct stacks')
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+    def memory(self, seconds, limit=50, group_by='lineno'):
+        seconds = self._acquire(seconds)
+        started = False
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25 if group_by == 'traceback' else 1)
+                started = True
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), group_by)
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f'# tracemalloc diff over {seconds}s grouped by {group_by}: '
+                     f'traced {current} bytes now, peak {peak}']
+            for stat in stats[:limit]:
+                lines.append(str(stat))
+                if group_by == 'traceback':
+                    lines.extend(f'    {line}' for line in stat.traceback.format())
+            return '\n'.join(lines) + '\n'
+        finally:
+            if started:
+                tracemalloc.stop()
+            self._lock.release()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import logging
+import struct
+
+import websockets
+
+import runtime
+from session_recorder import INPUT_CODES, INPUT_CODE_BY_NAME
+
+logger = logging.getLogger(__name__)
+
+# Negotiated with the Sec-WebSocket-Protocol header. A client that offers neither
+# (every client written before this protocol existed) gets JSON text frames.
+BINARY_SUBPROTOCOL = 'spectrum.v1.bin'
+JSON_SUBPROTOCOL = 'spectrum.v1.json'
+SUBPROTOCOLS = [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL]
+
+PROTOCOL_VERSION = 1
+
+# Frame:  u8 version, u16 sequence, u8 record count, then count records
+# Record: u8 type code, u16 body length, body
+FRAME_HEADER = struct.Struct('<BHB')
+RECORD_HEADER = struct.Struct('<BH')
+MAX_BATCH = 255
+MAX_BODY = 0xFFFF
+ABSENT_STR = 0xFFFF
+
+# Escape hatch: any message without a schema (or one that does not fit its schema)
+# travels as a JSON record, so nothing is ever lost by choosing the binary protocol
+JSON_RECORD = 0x7F
+
+# type code -> (message type, fields). A field is (name, kind, default); kinds:
+#   bool  u8 0/1
+#   u32   unsigned 32-bit integer
+#   ms    seconds carried as u32 milliseconds
+#   str   u16 length + UTF-8, length 0xFFFF means the field is absent
+#   key   u8 index into session_recorder.INPUT_CODES
+#
+# Compatibility rules: codes are never reused, and new fields are only appended to
+# the end of a body. Decoders stop at the end of the body (older senders simply omit
+# trailing fields), ignore trailing bytes they do not know, and skip records with
+# unknown codes, so v1 peers of different ages interoperate. A change that cannot
+# follow these rules bumps PROTOCOL_VERSION and the subprotocol names.
+SCHEMA = {
+    # client -> server
+    0x01: ('hello', ()),
+    0x02: ('status', ()),
+    0x03: ('start_emulator', ()),
+    0x04: ('stop_emulator', ()),
+    0x05: ('subscribe_segments', ()),
+    0x06: ('unsubscribe_segments', ()),
+    0x10: ('key_press', (('key', 'key', None), ('pressed', 'bool', True))),
+    0x11: ('joystick', (('direction', 'str', None), ('pressed', 'bool', True))),
+    # server -> client
+    0x40: ('connected', (('emulator_running', 'bool', None), ('output_resolution', 'str', None))),
+    0x41: ('emulator_status', (('running', 'bool', None), ('message', 'str', None),
+                               ('output_resolution', 'str', None))),
+    0x42: ('segment_subscription', (('subscribed', 'bool', None), ('publishing', 'bool', None))),
+    0x43: ('segment', (('sequence', 'u32', None), ('duration', 'ms', None), ('url', 'str', None))),
+}
+CODE_BY_TYPE = {name: code for code, (name, _) in SCHEMA.items()}
+FIELD_NAMES = {code: frozenset(field[0] for field in fields) | {'type'} for code, (_, fields) in SCHEMA.items()}
+
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+
+stats = {
+    'frames_in': 0,
+    'frames_out': 0,
+    'messages_in': 0,
+    'messages_out': 0,
+    'json_records': 0,
+    'unknown_records': 0,
+    'decode_errors': 0,
+    'sequence_gaps': 0,
+}
+
+
+def _select_subprotocol(connection, offered):
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def serve_options():
+    """websockets.serve() keyword arguments that negotiate the protocol.
+
+    websockets 14+ rejects a client that offers no subprotocol once the server lists
+    any, so there the selection is overridden to fall back to JSON; the legacy server
+    (websockets 11, as pinned in the Dockerfiles) already behaves that way.
+    """
+    options = {'subprotocols': SUBPROTOCOLS}
+    if websockets.serve.__module__.startswith('websockets.asyncio'):
+        options['select_subprotocol'] = _select_subprotocol
+    return options
+
+
+class ProtocolError(ValueError):
+    """A frame that cannot be decoded; the connection should drop it and carry on"""
+
+
+def _pack_field(kind, value):
+    if value is None and kind != 'str':
+        raise ValueError('required field missing')
+    if kind == 'bool':
+        return _U8.pack(1 if value else 0)
+    if kind == 'u32':
+        return _U32.pack(value)
+    if kind == 'ms':
+        return _U32.pack(int(round(value * 1000)))
+    if kind == 'key':
+        return _U8.pack(INPUT_CODE_BY_NAME[str(value).upper()])
+    if value is None:
+        return _U16.pack(ABSENT_STR)
+    data = value.encode('utf-8')
+    if len(data) >= ABSENT_STR:
+        raise ValueError('string too long')
+    return _U16.pack(len(data)) + data
+
+
+def encode_record(message):
+    """Encode one message dict as a record; messages that do not fit a schema become JSON records"""
+    code = CODE_BY_TYPE.get(message.get('type'))
+    if code is not None and message.keys() <= FIELD_NAMES[code]:
+        try:
+            body = b''.join(_pack_field(kind, message.get(name, default))
+                            for name, kind, default in SCHEMA[code][1])
+            return RECORD_HEADER.pack(code, len(body)) + body
+        except (KeyError, ValueError, TypeError, AttributeError, struct.error):
+            pass
+    body = runtime.dumps(message).encode('utf-8')
+    if len(body) > MAX_BODY:
+        raise ProtocolError(f'Message too large for one record: {len(body)} bytes')
+    stats['json_records'] += 1
+    return RECORD_HEADER.pack(JSON_RECORD, len(body)) + body
+
+
+def encode_frame(records, sequence):
+    """Join pre-encoded records (at most MAX_BATCH) into one frame"""
+    if len(records) > MAX_BATCH:
+        raise ProtocolError(f'Too many records for one frame: {len(records)}')
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, sequence & 0xFFFF, len(records)) + b''.join(records)
+
+
+def _unpack_body(code, body):
+    name, fields = SCHEMA[code]
+    message = {'type': name}
+    offset = 0
+    for field, kind, default in fields:
+        if offset >= len(body):
+            # Sent by an older peer that does not know this field yet
+            if default is not None:
+                message[field] = default
+            continue
+        if kind == 'bool':
+            message[field] = bool(body[offset])
+            offset += 1
+        elif kind in ('u32', 'ms'):
+            value, = _U32.unpack_from(body, offset)
+            message[field] = value if kind == 'u32' else value / 1000
+            offset += 4
+        elif kind == 'key':
+            message[field] = INPUT_CODES[body[offset]]
+            offset += 1
+        else:
+            length, = _U16.unpack_from(body, offset)
+            offset += 2
+            if length != ABSENT_STR:
+                if offset + length > len(body):
+                    raise ProtocolError(f'String field {field} overruns its record')
+                message[field] = body[offset:offset + length].decode('utf-8')
+                offset += length
+    return message
+
+
+def decode_frame(frame):
+    """Decode a binary frame into (sequence, [message dicts])"""
+    try:
+        version, sequence, count = FRAME_HEADER.unpack_from(frame, 0)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f'Unsupported protocol version {version}')
+        messages = []
+        offset = FRAME_HEADER.size
+        for _ in range(count):
+            code, length = RECORD_HEADER.unpack_from(frame, offset)
+            offset += RECORD_HEADER.size
+            body = frame[offset:offset + length]
+            if len(body) != length:
+                raise ProtocolError('Record overruns the frame')
+            offset += length
+            if code == JSON_RECORD:
+                message = runtime.loads(body)
+                if not isinstance(message, dict):
+                    raise ProtocolError('JSON record is not an object')
+            elif code in SCHEMA:
+                message = _unpack_body(code, body)
+            else:
+                stats['unknown_records'] += 1
+                continue
+            messages.append(message)
+        return sequence, messages
+    except ProtocolError:
+        raise
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError, TypeError) as e:
+        # json.JSONDecodeError and orjson.JSONDecodeError are both ValueErrors
+        raise ProtocolError(f'Malformed frame: {e}') from None
+
+
+class Codec:
+    """Per-connection encoding state, chosen from the negotiated subprotocol.
+
+    Binary frames carry a sequence number per direction. Outgoing frames (replies
+    and hub broadcasts alike) number from one shared counter; incoming numbers are
+    checked so a client that drops or reorders frames shows up in sequence_gaps.
+    """
+
+    __slots__ = ('binary', 'tx_sequence', 'rx_sequence')
+
+    def __init__(self, subprotocol=None):
+        self.binary = subprotocol == BINARY_SUBPROTOCOL
+        self.tx_sequence = 0
+        self.rx_sequence = None
+
+    @property
+    def name(self):
+        return 'binary' if self.binary else 'json'
+
+    def payload(self, message):
+        """Hub payload for one message: a record for binary connections, text for JSON ones"""
+        if self.binary:
+            return encode_record(message)
+        return runtime.dumps(message)
+
+    def frame(self, payloads):
+        """One outgoing frame from queued payloads; JSON connections send one payload per frame"""
+        stats['frames_out'] += 1
+        stats['messages_out'] += len(payloads)
+        if not self.binary:
+            return payloads[0]
+        self.tx_sequence = (self.tx_sequence + 1) & 0xFFFF
+        return encode_frame(payloads, self.tx_sequence)
+
+    def encode(self, message):
+        """A whole frame holding one message, for direct replies"""
+        return self.frame([self.payload(message)])
+
+    def decode(self, frame):
+        """Messages in an incoming frame; JSON connections may also send a list as a batch"""
+        stats['frames_in'] += 1
+        try:
+            if isinstance(frame, str):
+                data = runtime.loads(frame)
+                messages = data if isinstance(data, list) else [data]
+                if not all(isinstance(message, dict) for message in messages):
+                    raise ProtocolError('JSON frame is not an object or a list of objects')
+            else:
+                sequence, messages = decode_frame(frame)
+                expected = None if self.rx_sequence is None else (self.rx_sequence + 1) & 0xFFFF
+                if expected is not None and sequence != expected:
+                    stats['sequence_gaps'] += 1
+                    logger.debug(f'Frame sequence gap: expected {expected}, got {sequence}')
+                self.rx_sequence = sequence
+        except ProtocolError:
+            stats['decode_errors'] += 1
+            raise
+        except ValueError as e:
+            stats['decode_errors'] += 1
+            raise ProtocolError(f'Invalid JSON: {e}') from None
+        stats['messages_in'] += len(messages)
+        return messages
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Steps the encode down to cheaper settings while the host is short of CPU, and back up.
+
+Every interval the governor samples three signals:
+
+- encoder pace: frames and output time produced per second of wall clock, relative to
+  real time, for each encoder (a live x11grab capture keeps its timestamps on the wall
+  clock and drops frames when the encoder is slow, so both are needed)
+- emulator run delay: the share of wall time FUSE's threads spent runnable but waiting
+  for a CPU (/proc/<pid>/task/*/schedstat). This is what makes its frames late and its
+  audio crackle.
+- host steal: the share of CPU time the hypervisor gave to other guests
+
+When one of them is over its limit for down_after samples in a row, the governor moves
+one rung down the ladder built from the current profile (faster x264 preset, then half
+the frame rate, then a cheaper scaler, then a lower output resolution). When all of them
+are comfortably clear for up_after samples, it moves one rung back up. A rung that
+overloaded the host soon after a step up takes twice as long to retry, up to 8 times.
+Rungs are applied with the server's live reconfiguration, so players see at most a
+discontinuity. Every decision is logged and kept for /governor.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
+
+from metrics import counter, gauge
+from quality_profiles import PRESETS, SCALER_COST, ProfileError
+
+logger = logging.getLogger(__name__)
+
+PRESET_FLOOR = 'veryfast'  # Faster presets cost more bitrate than they save CPU on this content
+MIN_FPS = 25
+CHEAP_SCALER = 'neighbor'
+RESOLUTION_STEPS = (2160, 1440, 1080, 720, 540)
+
+
+def quality_ladder(profile):
+    """[(label, profile)] from profile itself down to its cheapest variant, one change per rung"""
+    ladder = [('profile', profile)]
+
+    def step(label, overrides):
+        try:
+            ladder.append((label, ladder[-1][1].with_overrides(overrides)))
+        except ProfileError as e:
+            logger.debug(f'Quality ladder for {profile.name}: skipping {label}: {e}')
+
+    floor = PRESETS.index(PRESET_FLOOR)
+    while True:
+        current = ladder[-1][1].config
+        faster = {output: {'preset': PRESETS[PRESETS.index(current[output]['preset']) - 1]}
+                  for output in ('web', 'youtube') if PRESETS.index(current[output]['preset']) > floor}
+        if not faster:
+            break
+        step('preset ' + ', '.join(f'{output} {fields["preset"]}' for output, fields in faster.items()), faster)
+
+    fps = profile.fps
+    if fps % 2 == 0 and fps // 2 >= MIN_FPS:
+        step(f'fps {fps // 2}', {'capture': {'fps': fps // 2}})
+
+    scale = profile.config['scale']
+    if scale and SCALER_COST[scale['flags']] > SCALER_COST[CHEAP_SCALER]:
+        step(f'scaler {CHEAP_SCALER}', {'scale': {'flags': CHEAP_SCALER}})
+
+    if scale:
+        width, height = (int(value) for value in scale['resolution'].split('x'))
+        for lower in RESOLUTION_STEPS:
+            if lower >= height:
+                continue
+            resolution = f'{round(lower * width / height / 2) * 2}x{lower}'
+            step(f'resolution {resolution}', {'scale': {'resolution': resolution}})
+            break
+    return ladder
+
+
+def run_delay(pid):
+    """Seconds the threads of pid have waited on a run queue so far, or None"""
+    total = 0
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return None
+    for task in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{task}/schedstat') as f:
+                total += int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            continue  # Thread exited while we were reading
+    return total / 1e9
+
+
+class QualityGovernor:
+    """Moves the live encode along a quality_ladder() according to CPU pressure.
+
+    apply(profile) switches the running encoders (the server's reconfigure()). encoders
+    is the EncoderMonitor, emulator() returns the FUSE Popen or None.
+    """
+
+    def __init__(self, apply, encoders, emulator, interval=5.0, down_after=2, up_after=12,
+                 min_pace=0.97, max_run_delay=0.05, max_steal=0.1):
+        self.apply = apply
+        self.encoders = encoders
+        self.emulator = emulator
+        self.interval = interval
+        self.down_after = down_after
+        self.up_after = up_after
+        self.min_pace = min_pace
+        self.max_run_delay = max_run_delay
+        self.max_steal = max_steal
+        self.ladder = []
+        self.rung = 0
+        self.signals = {}
+        self.decisions = deque(maxlen=50)
+        self.stats = {'steps_down': 0, 'steps_up': 0, 'apply_errors': 0}
+        self._lock = threading.Lock()
+        self._over = 0
+        self._clear = 0
+        self._settle = 0
+        self._backoff = 1
+        self._stepped_up_at = None
+        self._last = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def rebase(self, profile):
+        """Apply a base profile chosen by the operator and start again from its top rung"""
+        with self._lock:
+            self.apply(profile)
+            self.ladder = quality_ladder(profile)
+            self.rung = 0
+            self._over = self._clear = 0
+            self._backoff = 1
+            self._settle = 2
+        logger.info(f'Quality governor ladder for {profile.name}: '
+                    + ' > '.join(label for label, _ in self.ladder))
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='quality-governor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f'Quality governor error: {e}')
+
+    def _delta(self, key, value, now):
+        """Rate of change of value since the previous sample under key, or None on the first"""
+        previous = self._last.get(key)
+        self._last[key] = (value, now)
+        if previous is None or value is None or previous[0] is None or now <= previous[1]:
+            return None
+        return (value - previous[0]) / (now - previous[1])
+
+    def sample(self):
+        """Current signals: worst encoder pace, emulator run-queue share and host steal share"""
+        now = time.monotonic()
+        paces = {}
+        seen = set()
+        for child in self.encoders.processes():
+            if not child.running or child.progress_at is None or not child.expected_fps:
+                continue
+            # Keyed on the process, so a replaced encoder starts a fresh series
+            key = (child.name, child.process.pid)
+            seen.add(key)
+            out_rate = self._delta((key, 'out'), child.progress.get('out_time'), child.progress_at)
+            frame_rate = self._delta((key, 'frames'), child.progress.get('frame'), child.progress_at)
+            if out_rate is not None and frame_rate is not None:
+                paces[child.name] = min(out_rate, frame_rate / child.expected_fps)
+        for key in [key for key in self._last if key[1] in ('out', 'frames') and key[0] not in seen]:
+            del self._last[key]
+
+        process = self.emulator()
+        delay = run_delay(process.pid) if process and process.poll() is None else None
+        run_delay_share = self._delta(('emulator', process.pid if process else None), delay, now)
+
+        times = psutil.cpu_times()
+        steal = self._delta(('host', 'steal'), getattr(times, 'steal', 0.0), now)
+        # Guest time is already included in user time
+        busy = sum(times) - getattr(times, 'guest', 0.0) - getattr(times, 'guest_nice', 0.0)
+        total = self._delta(('host', 'cpu'), busy, now)
+        steal_share = steal / total if steal is not None and total else None
+
+        self.signals = {
+            'encoder_pace': {name: round(pace, 3) for name, pace in paces.items()},
+            'emulator_run_delay': round(run_delay_share, 4) if run_delay_share is not None else None,
+            'host_steal': round(steal_share, 4) if steal_share is not None else None,
+        }
+        return paces, run_delay_share, steal_share
+
+    def tick(self):
+        paces, delay, steal = self.sample()
+        reasons = [f'{name} encoder at {pace:.2f}x real time' for name, pace in paces.items() if pace < self.min_pace]
+        if delay is not None and delay > self.max_run_delay:
+            reasons.append(f'emulator waited for a CPU {delay:.1%} of the time')
+        if steal is not None and steal > self.max_steal:
+            reasons.append(f'host steal at {steal:.1%}')
+        # Well inside the limits, so a step up is unlikely to bounce straight back
+        clear = (all(pace >= 0.99 for pace in paces.values())
+                 and (delay is None or delay < self.max_run_delay / 5)
+                 and (steal is None or steal < self.max_steal / 3))
+
+        with self._lock:
+            if not self.ladder:
+                return
+            if self._settle:
+                # The encoders were just replaced and are warming up
+                self._settle -= 1
+                return
+            self._over = self._over + 1 if reasons else 0
+            self._clear = self._clear + 1 if clear else 0
+            if self._over >= self.down_after:
+                if self.rung == len(self.ladder) - 1:
+                    if self._over == self.down_after:
+                        logger.warning(f'Quality governor: at the bottom of the ladder and still '
+                                       f'overloaded ({"; ".join(reasons)})')
+                    return
+                if self._stepped_up_at and time.monotonic() - self._stepped_up_at < self.up_after * self.interval * 2:
+                    self._backoff = min(self._backoff * 2, 8)
+                self._step(self.rung + 1, '; '.join(reasons))
+            elif self._clear >= self.up_after * self._backoff and self.rung > 0:
+                self._step(self.rung - 1, f'clear for {self._clear * self.interval:.0f}s')
+
+    def _step(self, rung, reason):
+        label, profile = self.ladder[rung]
+        direction = 'down' if rung > self.rung else 'up'
+        changed = self.ladder[max(rung, self.rung)][0]
+        logger.info(f'Quality governor: step {direction} to rung {rung}/{len(self.ladder) - 1} '
+                    f'({"undo " if direction == "up" else ""}{changed}): {reason}; signals {self.signals}')
+        self._over = self._clear = 0
+        self._settle = 2
+        try:
+            self.apply(profile)
+        except Exception as e:
+            self.stats['apply_errors'] += 1
+            logger.error(f'Quality governor: could not apply rung {rung}: {e}')
+            return
+        self.rung = rung
+        self.stats[f'steps_{direction}'] += 1
+        self._stepped_up_at = time.monotonic() if direction == 'up' else self._stepped_up_at
+        self.decisions.append({'at': time.time(), 'direction': direction, 'rung': rung, 'change': changed,
+                               'reason': reason, 'signals': self.signals})
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            rung=self.rung,
+            ladder=[label for label, _ in self.ladder],
+            signals=self.signals,
+            retry_backoff=self._backoff,
+            decisions=list(self.decisions),
+        )
+
+    def families(self):
+        rung = gauge('spectrum_governor_rung', 'Quality ladder rung in use (0 = the profile as configured)')
+        rung.add(self.rung)
+        steps = counter('spectrum_governor_steps_total', 'Quality ladder steps')
+        steps.add(self.stats['steps_down'], direction='down')
+        steps.add(self.stats['steps_up'], direction='up')
+        pace = gauge('spectrum_governor_encoder_pace', 'Encoder output per second of wall clock (1 = real time)')
+        for name, value in self.signals.get('encoder_pace', {}).items():
+            pace.add(value, process=name)
+        families = [rung, steps, pace]
+        if self.signals.get('emulator_run_delay') is not None:
+            delay = gauge('spectrum_emulator_run_delay_ratio', 'Share of time FUSE waited for a CPU')
+            delay.add(self.signals['emulator_run_delay'])
+            families.append(delay)
+        if self.signals.get('host_steal') is not None:
+            steal = gauge('spectrum_host_steal_ratio', 'Share of CPU time stolen by the hypervisor')
+            steal.add(self.signals['host_steal'])
+            families.append(steal)
+        return families
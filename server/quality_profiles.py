@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""Declarative capture/encode quality profiles and the ffmpeg commands built from them.
+
+A profile is a JSON (or, with PyYAML installed, YAML) file in quality_profiles/ named
+after the profile. It describes the X11 capture, the optional scaler, audio, the HLS
+segmenting and one x264 section per output (web and youtube). Every value is
+validated when the profile is loaded, so a typo fails at load time with the field's
+path instead of as an ffmpeg exit minutes into a stream.
+
+    python3 quality_profiles.py            # validate every profile, exit 1 on errors
+    python3 quality_profiles.py hq         # print hq's commands and resource estimate
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import sys
+from fractions import Fraction
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(__file__).resolve().parent / 'quality_profiles'
+X_DISPLAY = ':99'
+OUTPUTS = ('web', 'youtube')
+# timer: x11grab samples the display at capture.fps. frame: every emulated frame, or every
+# second one, as FUSE completes it (frame_capture.py)
+CAPTURE_CLOCKS = ('timer', 'frame')
+SPECTRUM_FRAME_RATE = Fraction(3500000, 69888)  # 48K: 69888 T-states per frame at 3.5 MHz, 50.08 Hz
+FRAME_SOCKET_DIR = '/tmp'
+
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+# x264 takes at most one psychovisual tune, optionally combined with the speed tunes
+PSY_TUNES = ('film', 'animation', 'grain', 'stillimage', 'psnr', 'ssim')
+TUNES = ('zerolatency', 'fastdecode') + PSY_TUNES
+H264_PROFILES = ('baseline', 'main', 'high')
+SCALERS = ('neighbor', 'fast_bilinear', 'bilinear', 'bicubic', 'area', 'lanczos', 'spline')
+SAMPLE_RATES = (22050, 32000, 44100, 48000)
+# Maximum macroblocks per second for each H.264 level (Annex A, table A-1)
+H264_LEVELS = {'3.0': 40500, '3.1': 108000, '3.2': 216000, '4.0': 245760, '4.1': 245760,
+               '4.2': 522240, '5.0': 589824, '5.1': 983040, '5.2': 2073600}
+
+# Rough x264 cost per preset relative to ultrafast, and the output pixel rate one core
+# encodes at ultrafast. Planning numbers for estimate(), not measurements of this host.
+PRESET_COST = {'ultrafast': 1.0, 'superfast': 1.5, 'veryfast': 2.2, 'faster': 3.0, 'fast': 3.8,
+               'medium': 4.8, 'slow': 7.0, 'slower': 12.0, 'veryslow': 25.0}
+ULTRAFAST_PIXELS_PER_CORE = 100e6
+# Cores per million output pixels/s for the swscale filters
+SCALER_COST = {'neighbor': 0.002, 'fast_bilinear': 0.003, 'bilinear': 0.004, 'area': 0.004,
+               'bicubic': 0.006, 'spline': 0.009, 'lanczos': 0.01}
+
+REQUIRED = object()
+
+
+class ProfileError(ValueError):
+    """A profile is missing, malformed or cannot be used on this display"""
+
+
+def _size(value):
+    match = re.fullmatch(r'(\d+)x(\d+)', str(value))
+    if not match:
+        raise ValueError(f'{value!r} is not WIDTHxHEIGHT')
+    width, height = int(match.group(1)), int(match.group(2))
+    if not (16 <= width <= 7680 and 16 <= height <= 4320):
+        raise ValueError(f'{value!r} is outside 16x16..7680x4320')
+    if width % 2 or height % 2:
+        raise ValueError(f'{value!r} must have even dimensions for yuv420p')
+    return value
+
+
+def _capture_size(value):
+    return value if value == 'display' else _size(value)
+
+
+def _offset(value):
+    if not re.fullmatch(r'\d+,\d+', str(value)):
+        raise ValueError(f'{value!r} is not X,Y')
+    return value
+
+
+def _bitrate(value):
+    if not re.fullmatch(r'[1-9]\d*k', str(value)):
+        raise ValueError(f'{value!r} is not a bitrate like 2500k')
+    return value
+
+
+def _choice(options):
+    def check(value):
+        if value not in options:
+            raise ValueError(f'{value!r} is not one of {", ".join(map(str, options))}')
+        return value
+    return check
+
+
+def _tune(value):
+    parts = str(value).split(',')
+    for part in parts:
+        if part not in TUNES:
+            raise ValueError(f'{part!r} is not one of {", ".join(TUNES)}')
+    if len(set(parts)) != len(parts) or sum(part in PSY_TUNES for part in parts) > 1:
+        raise ValueError(f'{value!r} repeats a tune or combines psychovisual tunes')
+    return value
+
+
+def _number(low, high, integer=True):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            raise ValueError(f'{value!r} is not {"an integer" if integer else "a number"}')
+        if not low <= value <= high:
+            raise ValueError(f'{value!r} is outside {low}..{high}')
+        return value
+    return check
+
+
+_VIDEO = {
+    'preset': (_choice(PRESETS), 'veryfast'),
+    'tune': (_tune, 'zerolatency'),
+    'profile': (_choice(H264_PROFILES), None),
+    'level': (_choice(tuple(H264_LEVELS)), None),
+    'bitrate': (_bitrate, None),
+    'maxrate': (_bitrate, None),
+    'bufsize': (_bitrate, None),
+    'crf': (_number(0, 51), None),
+    'gop_seconds': (_number(0.5, 10, integer=False), 2),
+    'threads': (_number(1, 64), None),
+    'slices': (_number(1, 32), None),
+}
+
+# Sections map field -> (check, default). A None default makes the field optional (null
+# or missing leaves the option out). Sections in NULLABLE may be null as a whole (no
+# scaling, no audio); the value is what a profile that leaves the section out gets.
+SCHEMA = {
+    'capture': {
+        'size': (_capture_size, 'display'),
+        'offset': (_offset, '0,0'),
+        'fps': (_number(1, 120), 25),
+        'clock': (_choice(CAPTURE_CLOCKS), 'timer'),
+    },
+    'scale': {
+        'resolution': (_size, REQUIRED),
+        'flags': (_choice(SCALERS), 'bicubic'),
+    },
+    'audio': {
+        'bitrate': (_bitrate, '128k'),
+        'sample_rate': (_choice(SAMPLE_RATES), 44100),
+        'channels': (_number(1, 2), None),
+    },
+    'hls': {
+        'segment_seconds': (_number(1, 10), 2),
+        'list_size': (_number(2, 30), 5),
+    },
+    'web': _VIDEO,
+    'youtube': _VIDEO,
+}
+NULLABLE = {'scale': None, 'audio': {}}
+
+
+def _validate_section(fields, data, path):
+    if not isinstance(data, dict):
+        raise ProfileError(f'{path}: expected an object, got {data!r}')
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ProfileError(f'{path}: unknown field {sorted(unknown)[0]!r} (known: {", ".join(fields)})')
+    result = {}
+    for field, (check, default) in fields.items():
+        value = data.get(field, default)
+        if value is REQUIRED:
+            raise ProfileError(f'{path}.{field}: required')
+        if value is not None:
+            try:
+                value = check(value)
+            except ValueError as e:
+                raise ProfileError(f'{path}.{field}: {e}') from None
+        result[field] = value
+    return result
+
+
+def _kbps(bitrate):
+    return int(bitrate[:-1]) if bitrate else None
+
+
+def _dimensions(size):
+    width, height = size.split('x')
+    return int(width), int(height)
+
+
+class QualityProfile:
+    """One validated profile; the data is the profile file with every default filled in"""
+
+    def __init__(self, name, data):
+        self.name = name
+        if not isinstance(data, dict):
+            raise ProfileError(f'{name}: expected an object')
+        unknown = set(data) - set(SCHEMA) - {'description'}
+        if unknown:
+            raise ProfileError(f'{name}: unknown section {sorted(unknown)[0]!r} (known: {", ".join(SCHEMA)})')
+        config = {'description': data.get('description', '')}
+        if not isinstance(config['description'], str):
+            raise ProfileError(f'{name}.description: expected a string')
+        for section, fields in SCHEMA.items():
+            value = data.get(section, NULLABLE.get(section, {}))
+            if value is None and section in NULLABLE:
+                config[section] = None
+            else:
+                config[section] = _validate_section(fields, value, f'{name}.{section}')
+        self.config = config
+        self._check_consistency()
+
+    def _check_consistency(self):
+        fps = self.fps
+        if self.config['capture']['clock'] == 'frame' and fps not in (25, 50):
+            raise ProfileError(f'{self.name}.capture.fps: the frame clock sends every emulated frame (50) '
+                               f'or every second one (25), not {fps}')
+        for output in OUTPUTS:
+            video = self.config[output]
+            path = f'{self.name}.{output}'
+            if video['bitrate'] is None and video['crf'] is None:
+                raise ProfileError(f'{path}: needs a bitrate or a crf')
+            if video['maxrate'] and video['bitrate'] and _kbps(video['maxrate']) < _kbps(video['bitrate']):
+                raise ProfileError(f'{path}.maxrate: below bitrate {video["bitrate"]}')
+            if video['maxrate'] and not video['bufsize']:
+                raise ProfileError(f'{path}.bufsize: required with maxrate')
+            if not float(fps * video['gop_seconds']).is_integer():
+                raise ProfileError(f'{path}.gop_seconds: {video["gop_seconds"]}s is not a whole number of '
+                                   f'frames at {fps} fps')
+            if video['level'] and self.config['scale']:
+                # Checked against the scaled size; capture 'display' is only known at run time
+                width, height = _dimensions(self.config['scale']['resolution'])
+                macroblocks = math.ceil(width / 16) * math.ceil(height / 16) * fps
+                if macroblocks > H264_LEVELS[video['level']]:
+                    raise ProfileError(f'{path}.level: {video["level"]} allows {H264_LEVELS[video["level"]]} '
+                                       f'macroblocks/s, {width}x{height}@{fps} needs {macroblocks}')
+        segment = self.config['hls']['segment_seconds']
+        gop = self.config['web']['gop_seconds']
+        if segment % gop:
+            raise ProfileError(f'{self.name}.hls.segment_seconds: {segment}s is not a multiple of '
+                               f'web.gop_seconds ({gop}s), segments would not start on keyframes')
+
+    @property
+    def description(self):
+        return self.config['description']
+
+    @property
+    def fps(self):
+        return self.config['capture']['fps']
+
+    @property
+    def frame_rate(self):
+        """Exact capture rate: fps, or the emulator's frame rate (or half) on the frame clock"""
+        if self.config['capture']['clock'] == 'frame':
+            return SPECTRUM_FRAME_RATE / self.frame_divisor
+        return Fraction(self.fps)
+
+    @property
+    def frame_divisor(self):
+        return 50 // self.fps if self.config['capture']['clock'] == 'frame' else 1
+
+    def capture_size(self, display_size):
+        size = self.config['capture']['size']
+        return display_size if size == 'display' else size
+
+    def output_resolution(self, display_size):
+        scale = self.config['scale']
+        return scale['resolution'] if scale else self.capture_size(display_size)
+
+    def check_display(self, display_size):
+        """Raise ProfileError unless the capture area lies inside the X display"""
+        width, height = _dimensions(self.capture_size(display_size))
+        x, y = (int(v) for v in self.config['capture']['offset'].split(','))
+        display_width, display_height = _dimensions(display_size)
+        if x + width > display_width or y + height > display_height:
+            raise ProfileError(f'{self.name}: capture {width}x{height}+{x},{y} does not fit the '
+                               f'{display_size} display')
+
+    def with_overrides(self, overrides):
+        """A validated copy with some fields replaced, e.g. {'web': {'preset': 'veryfast'}}"""
+        config = {section: dict(value) if isinstance(value, dict) else value
+                  for section, value in self.config.items()}
+        for section, fields in overrides.items():
+            if section not in SCHEMA or not isinstance(fields, dict):
+                raise ProfileError(f'{self.name}: cannot override {section!r} with {fields!r}')
+            # A disabled section (no scaling, no audio) is switched on with the given fields
+            config[section] = dict(config[section] or {}, **fields)
+        return QualityProfile(self.name, config)
+
+    def describe(self, display_size):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'capture': self.capture_size(display_size),
+            'output_resolution': self.output_resolution(display_size),
+            'fps': self.fps,
+            'clock': self.config['capture']['clock'],
+        }
+
+
+def _input_args(profile, source, display_size, clip=None, offset=None):
+    fps = str(profile.fps)
+    audio = profile.config['audio']
+    # Every input starts at offset seconds, so successive encoders share one timeline
+    shift = ['-itsoffset', f'{offset:.3f}'] if offset else []
+    if source == 'replay':
+        # A recording of the display (encoder_autotune.py record), looped in real time
+        args = ['-re', '-stream_loop', '-1'] + shift + ['-i', str(clip)]
+        if audio:
+            args += ['-f', 'lavfi'] + shift + ['-i', 'sine=frequency=1000:duration=0']
+        return args
+    if source == 'test_pattern':
+        args = ['-f', 'lavfi'] + shift + ['-i', f'testsrc2=size={profile.output_resolution(display_size)}:rate={fps}:duration=0']
+        if audio:
+            args += ['-f', 'lavfi'] + shift + ['-i', 'sine=frequency=1000:duration=0']
+        return args
+    if source != 'x11':
+        raise ValueError(f'Unknown source {source!r}')
+    capture = profile.config['capture']
+    if capture['clock'] == 'frame':
+        # Raw frames from frame_capture.py, timestamped by frame count at the emulator's rate
+        args = ['-f', 'rawvideo', '-pixel_format', 'bgr0', '-video_size', profile.capture_size(display_size),
+                '-framerate', str(profile.frame_rate)] + shift + ['-i', f'unix:{frame_socket(profile, display_size)}']
+    else:
+        args = ['-f', 'x11grab', '-video_size', profile.capture_size(display_size), '-framerate', fps] + shift + [
+                '-i', f'{X_DISPLAY}.0+{capture["offset"]}']
+    if audio:
+        args += ['-f', 'pulse'] + shift + ['-i', 'default']
+    return args
+
+
+def frame_socket(profile, display_size):
+    """Unix socket a frame clock capture of profile's capture area is served on"""
+    capture = profile.config['capture']
+    return (f'{FRAME_SOCKET_DIR}/spectrum-frames-{profile.capture_size(display_size)}'
+            f'+{capture["offset"].replace(",", "+")}-{profile.frame_divisor}.sock')
+
+
+def encode_args(profile, output, source):
+    """Scaling, x264 and audio options for one output; captured sources get the scale filter"""
+    video = profile.config[output]
+    fps = profile.fps
+    rate = float(profile.frame_rate)
+    # The keyframe grid below is in stream time. On the frame clock (50.08 fps) grid points
+    # are 100 or 101 frames apart, so -g is the longest gap and only ever backs the grid up
+    gop = math.ceil(profile.frame_rate * Fraction(str(video['gop_seconds'])))
+    # Window of one frame at each grid point, rounded down so two frames can never both fall in it
+    window = math.floor(1e6 / rate) / 1e6
+    args = []
+    scale = profile.config['scale']
+    if scale and source != 'test_pattern':
+        args += ['-vf', f'scale={scale["resolution"]}:flags={scale["flags"]}']
+    args += ['-c:v', 'libx264', '-preset', video['preset']]
+    if video['tune']:
+        args += ['-tune', video['tune']]
+    if video['profile']:
+        args += ['-profile:v', video['profile']]
+    if video['level']:
+        args += ['-level', video['level']]
+    if video['threads']:
+        args += ['-threads', str(video['threads'])]
+    if video['slices']:
+        args += ['-slices', str(video['slices'])]
+    args += ['-g', str(gop), '-keyint_min', str(min(gop, fps)), '-sc_threshold', '0',
+             # Keyframes on whole multiples of the GOP length in stream time, not counted from the
+             # encoder's first frame, so two encoders on one timeline cut segments at the same instants
+             '-force_key_frames', f'expr:lt(mod(t+{0.5 / rate:.6f},{video["gop_seconds"]}),{window:.6f})']
+    if video['crf'] is not None:
+        args += ['-crf', str(video['crf'])]
+    for option in ('bitrate', 'maxrate', 'bufsize'):
+        if video[option]:
+            args += ['-b:v' if option == 'bitrate' else f'-{option}', video[option]]
+    args += ['-pix_fmt', 'yuv420p']
+
+    audio = profile.config['audio']
+    if audio:
+        args += ['-c:a', 'aac', '-b:a', audio['bitrate'], '-ar', str(audio['sample_rate'])]
+        if audio['channels']:
+            args += ['-ac', str(audio['channels'])]
+    else:
+        args += ['-an']
+    return args
+
+
+def _segment_pattern(playlist):
+    # live3.m3u8 -> live3_0.ts, live3_1.ts, ...: never shared between two playlists in one directory
+    playlist = Path(playlist)
+    return str(playlist.with_name(f'{playlist.stem}_%d.ts'))
+
+
+def hls_command(profile, source, playlist, display_size, clip=None, offset=None):
+    """ffmpeg command for the web output: capture (test pattern, replay) to a live HLS playlist"""
+    hls = profile.config['hls']
+    return (['ffmpeg', '-y'] + _input_args(profile, source, display_size, clip, offset)
+            + encode_args(profile, 'web', source)
+            + ['-f', 'hls', '-hls_time', str(hls['segment_seconds']), '-hls_list_size', str(hls['list_size']),
+               '-hls_flags', 'delete_segments', '-hls_segment_filename', _segment_pattern(playlist), str(playlist)])
+
+
+def rtmp_command(profile, source, url, display_size, clip=None):
+    """ffmpeg command for the youtube output: capture (test pattern, replay) to an RTMP ingest"""
+    return (['ffmpeg', '-y'] + _input_args(profile, source, display_size, clip)
+            + encode_args(profile, 'youtube', source)
+            + ['-f', 'flv', url])
+
+
+def slate_command(profile, output, path, display_size, seconds):
+    """ffmpeg command that pre-encodes seconds of bars and tone with output's settings to an MPEG-TS file"""
+    resolution = profile.output_resolution(display_size)
+    args = ['ffmpeg', '-y', '-f', 'lavfi', '-i', f'smptehdbars=size={resolution}:rate={profile.fps}']
+    if profile.config['audio']:
+        args += ['-f', 'lavfi', '-i', 'sine=frequency=1000']
+    return args + ['-t', str(seconds)] + encode_args(profile, output, 'test_pattern') + ['-f', 'mpegts', str(path)]
+
+
+def slate_hls_command(profile, slate, playlist, offset=None):
+    """ffmpeg command looping a pre-encoded slate into the live HLS playlist without re-encoding"""
+    hls = profile.config['hls']
+    shift = ['-itsoffset', f'{offset:.3f}'] if offset else []
+    return ['ffmpeg', '-y', '-re', '-stream_loop', '-1'] + shift + ['-i', str(slate), '-c', 'copy',
+            '-f', 'hls', '-hls_time', str(hls['segment_seconds']), '-hls_list_size', str(hls['list_size']),
+            '-hls_flags', 'delete_segments', '-hls_segment_filename', _segment_pattern(playlist), str(playlist)]
+
+
+def slate_rtmp_command(profile, slate, url):
+    """ffmpeg command looping a pre-encoded slate to an RTMP ingest without re-encoding"""
+    args = ['ffmpeg', '-y', '-re', '-stream_loop', '-1', '-i', str(slate), '-c', 'copy']
+    if profile.config['audio']:
+        args += ['-bsf:a', 'aac_adtstoasc']
+    return args + ['-f', 'flv', url]
+
+
+def estimate(profile, display_size):
+    """Planning estimate of CPU, bandwidth and S3 traffic for each output.
+
+    CPU comes from PRESET_COST and the output pixel rate, so treat it as an order of
+    magnitude. CRF-only outputs use maxrate as their bitrate bound, or report None.
+    """
+    width, height = _dimensions(profile.output_resolution(display_size))
+    pixel_rate = width * height * profile.fps
+    scale = profile.config['scale']
+    audio = profile.config['audio']
+    audio_kbps = _kbps(audio['bitrate']) if audio else 0
+    result = {}
+    for output in OUTPUTS:
+        video = profile.config[output]
+        cores = pixel_rate * PRESET_COST[video['preset']] / ULTRAFAST_PIXELS_PER_CORE
+        if scale:
+            cores += pixel_rate / 1e6 * SCALER_COST[scale['flags']]
+        video_kbps = _kbps(video['bitrate'] or video['maxrate'])
+        total_kbps = video_kbps + audio_kbps if video_kbps else None
+        result[output] = {
+            'cpu_cores': round(cores, 2),
+            'pixels_per_second': pixel_rate,
+            'video_kbps': video_kbps,
+            'total_kbps': total_kbps,
+        }
+    web_kbps = result['web']['total_kbps']
+    segments_per_hour = 3600 / profile.config['hls']['segment_seconds']
+    result['web'].update(
+        hls_bytes_per_hour=int(web_kbps * 1000 / 8 * 3600) if web_kbps else None,
+        # One segment plus one playlist PUT per segment
+        s3_puts_per_hour=int(segments_per_hour * 2),
+    )
+    result['cpu_cores_total'] = round(sum(result[output]['cpu_cores'] for output in OUTPUTS), 2)
+    return result
+
+
+def _read(path):
+    text = path.read_text()
+    if path.suffix == '.json':
+        return json.loads(text)
+    import yaml
+    return yaml.safe_load(text)
+
+
+def load_profiles(directory=PROFILE_DIR):
+    """Load and validate every profile in directory; invalid files are logged and skipped"""
+    directory = Path(directory)
+    try:
+        import yaml  # noqa: F401
+        suffixes = ('.json', '.yaml', '.yml')
+    except ImportError:
+        suffixes = ('.json',)
+        if any(directory.glob('*.y*ml')):
+            logger.warning(f'PyYAML is not installed, YAML profiles in {directory} are ignored')
+    profiles = {}
+    for path in sorted(directory.iterdir()):
+        if path.suffix not in suffixes:
+            continue
+        try:
+            profiles[path.stem] = QualityProfile(path.stem, _read(path))
+        except (ProfileError, ValueError, OSError) as e:
+            logger.error(f'Invalid quality profile {path}: {e}')
+    return profiles
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Validate quality profiles and show what they run')
+    parser.add_argument('names', nargs='*', help='profiles to print commands and estimates for')
+    parser.add_argument('--dir', default=os.getenv('QUALITY_PROFILE_DIR', PROFILE_DIR))
+    parser.add_argument('--display', default=os.getenv('DISPLAY_SIZE', '512x384'), help='X display size')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    files = [path for path in Path(args.dir).iterdir() if path.suffix in ('.json', '.yaml', '.yml')]
+    profiles = load_profiles(args.dir)
+    ok = len(profiles) == len(files)
+    report = {}
+    for name in args.names or sorted(profiles):
+        profile = profiles.get(name)
+        if not profile:
+            report[name] = {'error': 'missing or invalid'}
+            ok = False
+            continue
+        entry = dict(profile.describe(args.display), estimate=estimate(profile, args.display))
+        if args.names:
+            entry['commands'] = {
+                'web': hls_command(profile, 'x11', '/tmp/stream/stream.m3u8', args.display),
+                'youtube': rtmp_command(profile, 'x11', 'rtmp://a.rtmp.youtube.com/live2/KEY', args.display),
+            }
+        report[name] = entry
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
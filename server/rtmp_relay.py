@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+TAG_AUDIO, TAG_VIDEO, TAG_SCRIPT = 8, 9, 18
+CODEC_AVC, SOUND_AAC = 7, 10
+
+# data is the complete tag: 11-byte header, body and the trailing previous-tag-size
+Tag = namedtuple('Tag', 'type timestamp keyframe config data')
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_flv(stream):
+    """Yield the FLV file header, then a Tag for every tag, from a socket until EOF"""
+    header = _read_exactly(stream, 9)
+    if header is None or header[:3] != b'FLV':
+        raise ValueError('Not an FLV stream')
+    skip = int.from_bytes(header[5:9], 'big') - 9 + 4  # Rest of the header, first previous-tag-size
+    yield header + (b'\x00' * 4)
+    if skip and _read_exactly(stream, skip) is None:
+        return
+    while True:
+        head = _read_exactly(stream, 11)
+        if head is None:
+            return
+        size = int.from_bytes(head[1:4], 'big')
+        rest = _read_exactly(stream, size + 4)
+        if rest is None:
+            return
+        kind = head[0] & 0x1f
+        timestamp = int.from_bytes(head[4:7], 'big') | (head[7] << 24)
+        first = rest[0] if size else 0
+        second = rest[1] if size > 1 else 1
+        keyframe = kind == TAG_VIDEO and first >> 4 == 1
+        # Sequence headers and metadata are resent to every (re)connecting destination
+        config = (kind == TAG_SCRIPT
+                  or (kind == TAG_VIDEO and first & 0x0f == CODEC_AVC and second == 0)
+                  or (kind == TAG_AUDIO and first >> 4 == SOUND_AAC and second == 0))
+        yield Tag(kind, timestamp, keyframe, config, head + rest)
+
+
+def retime(tag, offset):
+    """tag moved offset milliseconds along the timeline"""
+    timestamp = max(0, tag.timestamp + offset) & 0xffffffff
+    data = tag.data[:4] + (timestamp & 0xffffff).to_bytes(3, 'big') + bytes([timestamp >> 24]) + tag.data[8:]
+    return tag._replace(timestamp=timestamp, data=data)
+
+
+def redact(url):
+    """url without the stream key (last RTMP path segment, SRT query string)"""
+    if url.startswith('srt://'):
+        return url.split('?')[0]
+    return url.rsplit('/', 1)[0] + '/...'
+
+
+def forward_command(url):
+    """ffmpeg pushing an FLV stream from stdin to url without re-encoding"""
+    muxer = 'mpegts' if url.startswith('srt://') else 'flv'
+    return ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error', '-f', 'flv', '-i', 'pipe:0',
+            '-c', 'copy', '-f', muxer, url]
+
+
+class Destination:
+    """One relay target with its own bounded backlog, forwarder process and reconnect backoff.
+
+    The relay appends tags without ever blocking; a sender thread writes them to an
+    ffmpeg forwarder. When the forwarder dies (network blip, ingest restart) the
+    backlog keeps filling up to max_backlog_seconds / max_backlog_bytes, dropping
+    whole GOPs from the front, and the forwarder is restarted after a backoff that
+    doubles up to max_backoff. A new connection gets the FLV header and sequence
+    headers first and then starts at a keyframe.
+
+    reset() reconnects onto a new input stream; switch() continues the current
+    connection with the next encoder's tags, sending changed sequence headers inline.
+    """
+
+    def __init__(self, name, url, max_backlog_seconds=10.0, max_backlog_bytes=16 * 1024 * 1024,
+                 backoff=1.0, max_backoff=30.0, command=None):
+        self.name = name
+        self.url = url
+        self.max_backlog_seconds = max_backlog_seconds
+        self.max_backlog_bytes = max_backlog_bytes
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.command = command or forward_command(url)
+        self.state = 'waiting'
+        self.stats = {
+            'connects': 0,
+            'disconnects': 0,
+            'bytes_sent': 0,
+            'tags_sent': 0,
+            'dropped_tags': 0,
+            'dropped_bytes': 0,
+        }
+        self.last_error = None
+        self.connected_at = None
+
+        self._backlog = deque()
+        self._backlog_bytes = 0
+        self._header = None
+        self._config = []
+        self._generation = 0
+        self._process = None
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f'relay-{name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def reset(self, header, config):
+        """A new input stream: drop the old backlog and reconnect with the new headers"""
+        with self._cond:
+            self._header = header
+            self._config = list(config)
+            self._backlog.clear()
+            self._backlog_bytes = 0
+            self._generation += 1
+            self._cond.notify()
+
+    def switch(self, config, changed):
+        """The next encoder takes over the same connection; changed sequence headers go out inline"""
+        with self._cond:
+            self._config = list(config)
+            for tag in changed:
+                self._backlog.append(tag)
+                self._backlog_bytes += len(tag.data)
+            self._cond.notify()
+
+    def end(self):
+        """The input stream ended: close the forwarder and wait for the next one"""
+        with self._cond:
+            self._header = None
+            self._generation += 1
+            self._cond.notify()
+
+    def put(self, tag):
+        with self._cond:
+            self._backlog.append(tag)
+            self._backlog_bytes += len(tag.data)
+            if self._over_budget():
+                self._drop_gop()
+            self._cond.notify()
+
+    def _backlog_seconds(self):
+        if len(self._backlog) < 2:
+            return 0.0
+        return (self._backlog[-1].timestamp - self._backlog[0].timestamp) / 1000
+
+    def _over_budget(self):
+        return (self._backlog_bytes > self.max_backlog_bytes
+                or self._backlog_seconds() > self.max_backlog_seconds)
+
+    def _drop_gop(self):
+        """Drop from the front through the next keyframe, so the backlog still starts on one"""
+        while self._backlog:
+            tag = self._backlog.popleft()
+            self._backlog_bytes -= len(tag.data)
+            self.stats['dropped_tags'] += 1
+            self.stats['dropped_bytes'] += len(tag.data)
+            if self._backlog and (self._backlog[0].keyframe or self._backlog[0].config):
+                break
+
+    def _next(self, generation):
+        """The next tag to send, None after a reset or stop"""
+        with self._cond:
+            while not self._backlog and generation == self._generation and not self._stopped:
+                self._cond.wait(1.0)
+                if self._process and self._process.poll() is not None:
+                    return None
+            if generation != self._generation or self._stopped:
+                return None
+            tag = self._backlog.popleft()
+            self._backlog_bytes -= len(tag.data)
+            return tag
+
+    def _connect(self):
+        """Start a forwarder and send it the stream headers; returns the input generation"""
+        with self._cond:
+            while self._header is None and not self._stopped:
+                self.state = 'waiting'
+                self._cond.wait()
+            if self._stopped:
+                return None
+            generation, header, config = self._generation, self._header, self._config
+        self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+        self._process.stdin.write(header + b''.join(tag.data for tag in config))
+        self._process.stdin.flush()
+        return generation
+
+    def _run(self):
+        backoff = self.initial_backoff
+        while not self._stopped:
+            self.state = 'connecting'
+            try:
+                generation = self._connect()
+                if generation is None:
+                    break
+                self.stats['connects'] += 1
+                self.connected_at = time.monotonic()
+                self.state = 'connected'
+                logger.info(f'Relay {self.name}: forwarding to {redact(self.url)}')
+                started = False
+                while True:
+                    tag = self._next(generation)
+                    if tag is None:
+                        break
+                    # Start at a keyframe; anything before it can't be decoded
+                    started = started or tag.keyframe
+                    if not started:
+                        if tag.config:
+                            continue  # Already sent with the headers on connect
+                        self.stats['dropped_tags'] += 1
+                        self.stats['dropped_bytes'] += len(tag.data)
+                        continue
+                    self._process.stdin.write(tag.data)
+                    if not self._backlog:
+                        # Caught up: don't leave the newest tags in the pipe's write buffer
+                        self._process.stdin.flush()
+                    self.stats['bytes_sent'] += len(tag.data)
+                    self.stats['tags_sent'] += 1
+                reset = generation != self._generation
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                reset = False
+            connected_for = time.monotonic() - (self.connected_at or time.monotonic())
+            error = self._stop_forwarder()
+            if self._stopped:
+                break
+            if reset:
+                # New input stream (encoder restart), reconnect straight away
+                backoff = self.initial_backoff
+                continue
+            self.last_error = error or self.last_error
+            self.stats['disconnects'] += 1
+            if connected_for > 30:
+                backoff = self.initial_backoff
+            self.state = 'backoff'
+            delay = backoff * random.uniform(0.8, 1.2)
+            logger.warning(f'Relay {self.name}: forwarder stopped ({self.last_error}), '
+                           f'reconnecting in {delay:.1f}s')
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped, timeout=delay)
+            backoff = min(backoff * 2, self.max_backoff)
+        self.state = 'stopped'
+
+    def _stop_forwarder(self):
+        """Stop the forwarder; returns the end of its stderr if it had failed"""
+        process, self._process = self._process, None
+        self.connected_at = None
+        if process is None:
+            return None
+        try:
+            process.stdin.close()
+        except OSError:
+            pass  # Already gone; the buffered tail is lost with it
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.returncode > 0:
+            return stderr.decode('utf-8', 'replace').strip()[-300:] or f'exit status {process.returncode}'
+        return None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def metrics(self):
+        with self._cond:
+            backlog_tags, backlog_bytes = len(self._backlog), self._backlog_bytes
+            backlog_seconds = self._backlog_seconds()
+        return dict(
+            self.stats,
+            url=redact(self.url),
+            state=self.state,
+            backlog_tags=backlog_tags,
+            backlog_bytes=backlog_bytes,
+            backlog_seconds=round(backlog_seconds, 3),
+            connected_seconds=round(time.monotonic() - self.connected_at, 1) if self.connected_at else None,
+            last_error=self.last_error,
+        )
+
+
+class RTMPRelay:
+    """Takes one FLV stream from the encoder and fans it out to independent destinations.
+
+    The encoder pushes FLV to tcp://127.0.0.1:<port>; the relay parses it into tags and
+    hands each tag to every Destination. Destinations never block the reader or each
+    other, so a dead ingest only costs its own backlog.
+
+    A second encoder may connect while the first is still streaming (a live
+    reconfiguration). The relay takes its stream over at its first keyframe and shifts
+    its timestamps to continue the forwarded timeline, so the destinations keep their
+    connections; the old input is then ignored until it disconnects. An encoder that
+    connects while nothing is streaming resets every destination onto its stream.
+    """
+
+    def __init__(self, destinations, host='127.0.0.1', port=0):
+        self.destinations = {destination.name: destination for destination in destinations}
+        self.stats = {'input_connections': 0, 'input_switches': 0, 'input_bytes': 0, 'input_tags': 0,
+                      'input_errors': 0}
+        self._server = socket.create_server((host, port))
+        self.url = 'tcp://%s:%d' % self._server.getsockname()[:2]
+        self._thread = threading.Thread(target=self._accept, name='relay-input', daemon=True)
+        self._lock = threading.Lock()
+        self._active = None
+        self._config = {}
+        self._last_timestamp = 0
+        self._last_video = None
+        self._frame_ms = 40
+        self._waiters = []
+
+    def start(self):
+        for destination in self.destinations.values():
+            destination.start()
+        self._thread.start()
+        logger.info(f'RTMP relay listening on {self.url} for {", ".join(self.destinations)}')
+
+    def expect_switch(self):
+        """An Event set once the next encoder connection is being forwarded"""
+        event = threading.Event()
+        with self._lock:
+            self._waiters.append(event)
+        return event
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            self.stats['input_connections'] += 1
+            threading.Thread(target=self._serve, args=(connection, self.stats['input_connections']),
+                             name='relay-reader', daemon=True).start()
+
+    def _serve(self, connection, number):
+        with connection:
+            try:
+                self._read(connection, number)
+            except (OSError, ValueError) as e:
+                self.stats['input_errors'] += 1
+                logger.warning(f'Relay input error: {e}')
+        with self._lock:
+            if self._active != number:
+                return  # Replaced by a newer encoder
+            self._active = None
+        for destination in self.destinations.values():
+            destination.end()
+
+    def _read(self, connection, number):
+        tags = read_flv(connection)
+        header = next(tags)
+        config = {}
+        offset = None
+        for tag in tags:
+            self.stats['input_bytes'] += len(tag.data)
+            self.stats['input_tags'] += 1
+            if tag.config:
+                config[(tag.type, tag.data[11:13] if tag.type != TAG_SCRIPT else b'')] = tag
+                continue
+            with self._lock:
+                if offset is None:
+                    # The encoder sends metadata and sequence headers before the first frame
+                    if self._active is not None and not tag.keyframe:
+                        continue  # Another encoder is live, take over at a keyframe
+                    offset = self._activate(number, header, config, tag)
+                if self._active != number:
+                    continue
+                if offset:
+                    tag = retime(tag, offset)
+                if tag.type == TAG_VIDEO:
+                    if self._last_video is not None and tag.timestamp > self._last_video:
+                        self._frame_ms = tag.timestamp - self._last_video
+                    self._last_video = tag.timestamp
+                self._last_timestamp = max(self._last_timestamp, tag.timestamp)
+                for destination in self.destinations.values():
+                    destination.put(tag)
+
+    def _activate(self, number, header, config, first):
+        """Forward input number from its tag first on; returns the offset for its timestamps"""
+        if self._active is None:
+            for destination in self.destinations.values():
+                destination.reset(header, config.values())
+            offset = 0
+            self._last_timestamp = 0
+        else:
+            offset = self._last_timestamp + self._frame_ms - first.timestamp
+            changed = [retime(tag, first.timestamp + offset - tag.timestamp) for key, tag in config.items()
+                       if key not in self._config or self._config[key].data[11:] != tag.data[11:]]
+            for destination in self.destinations.values():
+                destination.switch(config.values(), changed)
+            self.stats['input_switches'] += 1
+            logger.info(f'Relay: switched to input {number}'
+                        f'{" with new sequence headers" if changed else ""}, timestamps {offset:+d}ms')
+        self._active = number
+        self._config = dict(config)
+        self._last_video = None
+        for event in self._waiters:
+            event.set()
+        self._waiters = []
+        return offset
+
+    def stop(self):
+        self._server.close()
+        for destination in self.destinations.values():
+            destination.stop()
+
+    def metrics(self):
+        return dict(self.stats, destinations={name: d.metrics() for name, d in self.destinations.items()})
+
+    def families(self):
+        up = gauge('spectrum_relay_destination_up', 'Whether the destination forwarder is connected')
+        sent = counter('spectrum_relay_sent_bytes_total', 'Bytes written to the destination forwarder')
+        dropped = counter('spectrum_relay_dropped_bytes_total', 'Bytes dropped from a full backlog')
+        backlog = gauge('spectrum_relay_backlog_seconds', 'Stream time waiting in the destination backlog')
+        disconnects = counter('spectrum_relay_disconnects_total', 'Forwarder failures')
+        for name, destination in self.destinations.items():
+            status = destination.metrics()
+            up.add(int(status['state'] == 'connected'), destination=name)
+            sent.add(status['bytes_sent'], destination=name)
+            dropped.add(status['dropped_bytes'], destination=name)
+            backlog.add(status['backlog_seconds'], destination=name)
+            disconnects.add(status['disconnects'], destination=name)
+        return [up, sent, dropped, backlog, disconnects]
+
+
+def load_destinations(path=None, youtube_url=None, **defaults):
+    """Destinations from a JSON config file plus the YouTube ingest, if configured.
+
+    The file holds {"destinations": [{"name": ..., "url": ..., "max_backlog_seconds": ...}]};
+    ${VAR} in a URL is expanded from the environment so stream keys can stay out of it.
+    """
+    entries = []
+    if youtube_url:
+        entries.append({'name': 'youtube', 'url': youtube_url})
+    if path:
+        with open(path) as f:
+            entries += json.load(f)['destinations']
+    destinations = []
+    for entry in entries:
+        options = dict(defaults, **{key: value for key, value in entry.items() if key not in ('name', 'url')})
+        destinations.append(Destination(entry['name'], os.path.expandvars(entry['url']), **options))
+    return destinations
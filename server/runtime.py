@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# EVENT_LOOP=auto|uvloop|asyncio, JSON_BACKEND=auto|orjson|json.
+# 'auto' uses the fast implementation when it is installed and falls back otherwise.
+EVENT_LOOP = os.getenv('EVENT_LOOP', 'auto')
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+
+
+def _select_loop(choice):
+    if choice in ('auto', 'uvloop'):
+        try:
+            import uvloop
+            return 'uvloop', uvloop.new_event_loop
+        except ImportError:
+            if choice == 'uvloop':
+                logger.warning('EVENT_LOOP=uvloop but uvloop is not installed, using asyncio')
+    return 'asyncio', asyncio.new_event_loop
+
+
+def _select_json(choice):
+    if choice in ('auto', 'orjson'):
+        try:
+            import orjson
+
+            def dumps(obj):
+                # Text frames need str; orjson's bytes decode faster than json.dumps encodes
+                return orjson.dumps(obj).decode('utf-8')
+
+            return 'orjson', dumps, orjson.loads
+        except ImportError:
+            if choice == 'orjson':
+                logger.warning('JSON_BACKEND=orjson but orjson is not installed, using json')
+    return 'json', json.dumps, json.loads
+
+
+loop_name, _loop_factory = _select_loop(EVENT_LOOP)
+json_name, dumps, loads = _select_json(JSON_BACKEND)
+
+
+def new_event_loop():
+    return _loop_factory()
+
+
+def run(main):
+    """Run a coroutine to completion on a fresh loop of the configured implementation"""
+    loop = new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+def describe():
+    return {'event_loop': loop_name, 'json': json_name}
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import logging
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 48K Spectrum: 69888 T-states per frame at 3.5 MHz (~50.08 Hz)
+SPECTRUM_FRAME_RATE = 3500000 / 69888
+
+INPUT_LOG_MAGIC = b'SILG'
+INPUT_LOG_VERSION = 1
+
+# Key names as sent by web/js/spectrum-emulator.js, followed by Kempston joystick inputs.
+# The index of a name is its wire code, so only ever append to this list.
+INPUT_CODES = [
+    '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
+    'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P',
+    'A', 'S', 'D', 'F', 'G', 'H', 'J', 'K', 'L',
+    'Z', 'X', 'C', 'V', 'B', 'N', 'M',
+    'SPACE', 'ENTER', 'SHIFT', 'SYMBOL', 'DELETE',
+    'UP', 'DOWN', 'LEFT', 'RIGHT',
+    'JOY_UP', 'JOY_DOWN', 'JOY_LEFT', 'JOY_RIGHT', 'JOY_FIRE',
+]
+INPUT_CODE_BY_NAME = {name: code for code, name in enumerate(INPUT_CODES)}
+END_CODE = 0x7F
+PRESSED_BIT = 0x80
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class SessionRecorder:
+    """Records a session as a starting snapshot plus frame-stamped input events.
+
+    Input log layout (.silog):
+        header:  magic, version u8, start time f64, frame rate f64,
+                 snapshot name (u16 length + utf-8), snapshot bytes (u32 length + data)
+        events:  varint frame delta, u8 code (bit 7 = pressed, low bits = INPUT_CODES index)
+        end:     varint frame delta, END_CODE - marks the total frame count
+
+    Frame numbers in the log are counted on the wall clock from mark_running(), when
+    FUSE is up, so they locate an input to within a few frames and drift when the host
+    is too slow to emulate in real time. The log indexes a session; it is not enough to
+    replay one. When rzx is enabled FUSE also records its own RZX file next to the log,
+    which is what the offline renderer replays for bit-exact output.
+
+    Only the newest keep sessions are kept; older logs and RZX files are deleted when a
+    session starts.
+    """
+
+    def __init__(self, session_dir, rzx=False, keep=20):
+        self.session_dir = Path(session_dir)
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        self.rzx = rzx
+        self.keep = keep
+        self.session_id = None
+        self.log_path = None
+        self.rzx_path = None
+        self._file = None
+        self._start = None
+        self._last_frame = 0
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self):
+        return self._file is not None
+
+    def current_frame(self):
+        # Input before the emulator is running lands on frame 0
+        if self._start is None:
+            return 0
+        return int((time.monotonic() - self._start) * SPECTRUM_FRAME_RATE)
+
+    def mark_running(self):
+        """Start the frame clock: FUSE has finished starting and is emulating"""
+        with self._lock:
+            if self._file and self._start is None:
+                self._start = time.monotonic()
+
+    def _prune(self):
+        """Delete the oldest sessions so that, with the one starting, at most keep remain"""
+        # Session ids start with the start time, so name order is age order
+        logs = sorted(self.session_dir.glob('*.silog'))
+        for log in logs[:max(0, len(logs) - self.keep + 1)]:
+            for path in (log, log.with_suffix('.rzx')):
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning(f'Could not delete old session file {path}: {e}')
+
+    def start(self, snapshot_path=None):
+        """Open a new input log and return the extra FUSE arguments for this session"""
+        with self._lock:
+            if self._file:
+                self._close(self.current_frame())
+
+            self._prune()
+            self.session_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+            self.log_path = self.session_dir / f'{self.session_id}.silog'
+            self.rzx_path = self.session_dir / f'{self.session_id}.rzx' if self.rzx else None
+
+            snapshot_name = b''
+            snapshot_data = b''
+            if snapshot_path:
+                snapshot_name = Path(snapshot_path).name.encode('utf-8')
+                snapshot_data = Path(snapshot_path).read_bytes()
+
+            self._file = open(self.log_path, 'wb')
+            self._file.write(INPUT_LOG_MAGIC)
+            self._file.write(struct.pack('<Bdd', INPUT_LOG_VERSION, time.time(), SPECTRUM_FRAME_RATE))
+            self._file.write(struct.pack('<H', len(snapshot_name)) + snapshot_name)
+            self._file.write(struct.pack('<I', len(snapshot_data)) + snapshot_data)
+            self._file.flush()
+            self._start = None
+            self._last_frame = 0
+            logger.info(f'Session recording started: {self.log_path}')
+
+        fuse_args = []
+        if snapshot_path:
+            fuse_args.extend(['--snapshot', str(snapshot_path)])
+        if self.rzx_path:
+            fuse_args.extend(['--record', str(self.rzx_path)])
+        return fuse_args
+
+    def record_key(self, key, pressed=True):
+        code = INPUT_CODE_BY_NAME.get(str(key).upper())
+        if code is None:
+            logger.debug(f'Not recording unknown key: {key}')
+            return
+        self._write_event(code | (PRESSED_BIT if pressed else 0))
+
+    def _write_event(self, code):
+        with self._lock:
+            if not self._file:
+                return
+            frame = self.current_frame()
+            self._file.write(encode_varint(frame - self._last_frame) + bytes((code,)))
+            self._last_frame = frame
+
+    def stop(self):
+        """Finish the current log and return its path"""
+        with self._lock:
+            if not self._file:
+                return None
+            return self._close(self.current_frame())
+
+    def _close(self, frame):
+        self._file.write(encode_varint(frame - self._last_frame) + bytes((END_CODE,)))
+        self._file.close()
+        self._file = None
+        logger.info(f'Session recording stopped after {frame} frames: {self.log_path}')
+        return self.log_path
+
+
+def read_input_log(path):
+    """Parse an input log into (header, events) where events are (frame, key, pressed)"""
+    data = Path(path).read_bytes()
+    if data[:4] != INPUT_LOG_MAGIC:
+        raise ValueError(f'{path} is not a session input log')
+
+    pos = 4
+    version, start_time, frame_rate = struct.unpack_from('<Bdd', data, pos)
+    if version != INPUT_LOG_VERSION:
+        raise ValueError(f'Unsupported input log version {version}')
+    pos += struct.calcsize('<Bdd')
+    (name_len,) = struct.unpack_from('<H', data, pos)
+    pos += 2
+    snapshot_name = data[pos:pos + name_len].decode('utf-8')
+    pos += name_len
+    (snapshot_len,) = struct.unpack_from('<I', data, pos)
+    pos += 4
+    snapshot = data[pos:pos + snapshot_len]
+    pos += snapshot_len
+
+    events = []
+    frame = 0
+    total_frames = None
+    while pos < len(data):
+        try:
+            delta, next_pos = decode_varint(data, pos)
+            code = data[next_pos]
+        except IndexError:
+            break  # Cut off in the middle of an event
+        pos = next_pos + 1
+        frame += delta
+        if code == END_CODE:
+            total_frames = frame
+            break
+        index = code & ~PRESSED_BIT
+        if index >= len(INPUT_CODES):
+            raise ValueError(f'{path}: unknown input code {index} at byte {pos - 1}')
+        events.append((frame, INPUT_CODES[index], bool(code & PRESSED_BIT)))
+
+    header = {
+        'version': version,
+        'start_time': start_time,
+        'frame_rate': frame_rate,
+        'snapshot_name': snapshot_name or None,
+        'snapshot': snapshot or None,
+        # A log cut short by a crash has no end marker; fall back to the last event
+        'total_frames': total_frames if total_frames is not None else frame,
+        'complete': total_frames is not None,
+    }
+    return header, events
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Offline re-render of recorded sessions to MP4.
+
+Replays each session's RZX in a headless FUSE at maximum emulation speed, writing
+every emulated frame to an FMF movie, then converts that to a high quality MP4.
+Because FUSE replays the recorded port inputs frame by frame the result is
+bit-exact regardless of how fast the host runs it.
+
+Usage: python3 session_render.py [--workers N] [--out DIR] SESSION_DIR_OR_LOG...
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from session_recorder import read_input_log
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# FUSE --speed is a percentage of real time
+RENDER_SPEED = int(os.getenv('RENDER_SPEED', '2000'))
+RENDER_RESOLUTION = os.getenv('RENDER_RESOLUTION', '1280x960')
+RENDER_CRF = os.getenv('RENDER_CRF', '16')
+
+
+def fuse_command(rzx_path, movie, speed=RENDER_SPEED):
+    """Headless FUSE replaying rzx_path as fast as speed allows, every frame into an FMF movie"""
+    return [
+        'fuse-sdl',
+        '--machine', '48',
+        '--no-confirm-actions',
+        '--sound',
+        '--speed', str(speed),
+        '--playback', str(rzx_path),
+        '--movie-start', str(movie),
+        '--movie-compr', 'None',
+    ]
+
+
+def convert_command(movie, video, audio):
+    """fmfconv [options] infile outfile soundfile; output types follow the extensions, and
+    .y4m is YUV4MPEG2, whose header carries the frame size and rate ffmpeg needs"""
+    return ['fmfconv', str(movie), str(video), str(audio)]
+
+
+def encode_command(video, audio, total_frames, out_path):
+    """ffmpeg command encoding the converted movie, cut at the recording's frame count"""
+    return [
+        'ffmpeg', '-y',
+        '-f', 'yuv4mpegpipe', '-i', str(video),
+        '-f', 'wav', '-i', str(audio),
+        '-frames:v', str(total_frames),
+        '-vf', f'scale={RENDER_RESOLUTION}:flags=neighbor',
+        '-c:v', 'libx264',
+        '-preset', 'slow',
+        '-crf', RENDER_CRF,
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-movflags', '+faststart',
+        str(out_path)
+    ]
+
+
+def render_recording(log_path, out_dir, speed=RENDER_SPEED):
+    """Render one recording to MP4 and return the output path"""
+    log_path = Path(log_path)
+    rzx_path = log_path.with_suffix('.rzx')
+    if not rzx_path.exists():
+        raise FileNotFoundError(f'No RZX recording next to {log_path}; enable SESSION_RZX to make sessions renderable')
+
+    # The RZX drives the replay; the input log only says how long the session ran
+    header, _ = read_input_log(log_path)
+    total_frames = header['total_frames']
+    out_path = Path(out_dir) / f'{log_path.stem}.mp4'
+    started = time.monotonic()
+
+    with tempfile.TemporaryDirectory(prefix='render-') as work:
+        work = Path(work)
+        movie = work / 'movie.fmf'
+
+        fuse_env = os.environ.copy()
+        fuse_env.update({
+            'SDL_VIDEODRIVER': 'dummy',
+            'SDL_AUDIODRIVER': 'dummy',
+        })
+        fuse = subprocess.Popen(fuse_command(rzx_path, movie, speed), env=fuse_env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        # FUSE keeps running once playback ends; allow the expected emulated time plus slack
+        deadline = time.monotonic() + total_frames / (header['frame_rate'] * speed / 100) + 10
+        while fuse.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.5)
+        if fuse.poll() is None:
+            fuse.terminate()
+            try:
+                fuse.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                fuse.kill()
+
+        video, audio = work / 'video.y4m', work / 'audio.wav'
+        subprocess.run(convert_command(movie, video, audio), check=True, capture_output=True)
+        subprocess.run(encode_command(video, audio, total_frames, out_path), check=True, capture_output=True)
+
+    elapsed = time.monotonic() - started
+    realtime = total_frames / header['frame_rate']
+    logger.info(f'Rendered {log_path.name}: {total_frames} frames, '
+                f'{realtime:.1f}s of play in {elapsed:.1f}s ({realtime / max(elapsed, 0.001):.1f}x real time)')
+    return out_path
+
+
+def render_all(log_paths, out_dir, workers=None, speed=RENDER_SPEED):
+    """Render recordings in parallel, one FUSE/ffmpeg pipeline per worker process"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_recording, path, out_dir, speed): path for path in log_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                logger.error(f'Failed to render {path}: {e}')
+                results[path] = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-render recorded sessions to MP4')
+    parser.add_argument('paths', nargs='+', help='Session directories or .silog files')
+    parser.add_argument('--out', default='renders', help='Output directory')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel renders (default: CPU count)')
+    parser.add_argument('--speed', type=int, default=RENDER_SPEED, help='FUSE emulation speed in percent')
+    args = parser.parse_args()
+
+    log_paths = []
+    for path in map(Path, args.paths):
+        log_paths.extend(sorted(path.glob('*.silog')) if path.is_dir() else [path])
+
+    results = render_all(log_paths, args.out, args.workers, args.speed)
+    failed = [path for path, out in results.items() if out is None]
+    logger.info(f'Rendered {len(results) - len(failed)}/{len(results)} sessions into {args.out}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
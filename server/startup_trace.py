@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# STARTUP_TRACE=path of the Chrome trace JSON, off by default ('' keeps the summary log line only)
+STARTUP_TRACE = os.getenv('STARTUP_TRACE', '')
+STARTUP_TRACE_TIMEOUT = float(os.getenv('STARTUP_TRACE_TIMEOUT', '60'))
+
+# perf_counter() value at the moment the process was created, so timestamps include
+# interpreter start-up and imports
+_ORIGIN = time.perf_counter() - (time.time() - psutil.Process().create_time())
+
+
+def _now_us():
+    return (time.perf_counter() - _ORIGIN) * 1e6
+
+
+class StartupTrace:
+    """Spans for each cold-start phase plus readiness events, exported once start-up is over.
+
+    Phases are recorded with span(name) around the code that runs them and child
+    readiness with ready(name). When every required readiness event has happened
+    (or after timeout seconds) the trace is finished. The events are written as
+    Chrome trace-event JSON (open in chrome://tracing or ui.perfetto.dev) with the
+    per-phase durations under otherData, and one summary line is logged. Spans
+    after that are ignored, so instrumented code that also runs later (a restart
+    from the UI) costs nothing.
+    """
+
+    def __init__(self, path=STARTUP_TRACE, timeout=STARTUP_TRACE_TIMEOUT,
+                 required=('ws_listening', 'first_segment')):
+        self.path = path
+        self.required = set(required)
+        self.reached = {}
+        self.events = []
+        self.phases = []
+        self.active = True
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._threads = {}
+        # Armed by start() rather than at import, so no thread exists before fork_workers()
+        self._timer = threading.Timer(timeout, self.finish, kwargs={'reason': 'timeout'})
+        self._timer.daemon = True
+
+    def start(self):
+        """Arm the timeout; call once the process will not fork any more"""
+        if self.active and not self._timer.is_alive():
+            self._timer.start()
+
+    def _tid(self):
+        thread = threading.current_thread()
+        if thread.ident not in self._threads:
+            self._threads[thread.ident] = thread.name
+            self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': thread.ident,
+                                'args': {'name': thread.name}})
+        return thread.ident
+
+    def _complete(self, name, start, end, args):
+        with self._lock:
+            if not self.active:
+                return
+            self.events.append({'ph': 'X', 'name': name, 'cat': 'startup', 'ts': round(start, 1),
+                                'dur': round(end - start, 1), 'pid': self.pid, 'tid': self._tid(),
+                                'args': args})
+            self.phases.append((name, (end - start) / 1e6))
+
+    @contextmanager
+    def span(self, name, **args):
+        if not self.active:
+            yield
+            return
+        start = _now_us()
+        try:
+            yield
+        finally:
+            self._complete(name, start, _now_us(), args)
+
+    def since_process_start(self, name):
+        """A phase covering everything from process creation until now (interpreter, imports)"""
+        self._complete(name, 0.0, _now_us(), {})
+
+    def instant(self, name, **args):
+        with self._lock:
+            if not self.active:
+                return
+            self.events.append({'ph': 'i', 's': 'p', 'name': name, 'cat': 'ready', 'ts': round(_now_us(), 1),
+                                'pid': self.pid, 'tid': self._tid(), 'args': args})
+
+    def ready(self, name, **args):
+        """A readiness event; start-up is over once all required ones have happened"""
+        if not self.active or name in self.reached:
+            return
+        self.instant(name, **args)
+        self.reached[name] = _now_us() / 1e6
+        if self.required <= self.reached.keys():
+            self.finish(reason=name)
+
+    def summary(self):
+        missing = sorted(self.required - self.reached.keys())
+        # Time to the last required readiness event, or to now if some never happened
+        total = max(self.reached.values()) if self.reached and not missing else _now_us() / 1e6
+        return {
+            'total_seconds': round(total, 3),
+            'phases': [{'name': name, 'seconds': round(seconds, 3)} for name, seconds in self.phases],
+            'ready': {name: round(seconds, 3) for name, seconds in self.reached.items()},
+            'missing': missing,
+        }
+
+    def finish(self, reason='done'):
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+        self._timer.cancel()
+        summary = dict(self.summary(), reason=reason)
+
+        phases = ', '.join(f"{phase['name']} {phase['seconds']:.2f}s" for phase in summary['phases'])
+        missing = f" (never reached: {', '.join(summary['missing'])})" if summary['missing'] else ''
+        logger.info(f"Startup: {summary['total_seconds']:.2f}s to ready ({reason}){missing} | {phases}")
+
+        if self.path:
+            try:
+                with open(self.path, 'w') as f:
+                    json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms', 'otherData': summary}, f)
+                logger.info(f'Startup trace written to {self.path}')
+            except OSError as e:
+                logger.warning(f'Could not write startup trace {self.path}: {e}')
+
+
+trace = StartupTrace()
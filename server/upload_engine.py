@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class UploadEngine:
+    """Background S3 uploads for one-off files such as clips and archives.
+
+    Jobs run on a small thread pool so large uploads never block the event loop or
+    the live segment publisher. Each job is tracked by id until it finishes.
+    """
+
+    def __init__(self, s3_client, bucket, workers=2, keep_jobs=100):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.keep_jobs = keep_jobs
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+
+    def submit(self, path, key, content_type, cache_control='max-age=31536000, immutable', on_done=None):
+        """Queue path for upload to key and return the job id"""
+        with self._lock:
+            job_id = next(self._ids)
+            self.jobs[job_id] = {
+                'id': job_id,
+                'key': key,
+                'bucket': self.bucket,
+                'state': 'queued',
+                'queued_at': time.time(),
+            }
+            while len(self.jobs) > self.keep_jobs:
+                oldest = next(iter(self.jobs))
+                if self.jobs[oldest]['state'] in ('queued', 'uploading'):
+                    break
+                del self.jobs[oldest]
+        self._pool.submit(self._upload, job_id, str(path), key, content_type, cache_control, on_done)
+        return job_id
+
+    def _upload(self, job_id, path, key, content_type, cache_control, on_done):
+        job = self.jobs[job_id]
+        job['state'] = 'uploading'
+        started = time.monotonic()
+        try:
+            if not self.s3_client:
+                raise RuntimeError('S3 client not available')
+            self.s3_client.upload_file(
+                path,
+                self.bucket,
+                key,
+                ExtraArgs={'ContentType': content_type, 'CacheControl': cache_control}
+            )
+            job['state'] = 'done'
+            job['seconds'] = round(time.monotonic() - started, 3)
+            logger.info(f'Uploaded {key} in {job["seconds"]}s')
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+            logger.error(f'Upload of {key} failed: {e}')
+        if on_done:
+            on_done(job)
+
+    def status(self, job_id):
+        return self.jobs.get(job_id)
+
+    def queue_depth(self):
+        return sum(1 for job in list(self.jobs.values()) if job['state'] in ('queued', 'uploading'))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import time
+
+import websockets
+from aiohttp import ClientSession, web
+
+import protocol
+import runtime
+from broadcast_hub import BroadcastHub
+
+logger = logging.getLogger(__name__)
+
+IPC_PATH = os.getenv('WORKER_IPC_PATH', '/tmp/spectrum-workers.sock')
+OWNER_HTTP_PORT = int(os.getenv('WORKER_OWNER_HTTP_PORT', '8081'))
+
+# Hop-by-hop headers that must not be copied when proxying to the owner
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host', 'upgrade'}
+
+# A worker this far behind on broadcasts is stuck; it is disconnected and restarted
+MAX_IPC_BUFFER = 4 * 1024 * 1024
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+
+class IPCOwner:
+    """Owner side of the worker IPC channel.
+
+    The process that owns the emulator session listens on a Unix socket. Acceptor
+    workers forward control and input messages as newline-delimited JSON frames:
+
+        worker -> owner  {"op": "msg", "conn": id, "data": {...}}
+        owner -> worker  {"op": "reply", "conn": id, "data": {...}}
+        owner -> worker  {"op": "broadcast", "topic": t, "payload": "...", "coalesce": key}
+
+    Broadcasts published on the owner's hub are forwarded to every worker, which
+    fan them out to their own clients. A worker whose unsent broadcasts exceed
+    max_buffer bytes is disconnected; it exits and its supervisor starts a new one.
+    A forwarded subscribe_segments is answered with subscription_message(), so
+    clients see whether the owner is publishing.
+    """
+
+    def __init__(self, handle_message, hub, path=IPC_PATH, subscription_message=None, max_buffer=MAX_IPC_BUFFER):
+        self.handle_message = handle_message
+        self.hub = hub
+        self.path = path
+        self.subscription_message = subscription_message
+        self.max_buffer = max_buffer
+        self.workers = set()
+        self._worker_ids = itertools.count(1)
+        self.stats = {'forwarded': 0, 'replies': 0, 'broadcasts': 0, 'closed_stalled': 0}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        await asyncio.start_unix_server(self._serve_worker, path=self.path)
+        self.hub.forwarders.append(self.forward_broadcast)
+        logger.info(f'Worker IPC listening on {self.path}')
+
+    async def _serve_worker(self, reader, writer):
+        self.workers.add(writer)
+        worker = next(self._worker_ids)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = runtime.loads(line)
+                if frame.get('op') == 'msg':
+                    self.stats['forwarded'] += 1
+                    asyncio.get_running_loop().create_task(self._dispatch(writer, worker, frame['conn'], frame['data']))
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.error(f'Worker IPC connection error: {e}')
+        finally:
+            self.workers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer, worker, conn, data):
+        async def reply(message):
+            self.stats['replies'] += 1
+            writer.write(runtime.dumps({'op': 'reply', 'conn': conn, 'data': message}).encode() + b'\n')
+            await writer.drain()
+
+        try:
+            if data.get('type') == 'subscribe_segments' and self.subscription_message:
+                await reply(self.subscription_message())
+            else:
+                await self.handle_message(data, reply, client=f'w{worker}:{conn}')
+        except ConnectionError:
+            pass  # The worker went away; _serve_worker cleans up
+        except Exception as e:
+            logger.error(f'Error handling forwarded message: {e}')
+
+    def forward_broadcast(self, topic, payload, coalesce_key):
+        if not self.workers:
+            return
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        frame = runtime.dumps({'op': 'broadcast', 'topic': topic, 'payload': payload,
+                            'coalesce': coalesce_key}).encode() + b'\n'
+        self.stats['broadcasts'] += 1
+        for writer in list(self.workers):
+            # Publishing is synchronous, so a worker that stops reading is cut off instead of awaited
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.stats['closed_stalled'] += 1
+                logger.error(f'Worker IPC over {self.max_buffer} bytes behind on broadcasts, disconnecting it')
+                self.workers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+
+
+class AcceptorWorker:
+    """A forked process that accepts WebSocket and HTTP connections on the shared ports.
+
+    Connection handling, JSON parsing and broadcast fan-out happen here; anything
+    that touches the emulator is forwarded to the owner over IPC. HTTP requests other
+    than /health are proxied to the owner's loopback-only port.
+    """
+
+    def __init__(self, worker_id, ws_port=8765, http_port=8080, ipc_path=IPC_PATH,
+                 owner_http_port=OWNER_HTTP_PORT):
+        self.worker_id = worker_id
+        self.ws_port = ws_port
+        self.http_port = http_port
+        self.ipc_path = ipc_path
+        self.owner_http_port = owner_http_port
+        self.hub = BroadcastHub(
+            max_queue=int(os.getenv('WS_MAX_QUEUE', '64')),
+            max_lag=float(os.getenv('WS_MAX_LAG', '10'))
+        )
+        self.connections = {}
+        self._ids = itertools.count(1)
+        self.writer = None
+        self.http_session = None
+
+    async def connect_owner(self, timeout=120):
+        """The owner creates the socket after forking, so retry until it appears"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.ipc_path)
+                return reader
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+    async def read_owner(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                logger.info(f'Worker {self.worker_id}: owner went away, exiting')
+                return
+            frame = runtime.loads(line)
+            if frame['op'] == 'broadcast':
+                self.hub.publish(frame['topic'], frame['payload'], frame.get('coalesce'))
+            elif frame['op'] == 'reply':
+                connection = self.connections.get(frame['conn'])
+                if connection:
+                    # Never let one client's send hold up the IPC stream
+                    asyncio.get_running_loop().create_task(self._send_reply(*connection, frame['data']))
+
+    async def _send_reply(self, websocket, codec, message):
+        try:
+            await websocket.send(codec.encode(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def forward(self, conn, data):
+        """Send a message to the owner; waits while the IPC socket is backed up"""
+        self.writer.write(runtime.dumps({'op': 'msg', 'conn': conn, 'data': data}).encode() + b'\n')
+        await self.writer.drain()
+
+    async def handle_websocket(self, websocket, path=None):
+        conn = next(self._ids)
+        codec = protocol.Codec(websocket.subprotocol)
+        self.connections[conn] = (websocket, codec)
+        self.hub.register(websocket, topics=('status',), codec=codec)
+        try:
+            # The owner answers with the same greeting a direct connection gets
+            await self.forward(conn, {'type': 'hello'})
+            async for message in websocket:
+                try:
+                    batch = codec.decode(message)
+                except protocol.ProtocolError as e:
+                    logger.warning(f'Invalid frame received: {e}')
+                    continue
+                # The owner always speaks JSON over IPC, whatever the client negotiated
+                for data in batch:
+                    if data.get('type') == 'subscribe_segments':
+                        # Fan-out is local, but only the owner knows whether it is publishing
+                        self.hub.subscribe(websocket, 'segments')
+                        await self.forward(conn, data)
+                    elif data.get('type') == 'unsubscribe_segments':
+                        self.hub.unsubscribe(websocket, 'segments')
+                    else:
+                        await self.forward(conn, data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            del self.connections[conn]
+            self.hub.unregister(websocket)
+
+    async def health_check(self, request):
+        return web.Response(text=f'OK - acceptor worker {self.worker_id}', status=200)
+
+    async def proxy_to_owner(self, request):
+        url = f'http://127.0.0.1:{self.owner_http_port}{request.rel_url}'
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+        async with self.http_session.request(request.method, url, headers=headers,
+                                             data=await request.read()) as response:
+            body = await response.read()
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+            return web.Response(body=body, status=response.status, headers=headers)
+
+    async def run(self):
+        reader = await self.connect_owner()
+        self.http_session = ClientSession()
+
+        app = web.Application()
+        app.router.add_get('/health', self.health_check)
+        app.router.add_route('*', '/{tail:.*}', self.proxy_to_owner)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', self.http_port, reuse_port=True).start()
+
+        async with websockets.serve(self.handle_websocket, '0.0.0.0', self.ws_port, reuse_port=True,
+                                    **protocol.serve_options()):
+            logger.info(f'Acceptor worker {self.worker_id} (pid {os.getpid()}) serving ports '
+                        f'{self.ws_port}/{self.http_port}')
+            await self.read_owner(reader)
+
+
+def _fork_worker(worker_id, kwargs):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            runtime.run(AcceptorWorker(worker_id, **kwargs).run())
+        except Exception as e:
+            logger.error(f'Acceptor worker {worker_id} failed: {e}')
+            code = 1
+        os._exit(code)
+    return pid
+
+
+def _supervise(owner, count, kwargs):
+    """Keep count workers running while the owner lives, restarting with backoff"""
+    workers = {}  # pid -> (worker_id, started)
+    restarts = {}  # worker_id -> when to fork its replacement
+    backoff = {}  # worker_id -> delay before its next restart
+    for worker_id in range(1, count + 1):
+        workers[_fork_worker(worker_id, kwargs)] = (worker_id, time.monotonic())
+    logger.info(f'Forked {count} acceptor workers: {sorted(workers)}')
+    while workers or restarts:
+        owner_alive = os.getppid() == owner
+        if not owner_alive:
+            restarts.clear()
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid in workers:
+            worker_id, started = workers.pop(pid)
+            if owner_alive:
+                # A worker that ran for a while starts again promptly; one that keeps dying backs off
+                if time.monotonic() - started > MAX_RESTART_DELAY:
+                    backoff[worker_id] = RESTART_DELAY
+                delay = backoff.get(worker_id, RESTART_DELAY)
+                backoff[worker_id] = min(delay * 2, MAX_RESTART_DELAY)
+                restarts[worker_id] = time.monotonic() + delay
+                logger.error(f'Acceptor worker {worker_id} (pid {pid}) exited with status '
+                             f'{os.waitstatus_to_exitcode(status)}, restarting in {delay:.0f}s')
+            continue
+        now = time.monotonic()
+        for worker_id, due in list(restarts.items()):
+            if now >= due:
+                del restarts[worker_id]
+                pid = _fork_worker(worker_id, kwargs)
+                workers[pid] = (worker_id, now)
+                logger.info(f'Restarted acceptor worker {worker_id} as pid {pid}')
+        time.sleep(0.5)
+
+
+def fork_workers(count, **kwargs):
+    """Fork a supervisor that keeps count acceptor workers running.
+
+    Must run before any threads or event loop exist. The supervisor stays
+    single-threaded, so it can safely fork replacements for workers that die.
+    It stops them and exits once the owner has gone.
+    """
+    owner = os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            _supervise(owner, count, kwargs)
+        except Exception as e:
+            logger.error(f'Acceptor worker supervisor failed: {e}')
+            code = 1
+        os._exit(code)
+    logger.info(f'Forked acceptor worker supervisor (pid {pid}) for {count} workers')
+    return pid
@@ -0,0 +1,65 @@
+import asyncio
+
+from broadcast_hub import BroadcastHub
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.received = []
+        self.close_code = None
+
+    async def send(self, frame):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.received.append(frame)
+
+    async def close(self, code=1000, reason=''):
+        self.close_code = code
+
+
+def run_hub(hub, publish, settle):
+    fast = [FakeWebSocket(), FakeWebSocket()]
+    slow = FakeWebSocket(stalled=True)
+    peak = []
+
+    async def main():
+        for websocket in (*fast, slow):
+            hub.register(websocket, topics=('status',))
+        slow_channel = hub.channels[slow]
+        for index in range(publish):
+            hub.publish('status', {'type': 'tick', 'index': index})
+            peak.append(slow_channel.queued_bytes)
+            await asyncio.sleep(0)
+        await asyncio.sleep(settle)
+        return slow_channel
+
+    return fast, slow, asyncio.run(main()), max(peak)
+
+
+def test_stalled_client_is_bounded_and_closed_by_the_sweep():
+    hub = BroadcastHub(max_queue=8, max_lag=0.2, max_drops=10000)
+    fast, slow, slow_channel, peak = run_hub(hub, publish=200, settle=0.5)
+
+    for websocket in fast:
+        assert len(websocket.received) == 200
+    # The writer holds one message in its stalled send; at most max_queue more are queued
+    payload = len('{"type":"tick","index":199}')
+    assert peak <= 8 * payload
+    assert slow_channel.dropped == 200 - 8 - 1
+    # Publishing finished well inside max_lag, so only the sweep can have closed it
+    assert slow.close_code == 1013
+    assert slow not in hub.channels
+    assert hub.stats['closed_slow'] == 1
+    assert set(hub.channels) == set(fast)
+
+
+def test_client_dropping_too_much_is_closed_on_publish():
+    hub = BroadcastHub(max_queue=4, max_lag=60, max_drops=20)
+    fast, slow, slow_channel, _ = run_hub(hub, publish=100, settle=0.01)
+
+    for websocket in fast:
+        assert len(websocket.received) == 100
+    assert slow.close_code == 1013
+    assert slow_channel.dropped == 20
+    assert hub.stats['closed_slow'] == 1
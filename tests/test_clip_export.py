@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import pytest
+
+import clip_export
+from clip_export import ClipExporter
+from dvr import DVRStore
+
+
+class FakeStdin:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFFmpeg:
+    """Stands in for the remux: records its command and input, and writes the output file"""
+
+    def __init__(self, argv):
+        self.argv = argv
+        self.stdin = FakeStdin()
+        self.returncode = None
+
+    async def communicate(self):
+        with open(self.argv[-1], 'wb') as f:
+            f.write(b'mp4 ' + bytes(self.stdin.data))
+        self.returncode = 0
+        return None, b''
+
+    async def wait(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+@pytest.fixture
+def remuxes(monkeypatch):
+    started = []
+
+    async def create_subprocess_exec(*argv, **kwargs):
+        started.append(FakeFFmpeg(list(argv)))
+        return started[-1]
+
+    monkeypatch.setattr(clip_export.asyncio, 'create_subprocess_exec', create_subprocess_exec)
+    return started
+
+
+@pytest.fixture
+def dvr(tmp_path):
+    """100 two-second segments, window time 0-200 s; segment n's bytes are b'<n>;'"""
+    store = DVRStore(tmp_path / 'dvr', window_seconds=7200)
+    for sequence in range(100):
+        store.add(b'%d;' % sequence, 2.0)
+    return store
+
+
+def export(dvr, tmp_path, **kwargs):
+    return asyncio.run(ClipExporter(dvr, tmp_path / 'clips').export(**kwargs))
+
+
+def option(argv, name):
+    return argv[argv.index(name) + 1]
+
+
+def test_clip_range_resolves_offsets_from_start_and_live_edge(dvr):
+    start, end, segments = dvr.clip_range(10, 20)
+    assert (start, end) == (10.0, 20.0)
+    assert [s.dvr_id for s in segments] == [5, 6, 7, 8, 9]
+
+    start, end, segments = dvr.clip_range(-30, None)
+    assert (start, end) == (170.0, 200.0)
+    assert [s.dvr_id for s in segments] == list(range(85, 100))
+
+    start, end, segments = dvr.clip_range(None, None)
+    assert (start, end) == (0.0, 200.0)
+    assert len(segments) == 100
+
+
+def test_clip_is_a_stream_copy_of_the_covering_segments(dvr, tmp_path, remuxes):
+    clip = export(dvr, tmp_path, start=-30)
+    argv = remuxes[0].argv
+    assert argv[0] == 'ffmpeg'
+    assert option(argv, '-f') == 'mpegts' and option(argv, '-i') == 'pipe:0'
+    assert option(argv, '-c') == 'copy'
+    assert option(argv, '-movflags') == '+faststart'
+    assert option(argv, '-t') == '30.000'
+    assert argv[-1] == clip['path']
+    assert bytes(remuxes[0].stdin.data) == b''.join(b'%d;' % n for n in range(85, 100))
+    assert remuxes[0].stdin.closed
+    assert (clip['start'], clip['duration'], clip['segments']) == (170.0, 30.0, 15)
+
+
+def test_fragmented_mp4_format(dvr, tmp_path, remuxes):
+    export(dvr, tmp_path, start=0, end=4, fmt='fmp4')
+    assert option(remuxes[0].argv, '-movflags') == 'frag_keyframe+empty_moov+default_base_moof'
+
+
+def test_start_snaps_to_the_nearest_keyframe(dvr, tmp_path, remuxes):
+    # Every segment starts on a keyframe; 11.0 is nearer 10 than 12, 11.5 nearer 12
+    clip = export(dvr, tmp_path, start=11.0, end=20)
+    assert (clip['start'], clip['duration'], clip['segments']) == (10.0, 10.0, 5)
+    assert bytes(remuxes[0].stdin.data).startswith(b'5;')
+
+    clip = export(dvr, tmp_path, start=11.5, end=20)
+    assert (clip['start'], clip['duration'], clip['segments']) == (12.0, 8.0, 4)
+    assert bytes(remuxes[1].stdin.data).startswith(b'6;')
+
+
+def test_end_trims_the_last_segment(dvr, tmp_path, remuxes):
+    clip = export(dvr, tmp_path, start=10, end=15)
+    assert option(remuxes[0].argv, '-t') == '5.000'
+    assert clip['segments'] == 3  # 10-12, 12-14 and 14-16, cut at 15
+
+
+def test_empty_or_inverted_range_is_rejected(dvr, tmp_path, remuxes):
+    with pytest.raises(ValueError):
+        export(dvr, tmp_path, start=20, end=10)
+    with pytest.raises(ValueError):
+        export(dvr, tmp_path, start=10, end=10)
+    assert not remuxes
+
+
+def test_lookup_and_feed_stay_well_under_a_second(tmp_path, remuxes):
+    # Everything but the remux itself, for a 30 s clip off a full two-hour window with
+    # most of it spilled to disk: the index lookup and the segment reads
+    store = DVRStore(tmp_path / 'dvr', window_seconds=7200, memory_budget=64 * 1024)
+    for _ in range(3600):
+        store.add(bytes(4096), 2.0)
+    assert store.spilled > 3500
+    started = time.monotonic()
+    clip = export(store, tmp_path, start=600, end=630)
+    assert time.monotonic() - started < 0.5
+    assert clip['segments'] == 15
@@ -0,0 +1,113 @@
+import pytest
+
+from crowd_input import CrowdInput
+
+WINDOW = 0.2  # seconds, so the edges are well clear of the submit times below
+
+
+def crowd_for(mode, **kwargs):
+    injected = []
+    crowd = CrowdInput(lambda key, pressed: injected.append((key, pressed)), mode=mode,
+                       window_frames=10, **kwargs)
+    crowd._epoch = 0.0
+    crowd.window_seconds = WINDOW
+    return crowd, injected
+
+
+def test_token_bucket_admits_burst_then_rate():
+    crowd, _ = crowd_for('anarchy', rate=10.0, burst=3)
+    assert [crowd.submit('a', 'Q', now=0.01) for _ in range(4)] == [True, True, True, False]
+    assert crowd.submit('b', 'Q', now=0.01)  # Buckets are per client
+    assert not crowd.submit('a', 'Q', now=0.05)  # 0.4 tokens refilled
+    assert crowd.submit('a', 'Q', now=0.11)
+    assert not crowd.submit('a', 'Q', now=0.11)
+    # Refill is capped at the burst
+    assert [crowd.submit('a', 'Q', now=10.01) for _ in range(4)] == [True, True, True, False]
+    assert crowd.stats['rate_limited'] == 4
+    assert crowd.stats['admitted'] == 8
+
+
+def test_releases_and_unknown_keys_are_not_tallied():
+    crowd, _ = crowd_for('anarchy')
+    assert crowd.submit('a', 'Q', pressed=False, now=0.01)
+    assert not crowd.submit('a', 'NOT_A_KEY', now=0.01)
+    assert crowd._tally == {}
+    assert crowd.stats['ignored'] == 1
+
+
+def test_vote_tallies_one_latest_vote_per_client_per_window():
+    crowd, injected = crowd_for('vote')
+    crowd.submit('a', 'Q', now=0.01)
+    crowd.submit('b', 'Q', now=0.02)
+    crowd.submit('c', 'O', now=0.03)
+    crowd.submit('a', 'O', now=0.04)  # Changes a's vote
+    crowd.submit('c', 'O', now=0.05)  # Repeating a vote does not count twice
+    assert crowd._tally == {'Q': 1, 'O': 2}
+
+    crowd.submit('a', 'P', now=WINDOW + 0.01)  # Closes window 0
+    assert injected == [('O', True)]
+    assert crowd._tally == {'P': 1}
+    crowd._advance(2 * WINDOW + 0.01)
+    assert injected == [('O', True), ('O', False), ('P', True)]
+    crowd._advance(3 * WINDOW + 0.01)  # Nobody voted
+    assert injected[-1] == ('P', False)
+    assert crowd.stats['windows'] == 3
+
+
+def test_anarchy_presses_every_key_of_the_window():
+    crowd, injected = crowd_for('anarchy')
+    for client, key in (('a', 'Q'), ('b', 'O'), ('c', 'Q')):
+        crowd.submit(client, key, now=0.01)
+    assert crowd._tally == {'Q': 2, 'O': 1}
+    crowd._advance(WINDOW + 0.01)
+    assert sorted(injected) == [('O', True), ('Q', True)]
+
+
+@pytest.mark.parametrize('votes, pressed', [(('Q', 'Q', 'O'), True), (('Q', 'O', 'P', 'Q'), False)])
+def test_democracy_needs_more_than_quorum(votes, pressed):
+    crowd, injected = crowd_for('democracy', quorum=0.5)
+    for client, key in enumerate(votes):
+        crowd.submit(client, key, now=0.01)
+    crowd._advance(WINDOW + 0.01)
+    assert injected == ([('Q', True)] if pressed else [])
+    assert crowd.stats['no_quorum'] == (0 if pressed else 1)
+
+
+def test_idle_gap_releases_held_keys_then_skips():
+    crowd, injected = crowd_for('vote')
+    crowd.submit('a', 'Q', now=0.01)
+    crowd._advance(100 * WINDOW + 0.01)  # E.g. the loop stalled for 20 s
+    assert crowd.window == 100
+    # The voted window and the one its winner was held for are closed, the rest skipped
+    assert crowd.stats['windows'] == 2
+    assert injected == [('Q', True), ('Q', False)]
+    assert crowd._held == ()
+
+    crowd.submit('a', 'P', now=100 * WINDOW + 0.02)
+    crowd._advance(101 * WINDOW + 0.01)
+    assert injected[-1] == ('P', True)
+
+
+def test_idle_gap_with_nothing_held_closes_one_window():
+    crowd, injected = crowd_for('vote')
+    crowd._advance(100 * WINDOW + 0.01)
+    assert (crowd.window, crowd.stats['windows']) == (100, 1)
+    assert injected == []
+
+
+def test_time_zero_is_a_timestamp():
+    crowd, _ = crowd_for('anarchy')
+    crowd._epoch = 5.0
+    assert crowd.current_frame(now=0.0) < 0  # Not the current time
+    crowd._epoch = 0.0
+    crowd.submit('a', 'Q', now=0.0)
+    assert crowd._buckets['a'][1] == 0.0
+
+
+def test_prune_drops_idle_buckets():
+    crowd, _ = crowd_for('anarchy')
+    crowd.submit('idle', 'Q', now=0.01)
+    crowd.submit('active', 'Q', now=50.01)
+    crowd._prune(61.0)
+    assert set(crowd._buckets) == {'active'}
+    assert crowd._last_prune == 61.0
@@ -0,0 +1,119 @@
+import pytest
+
+from dvr import DVRStore
+from hls_playlist import parse_playlist
+
+
+def header(text, tag):
+    for line in text.splitlines():
+        if line.startswith(f'#{tag}:'):
+            return int(line.split(':', 1)[1])
+    return None
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Ten two-second segments kept for ten seconds; segment n's bytes are b'<n>'"""
+    store = DVRStore(tmp_path / 'dvr', window_seconds=10)
+    for sequence in range(10):
+        store.add(b'%d' % sequence, 2.0)
+    return store
+
+
+def listed(text):
+    _, _, segments = parse_playlist(text)
+    return [segment.uri for segment in segments]
+
+
+def test_window_evicts_from_the_head(store):
+    metrics = store.metrics()
+    assert (metrics['segments'], metrics['window_start'], metrics['window_end']) == (5, 10.0, 20.0)
+    assert store.evicted == 5
+    assert store.get(4) is None
+    assert store.get(5) == b'5'
+
+
+def test_disk_tier_spills_and_evicts_within_its_budget(tmp_path):
+    store = DVRStore(tmp_path / 'dvr', window_seconds=3600, memory_budget=2048, disk_budget=4096)
+    for _ in range(8):
+        store.add(bytes(1024), 2.0)
+    # Two segments in RAM, up to four spilled to disk, the rest evicted
+    assert (len(store.memory), store.memory_bytes) == (2, 2048)
+    assert store.disk_bytes <= 4096
+    assert sorted(path.name for path in (tmp_path / 'dvr').iterdir()) == ['2.ts', '3.ts', '4.ts', '5.ts']
+    assert store.get(2) == bytes(1024)  # Read back from disk
+    assert store.get(1) is None
+
+
+def test_stale_spill_files_are_removed_on_start(tmp_path):
+    (tmp_path / 'dvr').mkdir()
+    (tmp_path / 'dvr' / '7.ts').write_bytes(b'old run')
+    store = DVRStore(tmp_path / 'dvr')
+    assert not list((tmp_path / 'dvr').iterdir())
+    assert store.get(7) is None
+
+
+@pytest.mark.parametrize('offset, first', [
+    (None, 5),    # Whole window
+    (0, 5),       # Window start
+    (-1000, 5),   # Further behind live than the window reaches
+    (3.9, 6),     # Inside the second segment
+    (-2, 9),      # One segment behind live
+    (-2.5, 8),
+    (10, 9),      # At the live edge
+    (1000, 9),    # Beyond it: the live segment
+])
+def test_playlist_from_resolves_offsets_within_the_window(store, offset, first):
+    text = store.playlist_from(offset)
+    assert listed(text) == [f'segments/{n}.ts' for n in range(first, 10)]
+    assert header(text, 'EXT-X-MEDIA-SEQUENCE') == first
+
+
+def test_clip_range_at_and_beyond_the_edges(store):
+    assert store.clip_range(None, None)[:2] == (10.0, 20.0)
+    assert store.clip_range(0, 10)[:2] == (10.0, 20.0)
+    assert store.clip_range(-1000, None)[2][0].dvr_id == 5
+    start, end, segments = store.clip_range(-4, None)
+    assert (start, end, [s.dvr_id for s in segments]) == (16.0, 20.0, [8, 9])
+
+
+def test_playlist_is_a_sliding_window_without_a_type(store):
+    text = store.window_playlist()
+    assert text.startswith('#EXTM3U\n')
+    assert 'EXT-X-PLAYLIST-TYPE' not in text and 'EXT-X-ENDLIST' not in text
+    target, sequence, segments = parse_playlist(text)
+    assert (target, sequence) == (2, 5)
+    assert [(s.sequence, s.duration) for s in segments] == [(n, 2.0) for n in range(5, 10)]
+
+    store.add(b'10', 2.0)
+    _, sequence, segments = parse_playlist(store.window_playlist())
+    assert sequence == 6 and segments[-1].uri == 'segments/10.ts'
+
+
+def test_discontinuities_are_listed_and_counted_once_evicted(tmp_path):
+    store = DVRStore(tmp_path / 'dvr', window_seconds=6)
+    store.add(b'0', 2.0)
+    store.add(b'1', 2.0, discontinuity=True)  # An encoder restart
+    store.add(b'2', 2.0)
+    text = store.window_playlist()
+    assert header(text, 'EXT-X-DISCONTINUITY-SEQUENCE') is None
+    assert [s.discontinuity for s in parse_playlist(text)[2]] == [False, True, False]
+
+    store.add(b'3', 2.0, discontinuity=True)
+    text = store.window_playlist()  # 1 to 3: the first discontinuity is still listed
+    assert header(text, 'EXT-X-DISCONTINUITY-SEQUENCE') is None
+    assert [s.discontinuity for s in parse_playlist(text)[2]] == [True, False, True]
+
+    store.add(b'4', 2.0)
+    text = store.window_playlist()  # 2 to 4: it slid out
+    assert header(text, 'EXT-X-MEDIA-SEQUENCE') == 2
+    assert header(text, 'EXT-X-DISCONTINUITY-SEQUENCE') == 1
+    assert [s.discontinuity for s in parse_playlist(text)[2]] == [False, True, False]
+    assert header(store.playlist_from(-2), 'EXT-X-DISCONTINUITY-SEQUENCE') == 2
+
+
+def test_empty_store(tmp_path):
+    store = DVRStore(tmp_path / 'dvr')
+    assert parse_playlist(store.window_playlist()) == (2, 0, [])
+    assert store.clip_range(None, None) == (0.0, 0.0, [])
+    assert store.segment_at(5) is None
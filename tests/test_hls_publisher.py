@@ -0,0 +1,175 @@
+import hashlib
+
+import pytest
+
+import hls_publisher
+from hls_playlist import Segment
+from hls_publisher import HLSPublisher
+from local_s3 import LocalS3Client
+
+BUCKET = 'stream'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(hls_publisher.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def s3(tmp_path):
+    return LocalS3Client(tmp_path / 's3')
+
+
+def segments(tmp_path, count, start=0):
+    for sequence in range(start, start + count):
+        path = tmp_path / f'segment{sequence}.ts'
+        path.write_bytes(b'segment %d' % sequence)
+        yield Segment(sequence, path.name, 2.0, False, path)
+
+
+def remote_segments(s3):
+    listed = s3.list_objects_v2(Bucket=BUCKET, Prefix='hls/')['Contents']
+    return sorted(obj['Key'] for obj in listed if obj['Key'].endswith('.ts'))
+
+
+def test_deletes_are_batched_and_rate_limited(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=2, delete_grace=30, delete_interval=1.0, batch_size=3)
+    for segment in segments(tmp_path, 10):
+        publisher.publish(segment)
+    assert len(publisher.retired) == 8
+
+    clock.now += 31
+    publisher.collect_garbage()
+    assert s3.request_counts['DeleteObjects'] == 1
+    assert len(publisher.retired) == 5
+    publisher.collect_garbage()  # Within delete_interval of the last batch
+    assert s3.request_counts['DeleteObjects'] == 1
+
+    for _ in range(2):
+        clock.now += 1
+        publisher.collect_garbage()
+    assert s3.request_counts['DeleteObjects'] == 3
+    assert publisher.stats['deleted'] == 8
+    assert not publisher.retired
+    assert remote_segments(s3) == ['hls/segment8.ts', 'hls/segment9.ts']
+
+
+def test_retired_segments_wait_out_the_grace_period(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=1, delete_grace=30, delete_interval=0)
+    first, second = segments(tmp_path, 2)
+    publisher.publish(first)
+    publisher.publish(second)
+    assert list(publisher.retired) == ['hls/segment0.ts']
+
+    clock.now += 29
+    publisher.collect_garbage()
+    assert 'DeleteObjects' not in s3.request_counts
+    assert remote_segments(s3) == ['hls/segment0.ts', 'hls/segment1.ts']
+
+    clock.now += 2
+    publisher.collect_garbage()
+    assert remote_segments(s3) == ['hls/segment1.ts']
+
+
+def test_republished_key_is_not_deleted(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=1, delete_grace=30, delete_interval=0)
+    first, second = segments(tmp_path, 2)
+    publisher.publish(first)
+    publisher.publish(second)
+    publisher.publish(first)  # A restarted encoder reusing the name
+    clock.now += 31
+    publisher.collect_garbage()
+    assert remote_segments(s3) == ['hls/segment0.ts']
+
+
+def test_startup_recovers_orphans_across_list_pages(tmp_path, s3, clock):
+    for index in range(1500):
+        s3.put_object(Bucket=BUCKET, Key=f'hls/seg/{index:05d}.ts', Body=b'orphan')
+    s3.put_object(Bucket=BUCKET, Key='hls/stream.m3u8', Body=b'#EXTM3U\n')
+    s3.put_object(Bucket=BUCKET, Key='clips/keep.ts', Body=b'not ours')
+
+    publisher = HLSPublisher(s3, BUCKET, delete_grace=30, delete_interval=0)
+    publisher.recover()
+    assert publisher.stats['recovered'] == 1500
+    assert s3.request_counts['ListObjectsV2'] == 2
+
+    publisher.collect_garbage()
+    assert 'DeleteObjects' not in s3.request_counts  # The old playlist may still list them
+
+    clock.now += 31
+    publisher.collect_garbage()
+    publisher.collect_garbage()
+    assert s3.request_counts['DeleteObjects'] == 2
+    assert remote_segments(s3) == []
+    assert (tmp_path / 's3' / BUCKET / 'hls/stream.m3u8').exists()
+    assert (tmp_path / 's3' / BUCKET / 'clips/keep.ts').exists()
+
+
+def content_key(data):
+    return f'hls/seg/{hashlib.sha256(data).hexdigest()[:32]}.ts'
+
+
+def test_content_addressed_segments_are_named_by_hash(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=2, content_addressed=True)
+    first, second = segments(tmp_path, 2)
+    publisher.publish(first)
+    publisher.publish(second)
+
+    keys = [content_key(b'segment 0'), content_key(b'segment 1')]
+    assert remote_segments(s3) == sorted(keys)
+    playlist = (tmp_path / 's3' / BUCKET / 'hls/stream.m3u8').read_text()
+    assert [line for line in playlist.splitlines() if line.endswith('.ts')] == [key[len('hls/'):] for key in keys]
+
+
+def test_content_addressed_republish_is_a_dedup_hit(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=1, delete_grace=30, delete_interval=0, content_addressed=True)
+    first, second = segments(tmp_path, 2)
+    publisher.publish(first)
+    publisher.publish(second)
+    assert list(publisher.retired) == [content_key(b'segment 0')]
+    puts = s3.request_counts['PutObject']
+
+    publisher.publish(first)  # The same bytes again, e.g. after a restart
+    assert publisher.stats['segment_uploads'] == 2
+    assert publisher.stats['dedup_hits'] == 1
+    assert publisher.stats['bytes_saved'] == len(b'segment 0')
+    assert s3.request_counts['PutObject'] == puts + 1  # Only the playlist
+    assert content_key(b'segment 0') not in publisher.retired
+
+    clock.now += 31
+    publisher.collect_garbage()
+    assert remote_segments(s3) == [content_key(b'segment 0')]
+
+
+def test_shared_object_is_kept_while_any_listing_uses_it(tmp_path, s3, clock):
+    publisher = HLSPublisher(s3, BUCKET, window_size=2, delete_grace=30, delete_interval=0, content_addressed=True)
+    paths = []
+    for sequence, body in enumerate([b'same', b'same', b'other', b'later']):
+        path = tmp_path / f'segment{sequence}.ts'
+        path.write_bytes(body)
+        paths.append(Segment(sequence, path.name, 2.0, False, path))
+
+    for segment in paths[:3]:
+        publisher.publish(segment)
+    # The first listing of the shared object left the window, the second is still in it
+    assert publisher.stats['dedup_hits'] == 1
+    assert not publisher.retired
+    clock.now += 31
+    publisher.collect_garbage()
+    assert content_key(b'same') in remote_segments(s3)
+
+    publisher.publish(paths[3])  # Now no listing uses it
+    assert list(publisher.retired) == [content_key(b'same')]
+    clock.now += 31
+    publisher.collect_garbage()
+    assert remote_segments(s3) == sorted([content_key(b'other'), content_key(b'later')])
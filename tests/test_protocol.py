@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+import protocol
+from session_recorder import INPUT_CODES
+
+SEEDS = (0, 1, 2)
+ITERATIONS = 2000
+
+
+def random_string(rng, limit=40):
+    alphabet = 'abcXYZ019 /:.-_éß→🎮'
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randrange(limit)))
+
+
+def random_message(rng):
+    code = rng.choice(list(protocol.SCHEMA))
+    name, fields = protocol.SCHEMA[code]
+    message = {'type': name}
+    for field, kind, default in fields:
+        if kind == 'bool':
+            message[field] = rng.random() < 0.5
+        elif kind == 'u32':
+            message[field] = rng.randrange(1 << 32)
+        elif kind == 'ms':
+            message[field] = rng.randrange(1 << 22) / 1000
+        elif kind == 'key':
+            message[field] = rng.choice(INPUT_CODES)
+        elif rng.random() < 0.8:
+            message[field] = random_string(rng)
+    if rng.random() < 0.1:
+        # Extra field: must survive via the JSON escape
+        message['extra'] = random_string(rng)
+    return message
+
+
+def mutate(rng, frame):
+    mutated = bytearray(frame)
+    mutation = rng.randrange(4)
+    if mutation == 0:
+        for _ in range(rng.randrange(1, 4)):
+            mutated[rng.randrange(len(mutated))] = rng.randrange(256)
+    elif mutation == 1:
+        del mutated[rng.randrange(len(mutated)):]
+    elif mutation == 2:
+        position = rng.randrange(len(mutated))
+        mutated[position:position] = rng.randbytes(rng.randrange(1, 16))
+    else:
+        mutated += rng.randbytes(rng.randrange(1, 16))
+    return bytes(mutated)
+
+
+def decode_or_reject(codec, data):
+    """Decode data; any failure other than ProtocolError escapes and fails the test"""
+    try:
+        messages = codec.decode(data)
+    except protocol.ProtocolError:
+        return None
+    assert isinstance(messages, list)
+    assert all(isinstance(message, dict) for message in messages)
+    return messages
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_binary_round_trip(seed):
+    rng = random.Random(seed)
+    codec = protocol.Codec(protocol.BINARY_SUBPROTOCOL)
+    for iteration in range(ITERATIONS):
+        messages = [random_message(rng) for _ in range(rng.randrange(1, 8))]
+        frame = codec.frame([protocol.encode_record(m) for m in messages])
+        assert codec.decode(frame) == messages, f'seed {seed}, iteration {iteration}'
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_mutated_frames_decode_or_raise_protocol_error(seed):
+    rng = random.Random(seed)
+    codec = protocol.Codec(protocol.BINARY_SUBPROTOCOL)
+    for _ in range(ITERATIONS):
+        messages = [random_message(rng) for _ in range(rng.randrange(1, 8))]
+        frame = codec.frame([protocol.encode_record(m) for m in messages])
+        decode_or_reject(codec, mutate(rng, frame))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_garbage_decodes_or_raises_protocol_error(seed):
+    rng = random.Random(seed)
+    binary = protocol.Codec(protocol.BINARY_SUBPROTOCOL)
+    text = protocol.Codec()
+    for _ in range(ITERATIONS):
+        decode_or_reject(binary, rng.randbytes(rng.randrange(64)))
+        decode_or_reject(text, random_string(rng) + rng.choice(['', '{', '[', '"', '[1]', '{}', 'null']))
+
+
+def test_json_codec_round_trip():
+    codec = protocol.Codec(protocol.JSON_SUBPROTOCOL)
+    message = {'type': 'key_press', 'key': 'SPACE', 'pressed': True}
+    assert codec.decode(codec.encode(message)) == [message]
+    assert codec.decode('[{"type": "status"}, {"type": "hello"}]') == [{'type': 'status'}, {'type': 'hello'}]
+    with pytest.raises(protocol.ProtocolError):
+        codec.decode('[1, 2]')
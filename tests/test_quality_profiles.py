@@ -0,0 +1,162 @@
+import json
+import re
+
+import pytest
+
+from quality_profiles import (OUTPUTS, PROFILE_DIR, ProfileError, QualityProfile, encode_args, hls_command,
+                              load_profiles, rtmp_command)
+
+PROFILES = load_profiles()
+SHIPPED = sorted(path.stem for path in PROFILE_DIR.glob('*.json'))
+
+# What the emulator_server_* variants replaced by the profiles ran, as (default X display,
+# {output: ffmpeg options}): base -> standard, _fixed -> low (256x192 captured without
+# scaling), _hq -> hq, _1080p -> 1080p60, _ultra_hd -> ultra_hd (constant quality, no audio).
+# Unlisted options were absent; tune was zerolatency unless given.
+VARIANTS = {
+    'standard': ('512x384', {
+        'web': dict(fps='25', scale='scale=1280x720:flags=neighbor', preset='fast', bitrate='2000k',
+                    maxrate='2500k', bufsize='5000k', gop='50', audio='128k'),
+        'youtube': dict(fps='25', scale='scale=1280x720:flags=neighbor', preset='veryfast', bitrate='2500k',
+                        maxrate='3000k', bufsize='6000k', gop='50', audio='128k'),
+    }),
+    'low': ('512x384', {
+        'web': dict(fps='25', size='256x192', preset='ultrafast', bitrate='500k', maxrate='500k',
+                    bufsize='1000k', gop='50', audio='128k'),
+        'youtube': dict(fps='25', size='256x192', preset='veryfast', bitrate='1000k', maxrate='1000k',
+                        bufsize='2000k', gop='50', audio='128k'),
+    }),
+    'hq': ('1024x768', {
+        'web': dict(fps='25', scale='scale=1920x1080:flags=lanczos', preset='medium', profile='high', level='4.1',
+                    bitrate='5000k', maxrate='6000k', bufsize='10000k', gop='50', audio='192k'),
+        'youtube': dict(fps='25', scale='scale=1920x1080:flags=lanczos', preset='veryfast', profile='high',
+                        level='4.1', bitrate='6000k', maxrate='7000k', bufsize='12000k', gop='50', audio='192k'),
+    }),
+    '1080p60': ('1920x1080', {
+        output: dict(fps='60', scale='scale=1920x1080:flags=lanczos', preset='medium', profile='high', level='4.2',
+                     bitrate='6000k', maxrate='6500k', bufsize='12000k', gop='120', audio='192k')
+        for output in OUTPUTS
+    }),
+    'ultra_hd': ('1920x1080', {
+        'web': dict(fps='25', scale='scale=1920x1080:flags=lanczos', preset='medium', crf='18', maxrate='8000k',
+                    bufsize='16000k', gop='50', tune=None, audio=None),
+        'youtube': dict(fps='25', scale='scale=1920x1080:flags=lanczos', preset='fast', crf='20', maxrate='8000k',
+                        bufsize='16000k', gop='50', tune=None, audio=None),
+    }),
+}
+
+
+def keyframes(args, rate, frames):
+    """Frames x264 makes keyframes of: forced by the expression, or -g frames after the last one"""
+    gop = int(args[args.index('-g') + 1])
+    offset, period, width = (float(value) for value in
+                             re.fullmatch(r'expr:lt\(mod\(t\+([\d.]+),([\d.]+)\),([\d.]+)\)',
+                                          args[args.index('-force_key_frames') + 1]).groups())
+    last = None
+    for frame in range(frames):
+        forced = (frame / rate + offset) % period < width
+        if forced or last is None or frame - last >= gop:
+            yield frame, forced
+            last = frame
+
+
+@pytest.mark.parametrize('name', sorted(PROFILES))
+@pytest.mark.parametrize('output', OUTPUTS)
+def test_gop_never_adds_keyframes_off_the_grid(name, output):
+    profile = PROFILES[name]
+    rate = float(profile.frame_rate)
+    gop_seconds = profile.config[output]['gop_seconds']
+    found = list(keyframes(encode_args(profile, output, 'display'), rate, int(rate * 600)))
+    assert all(forced for _, forced in found)
+    # One keyframe per grid point over ten minutes of stream
+    assert len(found) == pytest.approx(600 / gop_seconds, abs=1)
+
+
+def option(argv, name):
+    return argv[argv.index(name) + 1] if name in argv else None
+
+
+def test_every_shipped_profile_loads():
+    assert sorted(PROFILES) == SHIPPED
+    for name in SHIPPED:
+        profile = QualityProfile(name, json.loads((PROFILE_DIR / f'{name}.json').read_text()))
+        assert profile.config == PROFILES[name].config
+
+
+@pytest.mark.parametrize('name', sorted(VARIANTS))
+def test_commands_match_the_variant_servers(name):
+    display, outputs = VARIANTS[name]
+    profile = PROFILES[name]
+    profile.check_display(display)
+    commands = {
+        'web': hls_command(profile, 'x11', '/tmp/hls/live1.m3u8', display),
+        'youtube': rtmp_command(profile, 'x11', 'rtmp://a.rtmp.youtube.com/live2/key', display),
+    }
+    for output, argv in commands.items():
+        expected = outputs[output]
+        assert option(argv, '-framerate') == expected['fps']
+        assert option(argv, '-video_size') == expected.get('size', display)
+        assert option(argv, '-vf') == expected.get('scale')
+        assert option(argv, '-preset') == expected['preset']
+        assert option(argv, '-tune') == expected.get('tune', 'zerolatency')
+        assert option(argv, '-profile:v') == expected.get('profile')
+        assert option(argv, '-level') == expected.get('level')
+        assert option(argv, '-b:v') == expected.get('bitrate')
+        assert option(argv, '-crf') == expected.get('crf')
+        assert option(argv, '-maxrate') == expected['maxrate']
+        assert option(argv, '-bufsize') == expected['bufsize']
+        assert option(argv, '-g') == expected['gop']
+        assert option(argv, '-b:a') == expected['audio']
+        assert ('-an' in argv) == (expected['audio'] is None)
+    assert option(commands['web'], '-hls_time') == '2'
+    assert commands['youtube'][-2:] == ['flv', 'rtmp://a.rtmp.youtube.com/live2/key']
+
+
+def minimal(**sections):
+    data = {'web': {'bitrate': '1000k'}, 'youtube': {'bitrate': '1000k'}}
+    data.update(sections)
+    return data
+
+
+@pytest.mark.parametrize('data, error', [
+    (minimal(capture={'fps': 30, 'clock': 'frame'}), r'bad\.capture\.fps: the frame clock'),
+    (minimal(web={'preset': 'fast'}), r'bad\.web: needs a bitrate or a crf'),
+    (minimal(web={'bitrate': '2000k', 'maxrate': '1000k', 'bufsize': '2000k'}), r'bad\.web\.maxrate: below'),
+    (minimal(youtube={'bitrate': '1000k', 'maxrate': '1000k'}), r'bad\.youtube\.bufsize: required'),
+    (minimal(capture={'fps': 25}, web={'bitrate': '1000k', 'gop_seconds': 0.5}),
+     r'bad\.web\.gop_seconds: 0\.5s is not a whole number'),
+    (minimal(scale={'resolution': '1920x1080'}, web={'bitrate': '1000k', 'level': '3.0'}),
+     r'bad\.web\.level: 3\.0 allows'),
+    (minimal(hls={'segment_seconds': 3}), r'bad\.hls\.segment_seconds: 3s is not a multiple'),
+    (minimal(web={'bitrate': '1000k', 'preset': 'warp'}), r'bad\.web\.preset'),
+    (minimal(scale={'flags': 'neighbor'}), r'bad\.scale\.resolution: required'),
+    (minimal(scale={'resolution': '1280x721'}), r'bad\.scale\.resolution'),
+    (minimal(web={'bitrate': '1000k', 'bframes': 2}), r"bad\.web: unknown field 'bframes'"),
+    (minimal(overlay={}), r"bad: unknown section 'overlay'"),
+])
+def test_inconsistent_profiles_are_rejected(data, error):
+    with pytest.raises(ProfileError, match=error):
+        QualityProfile('bad', data)
+
+
+def test_overrides_are_validated_like_profiles():
+    standard = PROFILES['standard']
+    faster = standard.with_overrides({'web': {'preset': 'veryfast'}})
+    assert faster.config['web']['preset'] == 'veryfast'
+    assert standard.config['web']['preset'] == 'fast'
+
+    with pytest.raises(ProfileError, match=r"standard: cannot override 'overlay'"):
+        standard.with_overrides({'overlay': {'text': 'hi'}})
+    with pytest.raises(ProfileError, match=r"standard: cannot override 'web' with 'fast'"):
+        standard.with_overrides({'web': 'fast'})
+    with pytest.raises(ProfileError, match=r'standard\.web\.preset'):
+        standard.with_overrides({'web': {'preset': 'warp'}})
+    with pytest.raises(ProfileError, match=r'standard\.web\.maxrate: below'):
+        standard.with_overrides({'web': {'bitrate': '4000k'}})
+
+
+def test_invalid_profile_files_are_skipped(tmp_path):
+    (tmp_path / 'good.json').write_text(json.dumps(minimal()))
+    (tmp_path / 'bad.json').write_text(json.dumps(minimal(web={'preset': 'fast'})))
+    (tmp_path / 'broken.json').write_text('{')
+    assert sorted(load_profiles(tmp_path)) == ['good']
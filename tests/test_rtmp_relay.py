@@ -0,0 +1,200 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from rtmp_relay import TAG_AUDIO, TAG_SCRIPT, TAG_VIDEO, Destination, RTMPRelay, read_flv, retime
+
+FLV_HEADER = b'FLV\x01\x05' + (9).to_bytes(4, 'big')
+
+
+def flv_tag(kind, timestamp, body):
+    head = (bytes([kind]) + len(body).to_bytes(3, 'big') + (timestamp & 0xffffff).to_bytes(3, 'big')
+            + bytes([timestamp >> 24 & 0xff]) + b'\x00\x00\x00')
+    return head + body + (11 + len(body)).to_bytes(4, 'big')
+
+
+def avc_config(version=b'A'):
+    return flv_tag(TAG_VIDEO, 0, b'\x17\x00\x00\x00\x00' + version)
+
+
+def aac_config():
+    return flv_tag(TAG_AUDIO, 0, b'\xaf\x00\x12\x10')
+
+
+def keyframe(timestamp):
+    return flv_tag(TAG_VIDEO, timestamp, b'\x17\x01\x00\x00\x00key')
+
+
+def interframe(timestamp):
+    return flv_tag(TAG_VIDEO, timestamp, b'\x27\x01\x00\x00\x00inter')
+
+
+def audio(timestamp):
+    return flv_tag(TAG_AUDIO, timestamp, b'\xaf\x01aac')
+
+
+def parse(data):
+    """read_flv over a socket that has data and then EOF"""
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        writer.sendall(data)
+        writer.shutdown(socket.SHUT_WR)
+        return list(read_flv(reader))
+
+
+def tags(*timestamps_and_kinds):
+    parsed = parse(FLV_HEADER + b'\x00' * 4 + b''.join(timestamps_and_kinds))
+    return parsed[1:]
+
+
+def test_read_flv_classifies_tags():
+    stream = [flv_tag(TAG_SCRIPT, 0, b'\x02onMetaData'), avc_config(), aac_config(), keyframe(0),
+              audio(23), interframe(40), keyframe(0x1234567)]
+    header, *parsed = parse(FLV_HEADER + b'\x00' * 4 + b''.join(stream))
+    assert header == FLV_HEADER + b'\x00' * 4
+    assert [tag.data for tag in parsed] == stream
+    assert [(tag.type, tag.timestamp, tag.keyframe, tag.config) for tag in parsed] == [
+        (TAG_SCRIPT, 0, False, True),
+        (TAG_VIDEO, 0, True, True),
+        (TAG_AUDIO, 0, False, True),
+        (TAG_VIDEO, 0, True, False),
+        (TAG_AUDIO, 23, False, False),
+        (TAG_VIDEO, 40, False, False),
+        (TAG_VIDEO, 0x1234567, True, False),  # Extended timestamp byte
+    ]
+
+
+def test_read_flv_stops_at_a_truncated_tag():
+    data = FLV_HEADER + b'\x00' * 4 + keyframe(0) + interframe(40)[:-3]
+    assert [tag.timestamp for tag in parse(data)[1:]] == [0]
+
+
+def test_read_flv_rejects_other_streams():
+    with pytest.raises(ValueError):
+        parse(b'\x00' * 13)
+
+
+def test_retime_rewrites_the_tag_header():
+    tag, = tags(interframe(40))
+    later = retime(tag, 0x2000000)
+    assert later.timestamp == 0x2000028
+    reparsed, = tags(later.data)
+    assert reparsed.timestamp == 0x2000028
+    assert later.data[11:] == tag.data[11:]
+    assert retime(tag, -100).timestamp == 0
+
+
+def test_drop_gop_keeps_the_backlog_on_a_keyframe():
+    destination = Destination('test', 'rtmp://example/live/key', max_backlog_seconds=1.0)
+    for timestamp in range(0, 4000, 40):
+        maker = keyframe if timestamp % 400 == 0 else interframe
+        tag, = tags(maker(timestamp))
+        destination.put(tag)
+        assert destination._backlog[0].keyframe
+        assert destination._backlog_seconds() <= 1.0
+    assert destination.stats['dropped_tags'] == len(range(0, 4000, 40)) - len(destination._backlog)
+    assert destination._backlog_bytes == sum(len(tag.data) for tag in destination._backlog)
+
+
+def test_drop_gop_stops_at_inline_sequence_headers():
+    destination = Destination('test', 'rtmp://example/live/key', max_backlog_seconds=1.0)
+    config, = tags(retime(tags(avc_config(b'B'))[0], 440).data)
+    for tag in tags(keyframe(0), interframe(40), interframe(400)):
+        destination.put(tag)
+    destination.switch([config], [config])
+    for tag in tags(keyframe(440), interframe(480), interframe(1500)):
+        destination.put(tag)
+    assert destination._backlog[0].config
+    assert [tag.timestamp for tag in destination._backlog] == [440, 440, 480, 1500]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_destination_forwards_from_a_keyframe(tmp_path):
+    out = tmp_path / 'out.flv'
+    destination = Destination('cat', 'rtmp://example/live/key', command=['sh', '-c', f'cat > {out}'])
+    header = FLV_HEADER + b'\x00' * 4
+    config = tags(avc_config(), aac_config())
+    destination.start()
+    try:
+        destination.reset(header, config)
+        stream = tags(interframe(0), keyframe(40), audio(50), interframe(80))
+        for tag in stream:
+            destination.put(tag)
+        wait_for(lambda: destination.stats['tags_sent'] == 3)
+        expected = header + b''.join(tag.data for tag in config + stream[1:])
+        wait_for(lambda: out.read_bytes() == expected)
+        assert destination.stats['dropped_tags'] == 1
+        assert destination.metrics()['state'] == 'connected'
+    finally:
+        destination.stop()
+    assert destination.state == 'stopped'
+
+
+def test_destination_backs_off_and_reconnects():
+    destination = Destination('false', 'rtmp://example/live/key', command=['false'], backoff=0.05, max_backoff=0.1)
+    destination.start()
+    try:
+        destination.reset(FLV_HEADER + b'\x00' * 4, [])
+        wait_for(lambda: destination.stats['connects'] >= 3 and destination.stats['disconnects'] >= 2)
+        assert destination.last_error
+    finally:
+        destination.stop()
+    assert destination.state == 'stopped'
+
+
+def feed(relay, number, data):
+    """Run relay's reader for input number over data, as _serve would"""
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        writer.sendall(data)
+        writer.shutdown(socket.SHUT_WR)
+        relay._read(reader, number)
+
+
+def test_relay_switch_continues_the_timeline():
+    destination = Destination('test', 'rtmp://example/live/key')
+    relay = RTMPRelay([destination])
+    header = FLV_HEADER + b'\x00' * 4
+    first, first_writer = socket.socketpair()
+    reader = threading.Thread(target=relay._read, args=(first, 1))
+    try:
+        reader.start()
+        first_writer.sendall(header + avc_config(b'A') + aac_config() + keyframe(0) + interframe(40) + keyframe(80)
+                             + interframe(120))
+        wait_for(lambda: len(destination._backlog) == 4)
+        assert destination._header == header
+        assert [tag.config for tag in destination._config] == [True, True]
+        assert [tag.timestamp for tag in destination._backlog] == [0, 40, 80, 120]
+        destination._backlog.clear()
+
+        switched = relay.expect_switch()
+        # The new encoder's video headers differ and its audio ones don't; it starts mid-GOP
+        feed(relay, 2, header + avc_config(b'B') + aac_config() + interframe(1000) + keyframe(1040)
+             + interframe(1080))
+        assert switched.is_set()
+        assert relay.stats['input_switches'] == 1
+        sent = list(destination._backlog)
+        # Only the changed sequence header is resent, at the join, then the frames continue 40 ms on
+        assert [(tag.config, tag.timestamp) for tag in sent] == [(True, 160), (False, 160), (False, 200)]
+        assert sent[0].data[11:] == avc_config(b'B')[11:]
+        assert sent[1].keyframe
+        assert [tag.data for tag in destination._config] == [avc_config(b'B'), aac_config()]
+
+        # The replaced encoder is read until it disconnects, but no longer forwarded
+        first_writer.sendall(keyframe(160) + interframe(200))
+        first_writer.shutdown(socket.SHUT_WR)
+        reader.join(timeout=5)
+        assert relay.stats['input_tags'] == 13
+        assert list(destination._backlog) == sent
+    finally:
+        first_writer.close()
+        first.close()
+        relay.stop()
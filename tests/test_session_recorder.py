@@ -0,0 +1,103 @@
+import struct
+
+import pytest
+
+import session_recorder
+from session_recorder import (END_CODE, INPUT_CODES, INPUT_LOG_MAGIC, SessionRecorder, decode_varint,
+                              encode_varint, read_input_log)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_recorder.time, 'monotonic', clock)
+    return clock
+
+
+def frames(count):
+    return count / session_recorder.SPECTRUM_FRAME_RATE
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 16383, 16384, 2 ** 31])
+def test_varint_round_trip(value):
+    data = encode_varint(value)
+    assert decode_varint(data + b'\x00', 0) == (value, len(data))
+
+
+def test_log_round_trip(tmp_path, clock):
+    snapshot = tmp_path / 'start.z80'
+    snapshot.write_bytes(b'\x01\x02\x03')
+    recorder = SessionRecorder(tmp_path / 'sessions')
+    assert recorder.start(snapshot) == ['--snapshot', str(snapshot)]
+    recorder.mark_running()
+    clock.now += frames(10.5)
+    recorder.record_key('q')
+    clock.now += frames(300)
+    recorder.record_key('Q', pressed=False)
+    recorder.record_key('JOY_FIRE')
+    recorder.record_key('not-a-key')
+    clock.now += frames(2)
+    path = recorder.stop()
+
+    header, events = read_input_log(path)
+    assert events == [(10, 'Q', True), (310, 'Q', False), (310, 'JOY_FIRE', True)]
+    assert header['total_frames'] == 312
+    assert header['complete']
+    assert header['snapshot_name'] == 'start.z80'
+    assert header['snapshot'] == b'\x01\x02\x03'
+
+
+def test_frame_clock_starts_when_fuse_is_running(tmp_path, clock):
+    recorder = SessionRecorder(tmp_path)
+    recorder.start()
+    clock.now += 5  # FUSE start-up
+    recorder.record_key('1')
+    recorder.mark_running()
+    clock.now += frames(50.5)
+    recorder.record_key('2')
+    _, events = read_input_log(recorder.stop())
+    assert events == [(0, '1', True), (50, '2', True)]
+
+
+def test_truncated_log_is_incomplete(tmp_path, clock):
+    recorder = SessionRecorder(tmp_path)
+    recorder.start()
+    recorder.mark_running()
+    clock.now += frames(20)
+    recorder.record_key('A')
+    recorder._file.flush()
+    data = recorder.log_path.read_bytes()
+    truncated = tmp_path / 'cut.silog'
+    truncated.write_bytes(data + b'\x85')  # Half of a two-byte frame delta
+    header, events = read_input_log(truncated)
+    assert events == [(20, 'A', True)]
+    assert header['total_frames'] == 20
+    assert not header['complete']
+
+
+def test_unknown_code_is_value_error(tmp_path):
+    path = tmp_path / 'bad.silog'
+    header = INPUT_LOG_MAGIC + struct.pack('<BddHI', 1, 0.0, 50.0, 0, 0)
+    path.write_bytes(header + encode_varint(1) + bytes((len(INPUT_CODES),)) + encode_varint(0) + bytes((END_CODE,)))
+    with pytest.raises(ValueError, match='unknown input code'):
+        read_input_log(path)
+
+
+def test_old_sessions_are_pruned(tmp_path, clock):
+    recorder = SessionRecorder(tmp_path, rzx=True, keep=2)
+    for name in ('20260101-000000-a', '20260102-000000-b', '20260103-000000-c'):
+        (tmp_path / f'{name}.silog').write_bytes(b'')
+        (tmp_path / f'{name}.rzx').write_bytes(b'')
+    recorder.start()
+    recorder.stop()
+    remaining = sorted(path.name for path in tmp_path.iterdir())
+    assert remaining == ['20260103-000000-c.rzx', '20260103-000000-c.silog',
+                         f'{recorder.session_id}.silog']
@@ -0,0 +1,96 @@
+import pytest
+
+import session_recorder
+import session_render
+from session_recorder import SessionRecorder
+from session_render import convert_command, encode_command, fuse_command, render_recording
+
+
+def option(argv, name, after=0):
+    position = argv.index(name, after)
+    return argv[position + 1]
+
+
+class FakeFuse:
+    """FUSE that has already finished replaying"""
+
+    def __init__(self, argv, **kwargs):
+        self.argv = argv
+        self.env = kwargs['env']
+
+    def poll(self):
+        return 0
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    started = []
+
+    def popen(argv, **kwargs):
+        started.append(FakeFuse(argv, **kwargs))
+        return started[-1]
+
+    def run(argv, **kwargs):
+        assert kwargs['check']
+        started.append(argv)
+
+    monkeypatch.setattr(session_render.subprocess, 'Popen', popen)
+    monkeypatch.setattr(session_render.subprocess, 'run', run)
+    return started
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    """A complete 250-frame session log with its RZX, as the server leaves them"""
+    now = [1000.0]
+    monkeypatch.setattr(session_recorder.time, 'monotonic', lambda: now[0])
+    recorder = SessionRecorder(tmp_path / 'sessions', rzx=True)
+    fuse_args = recorder.start()
+    recorder.mark_running()
+    now[0] += 100.5 / session_recorder.SPECTRUM_FRAME_RATE
+    recorder.record_key('SPACE')
+    now[0] += 150 / session_recorder.SPECTRUM_FRAME_RATE
+    log_path = recorder.stop()
+    rzx_path = fuse_args[fuse_args.index('--record') + 1]
+    assert rzx_path == str(log_path.with_suffix('.rzx'))
+    log_path.with_suffix('.rzx').write_bytes(b'RZX!')
+    return log_path
+
+
+def test_encode_reads_the_converted_movie_with_its_format():
+    argv = encode_command('/w/video.y4m', '/w/audio.wav', 250, '/out/s.mp4')
+    # Neither input is left to extension guessing: YUV4MPEG2 carries the size and rate
+    assert option(argv, '-f') == 'yuv4mpegpipe' and option(argv, '-i') == '/w/video.y4m'
+    assert option(argv, '-f', argv.index('-i') + 1) == 'wav'
+    assert option(argv, '-i', argv.index('-i') + 1) == '/w/audio.wav'
+    assert option(argv, '-frames:v') == '250'
+    assert option(argv, '-vf') == f'scale={session_render.RENDER_RESOLUTION}:flags=neighbor'
+    assert option(argv, '-crf') == session_render.RENDER_CRF
+    assert argv[-1] == '/out/s.mp4'
+
+
+def test_fuse_replays_the_rzx_into_a_movie():
+    argv = fuse_command('/s/a.rzx', '/w/movie.fmf', speed=1500)
+    assert option(argv, '--playback') == '/s/a.rzx'
+    assert option(argv, '--movie-start') == '/w/movie.fmf'
+    assert option(argv, '--speed') == '1500'
+
+
+def test_render_runs_fuse_fmfconv_and_ffmpeg(recording, tmp_path, pipeline):
+    out = render_recording(recording, tmp_path / 'renders', speed=1500)
+    assert out == tmp_path / 'renders' / f'{recording.stem}.mp4'
+
+    fuse, convert, encode = pipeline
+    movie = option(fuse.argv, '--movie-start')
+    work = movie.rsplit('/', 1)[0]
+    assert fuse.argv == fuse_command(recording.with_suffix('.rzx'), movie, speed=1500)
+    assert fuse.env['SDL_VIDEODRIVER'] == 'dummy'
+    assert convert == convert_command(movie, f'{work}/video.y4m', f'{work}/audio.wav')
+    assert encode == encode_command(f'{work}/video.y4m', f'{work}/audio.wav', 250, out)
+
+
+def test_render_needs_the_rzx(recording, tmp_path, pipeline):
+    recording.with_suffix('.rzx').unlink()
+    with pytest.raises(FileNotFoundError, match='SESSION_RZX'):
+        render_recording(recording, tmp_path)
+    assert not pipeline
@@ -7,6 +7,22 @@ class SpectrumEmulator {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         
+        // Segment push notifications: playlist reloads wait for the server's
+        // "new segment" message instead of polling on a timer
+        this.segmentPushActive = false;
+        this.segmentPending = false;
+        this.segmentWaiters = [];
+        this.lastSegmentNotified = 0;
+        this.targetDuration = 2;
+        this.pushStats = { notifications: 0, playlistRequests: 0, latencyTotal: 0, latencySamples: 0 };
+        
+        // Compact binary frames unless ?protocol=json is set (readable in the browser's
+        // network panel). Messages sent in the same tick share one frame.
+        this.preferJson = new URLSearchParams(window.location.search).get('protocol') === 'json';
+        this.binaryProtocol = false;
+        this.txSequence = 0;
+        this.outbox = [];
+        
         this.init();
     }
 
@@ -21,10 +37,15 @@ class SpectrumEmulator {
 
     setupHLS() {
         const video = document.getElementById('videoPlayer');
-        const streamUrl = 'https://spectrum-emulator-stream-dev-043309319786.s3.us-east-1.amazonaws.com/hls/stream.m3u8?t=' + Date.now();
+        // No cache busting is needed (and a unique URL would defeat the CDN): the playlist is
+        // served no-cache, and a segment name (live<generation>_<n>.ts) is only reused by a
+        // later server run, while its max-age is 10 s. With HLS_CONTENT_ADDRESSED=1 segments are
+        // immutable seg/<hash>.ts objects instead.
+        const streamUrl = 'https://spectrum-emulator-stream-dev-043309319786.s3.us-east-1.amazonaws.com/hls/stream.m3u8';
 
         if (Hls.isSupported()) {
             this.hls = new Hls({
+                pLoader: this.createPushPlaylistLoader(),
                 debug: false,
                 enableWorker: true,
                 lowLatencyMode: true,
@@ -47,7 +68,15 @@ class SpectrumEmulator {
             });
 
             this.hls.on(Hls.Events.LEVEL_LOADED, (event, data) => {
-                this.log(`📊 Stream quality: ${data.details.totalduration}s segments`, 'info');
+                this.targetDuration = data.details.targetduration || this.targetDuration;
+                if (this.lastSegmentNotified) {
+                    this.pushStats.latencyTotal += performance.now() - this.lastSegmentNotified;
+                    this.pushStats.latencySamples++;
+                    this.lastSegmentNotified = 0;
+                }
+                if (this.pushStats.playlistRequests % 30 === 1) {
+                    this.logPushStats();
+                }
             });
 
             this.hls.on(Hls.Events.ERROR, (event, data) => {
@@ -78,18 +107,82 @@ class SpectrumEmulator {
         }
     }
 
+    createPushPlaylistLoader() {
+        const emulator = this;
+        const BaseLoader = Hls.DefaultConfig.loader;
+
+        return class PushPlaylistLoader extends BaseLoader {
+            load(context, config, callbacks) {
+                emulator.pushStats.playlistRequests++;
+                this.pushAborted = false;
+                emulator.waitForSegment().then(() => {
+                    if (!this.pushAborted) {
+                        super.load(context, config, callbacks);
+                    }
+                });
+            }
+
+            abort() {
+                this.pushAborted = true;
+                super.abort();
+            }
+        };
+    }
+
+    waitForSegment() {
+        // Load straight away until pushes are flowing, or if one arrived since the last load
+        if (!this.segmentPushActive || this.segmentPending) {
+            this.segmentPending = false;
+            return Promise.resolve();
+        }
+        return new Promise(resolve => {
+            // Fall back to polling if a notification goes missing
+            const timer = setTimeout(resolve, this.targetDuration * 2000);
+            this.segmentWaiters.push(() => {
+                clearTimeout(timer);
+                resolve();
+            });
+        });
+    }
+
+    onSegmentNotification(data) {
+        this.pushStats.notifications++;
+        this.lastSegmentNotified = performance.now();
+        const waiters = this.segmentWaiters;
+        this.segmentWaiters = [];
+        if (waiters.length) {
+            waiters.forEach(wake => wake());
+        } else {
+            this.segmentPending = true;
+        }
+    }
+
+    logPushStats() {
+        const stats = this.pushStats;
+        const latency = stats.latencySamples ? (stats.latencyTotal / stats.latencySamples).toFixed(0) : '-';
+        this.log(`📡 Segment push: ${stats.notifications} notifications, ${stats.playlistRequests} playlist requests, ` +
+                 `${latency}ms avg notify→playlist latency`, 'info');
+    }
+
     connectWebSocket() {
         const wsUrl = 'wss://d112s3ps8xh739.cloudfront.net/ws/';
         this.log(`🔌 Connecting to HIGH QUALITY server at ${wsUrl}...`, 'info');
 
         try {
-            this.ws = new WebSocket(wsUrl);
+            this.ws = new WebSocket(wsUrl, this.preferJson ? [SpectrumProtocol.JSON_TEXT]
+                                                           : [SpectrumProtocol.BINARY, SpectrumProtocol.JSON_TEXT]);
+            this.ws.binaryType = 'arraybuffer';
             
             this.ws.onopen = () => {
+                // A server that predates the binary protocol selects no subprotocol: plain JSON
+                this.binaryProtocol = this.ws.protocol === SpectrumProtocol.BINARY;
+                this.txSequence = 0;
+                this.outbox = [];
                 this.connected = true;
                 this.reconnectAttempts = 0;
                 this.updateConnectionStatus(true);
                 this.log('✅ Connected to HIGH QUALITY emulator server!', 'success');
+                this.sendMessage({ type: 'subscribe_segments' });
                 
                 // Auto-request status to check if emulator is already running
                 setTimeout(() => {
@@ -100,8 +193,11 @@ class SpectrumEmulator {
 
             this.ws.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data);
-                    this.handleMessage(data);
+                    if (typeof event.data === 'string') {
+                        this.handleMessage(JSON.parse(event.data));
+                    } else {
+                        SpectrumProtocol.decodeFrame(event.data).messages.forEach(data => this.handleMessage(data));
+                    }
                 } catch (e) {
                     this.log(`❌ Invalid message received: ${event.data}`, 'error');
                 }
@@ -109,6 +205,9 @@ class SpectrumEmulator {
 
             this.ws.onclose = () => {
                 this.connected = false;
+                this.segmentPushActive = false;
+                this.segmentWaiters.forEach(wake => wake());
+                this.segmentWaiters = [];
                 this.updateConnectionStatus(false);
                 this.log('🔌 Connection closed', 'error');
                 this.attemptReconnect();
@@ -166,6 +265,17 @@ class SpectrumEmulator {
                 }
                 break;
             
+            case 'segment_subscription':
+                this.segmentPushActive = data.subscribed && data.publishing;
+                if (this.segmentPushActive) {
+                    this.log('📡 Segment push notifications enabled', 'info');
+                }
+                break;
+            
+            case 'segment':
+                this.onSegmentNotification(data);
+                break;
+            
             case 'error':
                 this.log(`❌ Error: ${data.message}`, 'error');
                 break;
@@ -177,7 +287,14 @@ class SpectrumEmulator {
 
     sendMessage(message) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-            this.ws.send(JSON.stringify(message));
+            if (!this.binaryProtocol) {
+                this.ws.send(JSON.stringify(message));
+                return true;
+            }
+            this.outbox.push(message);
+            if (this.outbox.length === 1) {
+                queueMicrotask(() => this.flushOutbox());
+            }
             return true;
         } else {
             this.log('❌ Not connected to server', 'error');
@@ -185,6 +302,15 @@ class SpectrumEmulator {
         }
     }
 
+    flushOutbox() {
+        while (this.outbox.length && this.ws && this.ws.readyState === WebSocket.OPEN) {
+            const batch = this.outbox.splice(0, SpectrumProtocol.MAX_BATCH);
+            this.txSequence = (this.txSequence + 1) & 0xFFFF;
+            this.ws.send(SpectrumProtocol.encodeFrame(batch, this.txSequence));
+        }
+        this.outbox = [];
+    }
+
     setupKeyboard() {
         document.querySelectorAll('.key').forEach(key => {
             key.addEventListener('click', () => {
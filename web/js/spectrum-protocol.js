@@ -0,0 +1,165 @@
+// Binary WebSocket protocol, mirror of server/protocol.py (keep the two in step).
+//
+// Frame:  u8 version, u16 sequence, u8 record count, then count records
+// Record: u8 type code, u16 body length, body (all little-endian)
+// Messages that do not fit a schema travel as JSON records (code 0x7F).
+const SpectrumProtocol = (() => {
+    const BINARY = 'spectrum.v1.bin';
+    const JSON_TEXT = 'spectrum.v1.json';
+    const VERSION = 1;
+    const JSON_RECORD = 0x7F;
+    const MAX_BATCH = 255;
+    const ABSENT_STR = 0xFFFF;
+
+    // Index is the wire code: same list as session_recorder.INPUT_CODES
+    const INPUT_CODES = [
+        '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
+        'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P',
+        'A', 'S', 'D', 'F', 'G', 'H', 'J', 'K', 'L',
+        'Z', 'X', 'C', 'V', 'B', 'N', 'M',
+        'SPACE', 'ENTER', 'SHIFT', 'SYMBOL', 'DELETE',
+        'UP', 'DOWN', 'LEFT', 'RIGHT',
+        'JOY_UP', 'JOY_DOWN', 'JOY_LEFT', 'JOY_RIGHT', 'JOY_FIRE',
+    ];
+
+    const SCHEMA = {
+        0x01: ['hello', []],
+        0x02: ['status', []],
+        0x03: ['start_emulator', []],
+        0x04: ['stop_emulator', []],
+        0x05: ['subscribe_segments', []],
+        0x06: ['unsubscribe_segments', []],
+        0x10: ['key_press', [['key', 'key', null], ['pressed', 'bool', true]]],
+        0x11: ['joystick', [['direction', 'str', null], ['pressed', 'bool', true]]],
+        0x40: ['connected', [['emulator_running', 'bool', null], ['output_resolution', 'str', null]]],
+        0x41: ['emulator_status', [['running', 'bool', null], ['message', 'str', null],
+                                   ['output_resolution', 'str', null]]],
+        0x42: ['segment_subscription', [['subscribed', 'bool', null], ['publishing', 'bool', null]]],
+        0x43: ['segment', [['sequence', 'u32', null], ['duration', 'ms', null], ['url', 'str', null]]],
+    };
+    const CODE_BY_TYPE = {};
+    Object.keys(SCHEMA).forEach(code => { CODE_BY_TYPE[SCHEMA[code][0]] = Number(code); });
+
+    const encoder = new TextEncoder();
+    const decoder = new TextDecoder('utf-8', { fatal: true });
+
+    function jsonRecord(message) {
+        return [JSON_RECORD, encoder.encode(JSON.stringify(message))];
+    }
+
+    function encodeRecord(message) {
+        const code = CODE_BY_TYPE[message.type];
+        if (code === undefined) {
+            return jsonRecord(message);
+        }
+        const fields = SCHEMA[code][1];
+        const names = new Set(fields.map(field => field[0]));
+        if (Object.keys(message).some(name => name !== 'type' && !names.has(name))) {
+            return jsonRecord(message);
+        }
+        const parts = [];
+        for (const [name, kind, fallback] of fields) {
+            const value = message[name] === undefined ? fallback : message[name];
+            if (value === null && kind !== 'str') {
+                return jsonRecord(message);
+            }
+            if (kind === 'bool') {
+                parts.push(Uint8Array.of(value ? 1 : 0));
+            } else if (kind === 'key') {
+                const index = INPUT_CODES.indexOf(String(value).toUpperCase());
+                if (index < 0) {
+                    return jsonRecord(message);
+                }
+                parts.push(Uint8Array.of(index));
+            } else if (kind === 'u32' || kind === 'ms') {
+                const bytes = new Uint8Array(4);
+                new DataView(bytes.buffer).setUint32(0, kind === 'ms' ? Math.round(value * 1000) : value, true);
+                parts.push(bytes);
+            } else {
+                const data = value === null ? new Uint8Array(0) : encoder.encode(String(value));
+                const length = new Uint8Array(2);
+                new DataView(length.buffer).setUint16(0, value === null ? ABSENT_STR : data.length, true);
+                parts.push(length, data);
+            }
+        }
+        return [code, concat(parts)];
+    }
+
+    function concat(parts) {
+        const out = new Uint8Array(parts.reduce((total, part) => total + part.length, 0));
+        let offset = 0;
+        parts.forEach(part => { out.set(part, offset); offset += part.length; });
+        return out;
+    }
+
+    function encodeFrame(messages, sequence) {
+        const parts = [Uint8Array.of(VERSION, sequence & 0xFF, (sequence >> 8) & 0xFF, messages.length)];
+        messages.forEach(message => {
+            const [code, body] = encodeRecord(message);
+            parts.push(Uint8Array.of(code, body.length & 0xFF, body.length >> 8), body);
+        });
+        return concat(parts).buffer;
+    }
+
+    function decodeBody(code, view, start, end) {
+        const [type, fields] = SCHEMA[code];
+        const message = { type };
+        let offset = start;
+        for (const [name, kind, fallback] of fields) {
+            if (offset >= end) {
+                if (fallback !== null) {
+                    message[name] = fallback;
+                }
+                continue;
+            }
+            if (kind === 'bool') {
+                message[name] = view.getUint8(offset) !== 0;
+                offset += 1;
+            } else if (kind === 'key') {
+                message[name] = INPUT_CODES[view.getUint8(offset)];
+                offset += 1;
+            } else if (kind === 'u32' || kind === 'ms') {
+                const value = view.getUint32(offset, true);
+                message[name] = kind === 'ms' ? value / 1000 : value;
+                offset += 4;
+            } else {
+                const length = view.getUint16(offset, true);
+                offset += 2;
+                if (length !== ABSENT_STR) {
+                    message[name] = decoder.decode(new Uint8Array(view.buffer, view.byteOffset + offset, length));
+                    offset += length;
+                }
+            }
+        }
+        return message;
+    }
+
+    // Returns { sequence, messages }; throws on a malformed frame
+    function decodeFrame(buffer) {
+        const view = new DataView(buffer);
+        if (view.getUint8(0) !== VERSION) {
+            throw new Error(`Unsupported protocol version ${view.getUint8(0)}`);
+        }
+        const sequence = view.getUint16(1, true);
+        const count = view.getUint8(3);
+        const messages = [];
+        let offset = 4;
+        for (let i = 0; i < count; i++) {
+            const code = view.getUint8(offset);
+            const length = view.getUint16(offset + 1, true);
+            const start = offset + 3;
+            offset = start + length;
+            if (offset > buffer.byteLength) {
+                throw new Error('Record overruns the frame');
+            }
+            if (code === JSON_RECORD) {
+                messages.push(JSON.parse(decoder.decode(new Uint8Array(buffer, start, length))));
+            } else if (SCHEMA[code]) {
+                messages.push(decodeBody(code, view, start, offset));
+            }
+        }
+        return { sequence, messages };
+    }
+
+    return { BINARY, JSON_TEXT, MAX_BATCH, encodeFrame, decodeFrame };
+})();